@@ -0,0 +1,101 @@
+"""
+Chart aggregates for the tutoring payment manager
+SQL does the grouping (mostly over the rollup tables); the helpers here turn
+the small results into compact column arrays, fill calendar gaps and compute
+rolling averages with NumPy, so a chart's payload doesn't grow with students
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Any, List
+
+# strftime('%w') order
+WEEKDAYS = ('Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+
+# /api/aggregates/<name> -> (manager method, {query parameter: (type, minimum, maximum)})
+ENDPOINTS = {
+    'totals': ('get_balance_totals', {}),
+    'top_balances': ('get_top_balances', {'n': (int, 1, 500)}),
+    'revenue_by_subject': ('get_revenue_by_subject', {'months': (int, 1, 120)}),
+    'revenue_by_weekday': ('get_revenue_by_weekday', {'months': (int, 1, 120)}),
+    'daily_revenue': ('get_daily_revenue', {'days': (int, 1, 3660), 'window': (int, 1, 365),
+                                            'end_date': (date.fromisoformat, None, None)}),
+    'monthly_revenue': ('get_revenue_trend', {'months': (int, 1, 240), 'window': (int, 1, 24)}),
+}
+
+
+def columns(cursor) -> Dict[str, list]:
+    """Column-oriented dict ({column: [values]}) from an executed cursor"""
+    names = [desc[0] for desc in cursor.description]
+    rows = cursor.fetchall()
+    return {name: [row[i] for row in rows] for i, name in enumerate(names)}
+
+
+def months_ago(months: int, today: date = None) -> str:
+    """First day of the month `months - 1` months before today's, so months=1 is this month"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1).isoformat()
+
+
+def rolling_mean(values, window: int) -> list:
+    """Trailing moving average; the first window-1 points average what exists so far"""
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return []
+    sums = np.cumsum(values)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return np.round(sums / counts, 2).tolist()
+
+
+def daily_series(data: Dict[str, list], start: date, end: date,
+                 fields: Dict[str, type]) -> Dict[str, list]:
+    """Spread per-day columns (keyed by data['day']) over every day from start to end.
+
+    fields maps each column to its type (int or float); days without a row are 0.
+    """
+    import numpy as np
+
+    days = (end - start).days + 1
+    offsets = np.array([(date.fromisoformat(day) - start).days for day in data['day']], dtype=int)
+    result = {'day': [(start + timedelta(days=n)).isoformat() for n in range(days)]}
+    for field, kind in fields.items():
+        values = np.zeros(days, dtype=kind)
+        if len(offsets):
+            values[offsets] = data[field]
+        result[field] = (np.round(values, 2) if kind is float else values).tolist()
+    return result
+
+
+def month_labels(first: str, count: int) -> List[str]:
+    """count consecutive "YYYY-MM" labels starting at first (a date or month string)"""
+    index = int(first[:4]) * 12 + int(first[5:7]) - 1
+    return [f"{(index + n) // 12:04d}-{(index + n) % 12 + 1:02d}" for n in range(count)]
+
+
+def parse_params(spec: Dict[str, tuple], params: Dict[str, str]) -> Dict[str, Any]:
+    """Keyword arguments from query parameters, typed and range-checked per spec
+    ({parameter: (type, minimum, maximum)}); absent parameters are left out"""
+    kwargs = {}
+    for param, (kind, low, high) in spec.items():
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for '{param}': {value!r}")
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise ValueError(f"'{param}' must be between {low} and {high}")
+        kwargs[param] = value
+    return kwargs
+
+
+def run(pm, name: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """Call the manager method behind /api/aggregates/<name> with validated query parameters"""
+    if name not in ENDPOINTS:
+        raise LookupError(f"No aggregate named '{name}' (choose from {', '.join(ENDPOINTS)})")
+    method, spec = ENDPOINTS[name]
+    return getattr(pm, method)(**parse_params(spec, params))
@@ -3,45 +3,226 @@ Simple Flask web interface for tutoring payment management
 Run with: python app.py
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Flask, Response, g, render_template, request, redirect, url_for, flash, jsonify,
+                   make_response, send_file, session, stream_with_context)
+from werkzeug.local import LocalProxy
 from payment_manager import TutoringPaymentManager
-import pandas as pd
-from datetime import datetime, date
-import json
+import aggregates
+from datetime import date
+import functools
+import os
+import time
+
+import http_cache
+import jobs
+import scheduling
+import tenants
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this in production
 
-# Initialize payment manager
-pm = TutoringPaymentManager()
+# Initialize payment manager (TUTORING_DB overrides the database file).
+# With TUTORING_TENANTS_DIR set, each tutor has their own database in that
+# folder instead, and pm is the current request's tenant (see select_tenant)
+if os.environ.get('TUTORING_TENANTS_DIR'):
+    router = tenants.TenantRouter(os.environ['TUTORING_TENANTS_DIR'],
+                                  max_open=int(os.environ.get('TUTORING_MAX_OPEN_TENANTS', 32)),
+                                  slow_query_ms=float(os.environ.get('TUTORING_SLOW_QUERY_MS', 250)))
+    pm = LocalProxy(lambda: g.tenant_pm)
+else:
+    router = None
+    pm = TutoringPaymentManager(os.environ.get('TUTORING_DB', 'tutoring_payments.db'),
+                                slow_query_ms=float(os.environ.get('TUTORING_SLOW_QUERY_MS', 250)))
+
+# Endpoints that work without a tenant in multi-tenant mode
+TENANTLESS_ENDPOINTS = {'static', 'metrics', 'api_tenants', 'api_tenant_report'}
+
+# Page sizes for the paginated session/payment listings
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Balances listed on the dashboard and reports page (the full list is an export)
+DASHBOARD_BALANCES = 10
+REPORT_BALANCES = 25
+
+def warm_report_cache(manager):
+    """Re-run the dashboard's and reports page's queries, with the same arguments
+    as those views, renewing their cache entries before they expire"""
+    with manager.cache.refreshing():
+        manager.get_balance_totals()
+        manager.get_student_balance(limit=DASHBOARD_BALANCES, as_records=True)
+        manager.get_monthly_revenue(6, as_records=True)
+        manager.get_student_balance(limit=REPORT_BALANCES, as_records=True)
+        manager.get_students(as_records=True)
+        manager.get_revenue_by_subject(12)
+        manager.get_revenue_by_weekday(12)
+        manager.get_monthly_revenue(12, as_records=True)
+        manager.get_payment_summary(12, as_records=True)
+
+# Background jobs (see jobs.py) run on a few threads in this process, which
+# also keep the report cache warm. TUTORING_JOB_WORKERS=0 leaves them to
+# `python payment_manager.py worker`, as does multi-tenant mode (one worker
+# per tenant database). Scheduled jobs - the package rollover bills students -
+# are left to that worker too, unless TUTORING_JOB_SCHEDULE=1 opts this
+# process in.
+JOB_WORKERS = int(os.environ.get('TUTORING_JOB_WORKERS', 2))
+JOB_SCHEDULE = jobs.flag(os.environ.get('TUTORING_JOB_SCHEDULE', 'no'))
+job_runner = (jobs.JobRunner(pm, workers=JOB_WORKERS, schedule=None if JOB_SCHEDULE else {},
+                             warm=warm_report_cache)
+              if JOB_WORKERS and router is None else None)
+
+def page_args():
+    """Read limit/cursor query parameters, clamping the page size"""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return limit, request.args.get('cursor') or None
+
+def session_filters():
+    """Read session filters from the query string"""
+    return {
+        'student_id': request.args.get('student_id', type=int),
+        'start_date': request.args.get('start_date') or None,
+        'end_date': request.args.get('end_date') or None,
+        'status': request.args.get('status') or None,
+    }
+
+def payment_filters():
+    """Read payment filters from the query string"""
+    return {
+        'student_id': request.args.get('student_id', type=int),
+        'start_date': request.args.get('start_date') or None,
+        'end_date': request.args.get('end_date') or None,
+        'payment_method': request.args.get('payment_method') or None,
+    }
+
+# Part of every ETag, so deploying new code or templates never serves a stale 304
+RELEASE = http_cache.release_tag(os.path.dirname(os.path.abspath(__file__)))
+
+def versioned(*tables):
+    """Make a GET view conditional on the data versions of the tables it reads.
+    
+    A request whose If-None-Match (or If-Modified-Since) is still current gets
+    a 304 before the view and its queries run; otherwise the response carries
+    ETag and Last-Modified. Clients are asked to revalidate every time.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message makes the page a one-off
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+            version, modified = pm.data_version(*tables)
+            # Tenants' data versions count independently, so the tenant is part of the tag
+            resource = f"{g.tenant}:{request.full_path}" if router else request.full_path
+            etag = http_cache.make_etag(RELEASE, resource, version)
+            if http_cache.is_fresh(request.headers.get('If-None-Match'),
+                                   request.headers.get('If-Modified-Since'), etag, modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or session.get('_flashes'):
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = modified
+            response.cache_control.no_cache = True
+            if router:
+                response.vary.update(('X-Tenant', 'Cookie'))
+            return response
+        return wrapper
+    return decorator
+
+@app.before_request
+def start_timer():
+    """Note when the request started, for the route latency histograms"""
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_job_runner():
+    """Start the job threads with the first request rather than at import, so
+    the debug reloader's watcher process doesn't run jobs as well"""
+    if job_runner is not None:
+        job_runner.start()
+
+@app.before_request
+def select_tenant():
+    """In multi-tenant mode, lease the manager of the tenant named by the
+    X-Tenant header, a ?tenant= parameter (remembered for later pages) or the session"""
+    if router is None or request.endpoint in TENANTLESS_ENDPOINTS:
+        return None
+    tenant = request.headers.get('X-Tenant') or request.args.get('tenant') or session.get('tenant')
+    if not tenant:
+        return jsonify({'error': 'No tenant selected (send X-Tenant or ?tenant=)'}), 400
+    try:
+        g.tenant_pm = router.acquire(tenant)
+    except tenants.UnknownTenant as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    g.tenant = tenant
+    if request.args.get('tenant'):
+        session['tenant'] = tenant
+    return None
+
+@app.teardown_request
+def release_tenant(error=None):
+    """Return the request's tenant lease (after any streamed body has finished)"""
+    if 'tenant_pm' in g:
+        router.release(g.pop('tenant'))
+        g.pop('tenant_pm')
+
+@app.after_request
+def record_timing(response):
+    """Record route latency (streamed bodies are timed up to the first byte)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics = router.metrics if router else pm.metrics
+        metrics.record_request(endpoint, request.method, response.status_code,
+                               time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress large text bodies with br or gzip when the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if not http_cache.should_compress(response.content_type, len(body)):
+        return response
+    encoding = http_cache.choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        response.set_data(http_cache.compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
 
 @app.route('/')
+@versioned('students', 'sessions', 'payments', 'monthly_packages')
 def dashboard():
     """Main dashboard showing overview"""
     try:
-        # Get key metrics
-        balance_df = pm.get_student_balance()
-        revenue_df = pm.get_monthly_revenue(6)
+        # Get key metrics (totals come from SQL; only the largest balances are listed)
+        totals = pm.get_balance_totals()
+        balances = pm.get_student_balance(limit=DASHBOARD_BALANCES, as_records=True)
+        revenue = pm.get_monthly_revenue(6, as_records=True)
         
-        total_outstanding = balance_df['balance_due'].sum()
-        total_students = len(balance_df)
-        current_month_revenue = revenue_df.iloc[0]['revenue'] if not revenue_df.empty else 0
+        current_month_revenue = revenue[0].revenue if revenue else 0
         
         return render_template('dashboard.html', 
-                             total_outstanding=total_outstanding,
-                             total_students=total_students,
+                             total_outstanding=totals['total_outstanding'],
+                             total_students=totals['students'],
                              current_month_revenue=current_month_revenue,
-                             balance_df=balance_df,
-                             revenue_df=revenue_df)
+                             balances=balances,
+                             revenue=revenue)
     except Exception as e:
         flash(f'Error loading dashboard: {str(e)}', 'error')
         return render_template('dashboard.html')
 
 @app.route('/students')
+@versioned('students')
 def students():
     """Student management page"""
-    students_df = pm.get_students()
-    return render_template('students.html', students=students_df)
+    return render_template('students.html', students=pm.get_students(as_records=True))
 
 @app.route('/add_student', methods=['GET', 'POST'])
 def add_student():
@@ -73,9 +254,19 @@ def add_student():
 
 @app.route('/sessions')
 def sessions():
-    """Session management page"""
-    sessions_df = pm.get_sessions()
-    return render_template('sessions.html', sessions=sessions_df)
+    """Session management page, one keyset-paginated page at a time"""
+    limit, cursor = page_args()
+    filters = session_filters()
+    try:
+        sessions, next_cursor = pm.get_sessions_page(limit, cursor, as_records=True, **filters)
+    except ValueError as e:
+        flash(f'Error: {str(e)}', 'error')
+        return redirect(url_for('sessions'))
+    
+    return render_template('sessions.html', sessions=sessions,
+                         students=pm.get_students(as_records=True), filters=filters,
+                         filter_args={k: v for k, v in filters.items() if v},
+                         limit=limit, cursor=cursor, next_cursor=next_cursor)
 
 @app.route('/add_session', methods=['GET', 'POST'])
 def add_session():
@@ -86,14 +277,15 @@ def add_session():
             session_date = request.form['session_date']
             start_time = request.form['start_time']
             end_time = request.form['end_time']
-            duration_hours = float(request.form['duration_hours'])
+            duration_hours = float(request.form['duration_hours']) if request.form.get('duration_hours') else None
             subject = request.form['subject']
             session_cost = float(request.form['session_cost'])
             notes = request.form.get('notes') or None
             
             session_id = pm.add_session(student_id, session_date, start_time, 
                                       end_time, duration_hours, subject, 
-                                      session_cost, notes)
+                                      session_cost, notes,
+                                      allow_conflicts=bool(request.form.get('allow_conflicts')))
             
             flash(f'Session added successfully!', 'success')
                 
@@ -102,8 +294,7 @@ def add_session():
         
         return redirect(url_for('sessions'))
     
-    students_df = pm.get_students()
-    return render_template('add_session.html', students=students_df)
+    return render_template('add_session.html', students=pm.get_students(as_records=True))
 
 @app.route('/update_session_status/<int:session_id>/<status>')
 def update_session_status(session_id, status):
@@ -116,11 +307,43 @@ def update_session_status(session_id, status):
     
     return redirect(url_for('sessions'))
 
+@app.route('/sessions/status', methods=['POST'])
+def update_session_statuses():
+    """Update the checked sessions, or every matching session in a range, in one go"""
+    status = request.form.get('new_status')
+    student_id = request.form.get('student_id', type=int)
+    start_date = request.form.get('start_date') or None
+    end_date = request.form.get('end_date') or None
+    try:
+        if request.form.get('scope') == 'range':
+            updated = pm.update_sessions_in_range(status, student_id, start_date, end_date)
+            flash(f'{updated} scheduled sessions marked {status}', 'success')
+        else:
+            updated = pm.update_session_statuses(request.form.getlist('session_ids'), status)
+            flash(f'{updated} sessions marked {status}', 'success')
+    except ValueError as e:
+        flash(f'Error: {str(e)}', 'error')
+    
+    # Back to the same filtered listing
+    filters = {'student_id': student_id, 'start_date': start_date, 'end_date': end_date,
+               'status': request.form.get('status') or None}
+    return redirect(url_for('sessions', **{k: v for k, v in filters.items() if v}))
+
 @app.route('/payments')
 def payments():
-    """Payment management page"""
-    payments_df = pm.get_payments()
-    return render_template('payments.html', payments=payments_df)
+    """Payment management page, one keyset-paginated page at a time"""
+    limit, cursor = page_args()
+    filters = payment_filters()
+    try:
+        payments, next_cursor = pm.get_payments_page(limit, cursor, as_records=True, **filters)
+    except ValueError as e:
+        flash(f'Error: {str(e)}', 'error')
+        return redirect(url_for('payments'))
+    
+    return render_template('payments.html', payments=payments,
+                         students=pm.get_students(as_records=True), filters=filters,
+                         filter_args={k: v for k, v in filters.items() if v},
+                         limit=limit, cursor=cursor, next_cursor=next_cursor)
 
 @app.route('/add_payment', methods=['GET', 'POST'])
 def add_payment():
@@ -144,47 +367,329 @@ def add_payment():
         
         return redirect(url_for('payments'))
     
-    students_df = pm.get_students()
-    return render_template('add_payment.html', students=students_df)
+    return render_template('add_payment.html', students=pm.get_students(as_records=True))
 
 @app.route('/reports')
+@versioned('students', 'sessions', 'payments', 'monthly_packages')
 def reports():
     """Reports page"""
-    balance_df = pm.get_student_balance()
-    revenue_df = pm.get_monthly_revenue(12)
-    payment_summary_df = pm.get_payment_summary(12)
-    
     return render_template('reports.html', 
-                         balance_df=balance_df,
-                         revenue_df=revenue_df,
-                         payment_summary_df=payment_summary_df)
+                         totals=pm.get_balance_totals(),
+                         balances=pm.get_student_balance(limit=REPORT_BALANCES, as_records=True),
+                         students=pm.get_students(as_records=True),
+                         by_subject=pm.get_revenue_by_subject(12),
+                         by_weekday=pm.get_revenue_by_weekday(12),
+                         revenue=pm.get_monthly_revenue(12, as_records=True),
+                         payment_summary=pm.get_payment_summary(12, as_records=True))
+
+@app.route('/packages/rollover', methods=['POST'])
+def roll_over_packages():
+    """Month-end package rollover (settle paid-up packages, open the month's packages)"""
+    month_year = request.form.get('month_year') or None
+    try:
+        result = pm.roll_over_packages(month_year)
+        flash(f"{result['created']} packages created, {result['settled']} marked paid", 'success')
+    except ValueError as e:
+        flash(f'Error: {str(e)}', 'error')
+    return redirect(url_for('reports'))
 
 @app.route('/invoice/<int:student_id>/<month_year>')
 def generate_invoice(student_id, month_year):
-    """Generate invoice for student"""
+    """Queue an invoice job for a student and month, then show its progress page.
+    
+    Without job threads in this process (tenant mode, or no workers) nothing
+    would pick the job up, so the invoice is built here instead.
+    """
+    params = {'student_id': student_id, 'month_year': month_year}
     try:
-        invoice_data = pm.generate_invoice_data(student_id, month_year)
-        if invoice_data:
-            return render_template('invoice.html', invoice=invoice_data)
-        else:
-            flash('Student not found or no data for this period', 'error')
-            return redirect(url_for('reports'))
-    except Exception as e:
+        if job_runner is None:
+            invoice = jobs.run_invoice(pm, **jobs.check_params('invoice', params))
+            return render_template('invoice.html', job=None, invoice=invoice)
+        # Reloading the page (or submitting twice) rejoins the job already under way
+        job_id = pm.enqueue_job('invoice', params, reuse=True)
+    except (ValueError, LookupError) as e:
         flash(f'Error generating invoice: {str(e)}', 'error')
         return redirect(url_for('reports'))
+    job_runner.notify()
+    return redirect(url_for('invoice_job', job_id=job_id))
+
+@app.route('/invoice/job/<int:job_id>')
+def invoice_job(job_id):
+    """Show a queued invoice job's invoice once done (the page reloads until then)"""
+    job = pm.get_job(job_id, include_result=True)
+    if job is None or job['kind'] != 'invoice':
+        flash(f'No invoice job with id {job_id}', 'error')
+        return redirect(url_for('reports'))
+    if job['status'] == 'failed':
+        flash(f"Error generating invoice: {job['error']}", 'error')
+        return redirect(url_for('reports'))
+    return render_template('invoice.html', job=job, invoice=job.get('result'))
+
+@app.route('/api/invoices/<month_year>')
+def api_invoices(month_year):
+    """API endpoint to get every student's invoice data for a month
+    (?background=1 queues it as a job instead; poll the returned URL)"""
+    try:
+        if request.args.get('background'):
+            return job_accepted(pm.enqueue_job('invoices', {'month_year': month_year, 'write': False}))
+        invoices = pm.generate_invoices(month_year)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(list(invoices.values()))
+
+@app.route('/export/<table_name>')
+def export_table(table_name):
+    """Stream a table or report as a CSV/JSONL download (?format=&start_date=&end_date=).
+    With ?background=1 the export is written by a job (Parquet too) for download later."""
+    file_format = request.args.get('format', 'csv')
+    try:
+        if request.args.get('background'):
+            return job_accepted(pm.enqueue_job('export', {
+                'table': table_name, 'format': file_format,
+                'start_date': request.args.get('start_date'), 'end_date': request.args.get('end_date'),
+            }))
+        chunks = pm.iter_export(table_name, file_format,
+                                start_date=request.args.get('start_date') or None,
+                                end_date=request.args.get('end_date') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={table_name}.{file_format}'
+    })
+
+def job_accepted(job_id):
+    """202 response pointing at a queued job's status URL"""
+    if job_runner is not None:
+        job_runner.notify()
+    url = url_for('api_job', job_id=job_id)
+    return jsonify({'id': job_id, 'status': 'queued', 'url': url}), 202, {'Location': url}
+
+@app.route('/api/jobs', methods=['GET', 'POST'])
+def api_jobs():
+    """List recent background jobs (?status=&kind=&limit=), or queue one
+    (POST {"kind": ..., "params": {...}}, or form fields)"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True)
+            if data is None:
+                data = request.form.to_dict()
+                data = {'kind': data.pop('kind', None), 'params': data}
+            return job_accepted(pm.enqueue_job(data.get('kind'), data.get('params')))
+        limit = max(1, min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE))
+        return jsonify(pm.get_jobs(status=request.args.get('status') or None,
+                                   kind=request.args.get('kind') or None, limit=limit))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    """API endpoint to poll a background job; includes the result once it is done"""
+    job = pm.get_job(job_id, include_result=True)
+    if job is None:
+        return jsonify({'error': f'No job with id {job_id}'}), 404
+    if job['kind'] == 'export' and job['status'] == 'done':
+        job['download_url'] = url_for('download_job_file', job_id=job_id)
+    return jsonify(job)
+
+@app.route('/api/jobs/<int:job_id>/download')
+def download_job_file(job_id):
+    """Download the file written by a finished export job"""
+    job = pm.get_job(job_id, include_result=True)
+    if (job is None or job['kind'] != 'export' or job['status'] != 'done'
+            or not os.path.exists(job['result']['path'])):
+        return jsonify({'error': f'No finished export for job {job_id}'}), 404
+    return send_file(os.path.abspath(job['result']['path']), as_attachment=True)
 
 # API endpoints for AJAX calls
 @app.route('/api/students')
+@versioned('students')
 def api_students():
     """API endpoint to get students as JSON"""
-    students_df = pm.get_students()
-    return jsonify(students_df.to_dict('records'))
+    students = pm.get_students(as_records=True)
+    return jsonify([s.as_dict() for s in students])
 
 @app.route('/api/student_balance')
+@versioned('students', 'sessions', 'payments', 'monthly_packages')
 def api_student_balance():
     """API endpoint to get student balances"""
-    balance_df = pm.get_student_balance()
-    return jsonify(balance_df.to_dict('records'))
+    balances = pm.get_student_balance(as_records=True)
+    return jsonify([b.as_dict() for b in balances])
+
+@app.route('/api/search')
+@versioned('students', 'sessions', 'payments')
+def api_search():
+    """API endpoint for full-text search (?q=&kind=&student_id=&limit=)"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+    try:
+        results = pm.search(request.args.get('q', ''), kind=request.args.get('kind') or None,
+                            student_id=request.args.get('student_id', type=int),
+                            limit=limit, as_records=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify([r.as_dict() for r in results])
+
+@app.route('/api/aggregates/<name>')
+@versioned('students', 'sessions', 'payments', 'monthly_packages')
+def api_aggregates(name):
+    """API endpoint for dashboard chart data as compact column arrays (see aggregates.ENDPOINTS)"""
+    try:
+        return jsonify(aggregates.run(pm, name, request.args))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/analytics/<name>')
+def api_analytics(name):
+    """API endpoint for long-range reports from the Parquet snapshot (see snapshots.REPORTS)"""
+    try:
+        return jsonify(pm.snapshot_report(name, **request.args.to_dict()))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/packages')
+@versioned('monthly_packages', 'sessions', 'students')
+def api_packages():
+    """API endpoint for monthly packages (?month=&student_id=&unpaid=1)"""
+    try:
+        packages = pm.get_packages(request.args.get('month') or None,
+                                   request.args.get('student_id', type=int),
+                                   unpaid_only=request.args.get('unpaid') == '1', as_records=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify([p.as_dict() for p in packages])
+
+@app.route('/api/sessions')
+@versioned('sessions', 'students')
+def api_sessions():
+    """API endpoint to page through sessions (?limit=&cursor= plus filters)"""
+    limit, cursor = page_args()
+    try:
+        sessions, next_cursor = pm.get_sessions_page(limit, cursor, as_records=True,
+                                                     **session_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': [s.as_dict() for s in sessions], 'next_cursor': next_cursor})
+
+@app.route('/api/sessions/status', methods=['POST'])
+def api_update_session_statuses():
+    """Batch status update: {"status", "ids": [...]} or {"status", "student_id", "start_date",
+    "end_date"} (a range's status defaults to Completed)"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    status = body.get('status')
+    try:
+        if 'ids' in body:
+            if not isinstance(body['ids'], list):
+                raise ValueError("'ids' must be a list of session ids")
+            updated = pm.update_session_statuses(body['ids'], status)
+        else:
+            # Like update_sessions_in_range, a range defaults to Scheduled -> Completed
+            status = status or 'Completed'
+            updated = pm.update_sessions_in_range(
+                status, body.get('student_id'), body.get('start_date'), body.get('end_date'),
+                body.get('from_status', 'Scheduled'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': status, 'updated': updated})
+
+@app.route('/api/sessions/recurring', methods=['POST'])
+def api_add_recurring_sessions():
+    """Book a weekly session for a term: {"student_id", "start_date", "end_date", "start_time",
+    "end_time", "subject", "session_cost", "weekdays", "every_weeks", "notes", "skip_conflicts"}"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    try:
+        weekdays = body.get('weekdays')
+        if weekdays is not None and not isinstance(weekdays, list):
+            raise ValueError("'weekdays' must be a list of numbers (0 = Monday)")
+        result = pm.add_recurring_sessions(
+            int(body['student_id']), body['start_date'], body['end_date'], body['start_time'],
+            body['end_time'], body['subject'], float(body['session_cost']), weekdays,
+            int(body.get('every_weeks', 1)), body.get('notes'), bool(body.get('skip_conflicts')))
+    except scheduling.ScheduleConflict as e:
+        return jsonify({'error': str(e), 'conflicts': e.conflicts}), 409
+    except KeyError as e:
+        return jsonify({'error': f'Missing field: {e.args[0]}'}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result), 201
+
+@app.route('/api/available_slots')
+@versioned('sessions')
+def api_available_slots():
+    """API endpoint for free slots (?start_date=&end_date=&length=hours&day_start=&day_end=)"""
+    start_date = request.args.get('start_date') or date.today().isoformat()
+    try:
+        slots = pm.available_slots(start_date, request.args.get('end_date') or start_date,
+                                   request.args.get('length', 1.0, type=float),
+                                   request.args.get('day_start') or scheduling.DAY_START,
+                                   request.args.get('day_end') or scheduling.DAY_END)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(slots)
+
+@app.route('/api/payments')
+@versioned('payments', 'students')
+def api_payments():
+    """API endpoint to page through payments (?limit=&cursor= plus filters)"""
+    limit, cursor = page_args()
+    try:
+        payments, next_cursor = pm.get_payments_page(limit, cursor, as_records=True,
+                                                     **payment_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': [p.as_dict() for p in payments], 'next_cursor': next_cursor})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: query, route, pool and cache metrics"""
+    if router:
+        # Queries and routes across all tenants, plus the router's open-manager counts
+        text = router.metrics.prometheus({'tenants': router.stats()})
+    else:
+        text = pm.prometheus_metrics()
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/tenants')
+def api_tenants():
+    """API endpoint listing tenants and the router's open managers (multi-tenant mode)"""
+    if router is None:
+        return jsonify({'error': 'Not running in multi-tenant mode'}), 404
+    return jsonify({'tenants': router.tenants(), 'router': router.stats()})
+
+@app.route('/api/tenants/<source>/<name>')
+def api_tenant_report(source, name):
+    """Run an aggregates or analytics report for every tenant (?tenants=a,b to pick some)"""
+    if router is None:
+        return jsonify({'error': 'Not running in multi-tenant mode'}), 404
+    params = request.args.to_dict()
+    selected = params.pop('tenants', None)
+    try:
+        return jsonify(router.report_all(source, name, params,
+                                         selected.split(',') if selected else None))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/query_stats')
+def api_query_stats():
+    """API endpoint to get per-statement timings and the recent slow-query log"""
+    return jsonify({'queries': pm.query_stats(), 'slow_queries': pm.metrics.slow_queries()})
+
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    """API endpoint to get result cache and connection pool statistics"""
+    return jsonify({'cache': pm.cache_stats(), 'pool': pm.pool_stats(), 'writes': pm.write_stats()})
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,487 @@
+"""
+Asyncio (ASGI) serving mode for the /api/* endpoints
+Reads run on a bounded thread pool of read-only connections, writes are
+serialized through the manager's single group-commit writer, and both are
+capped so overload turns into quick 503s instead of piled-up threads.
+Run with: python async_api.py [--port 8000]  (needs uvicorn: pip install uvicorn)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, Any, Tuple
+from urllib.parse import parse_qs
+
+import aggregates
+import billing
+import http_cache
+import scheduling
+from payment_manager import TutoringPaymentManager
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Allowed students.package_type values (the schema's CHECK constraint)
+PACKAGE_TYPES = ('Individual',) + tuple(billing.PACKAGE_PLANS)
+
+
+class Overloaded(Exception):
+    """Raised when a request can't get a read slot or write queue space in time"""
+
+
+class BadRequest(ValueError):
+    """Raised for malformed input; reported to the client as a 400"""
+
+
+def _int(params: Dict[str, str], name: str, default: int = None) -> int:
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' must be an integer")
+
+
+def _page(params: Dict[str, str]) -> Tuple[int, str]:
+    limit = max(1, min(_int(params, 'limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    return limit, params.get('cursor') or None
+
+
+def _filters(params: Dict[str, str], *names: str) -> Dict[str, Any]:
+    filters = {'student_id': _int(params, 'student_id')}
+    for name in names:
+        filters[name] = params.get(name) or None
+    return filters
+
+
+def _field(body: Dict[str, Any], name: str, kind=str, required: bool = True):
+    value = body.get(name)
+    if value in (None, ''):
+        if required:
+            raise BadRequest(f"missing required field '{name}'")
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"'{name}' must be a {kind.__name__}")
+
+
+class AsyncAPI:
+    def __init__(self, pm: TutoringPaymentManager, read_workers: int = 8,
+                 max_pending_reads: int = 512, max_pending_writes: int = 1000,
+                 queue_timeout: float = 5.0):
+        """ASGI application serving pm's API; reads use read_workers threads"""
+        self.pm = pm
+        self.reader = pm.read_only_copy(pool_size=read_workers)
+        self.read_workers = read_workers
+        self.max_pending_reads = max_pending_reads
+        self.max_pending_writes = max_pending_writes
+        self.queue_timeout = queue_timeout
+        # Part of every ETag, so deploying new code never serves a stale 304
+        self.release = http_cache.release_tag(os.path.dirname(os.path.abspath(__file__)))
+
+        # Executors and limits are bound to the serving event loop in startup()
+        self._read_executor = None
+        self._write_executor = None
+        self._read_slots = None
+        self._pending_writes = 0
+        self._started = False
+        self._stats = {'reads': 0, 'writes': 0, 'rejected_reads': 0, 'rejected_writes': 0}
+
+        # (method, path pattern, handler, is_write, tables whose data version makes
+        # the response conditional - see _conditional())
+        everything = ('students', 'sessions', 'payments')
+        # Balances and invoices also depend on the students' monthly packages
+        billed = everything + ('monthly_packages',)
+        self.routes = [
+            ('GET', r'/api/students', self.list_students, False, ('students',)),
+            ('GET', r'/api/student_balance', self.student_balance, False, billed),
+            ('GET', r'/api/student_balance/(?P<student_id>\d+)', self.student_balance, False, billed),
+            ('GET', r'/api/sessions', self.list_sessions, False, ('sessions', 'students')),
+            ('GET', r'/api/payments', self.list_payments, False, ('payments', 'students')),
+            ('GET', r'/api/packages', self.list_packages, False, ('monthly_packages', 'sessions', 'students')),
+            ('GET', r'/api/invoices/(?P<month_year>[\d-]+)', self.invoices, False, billed),
+            ('GET', r'/api/search', self.search, False, everything),
+            ('GET', r'/api/aggregates/(?P<name>\w+)', self.aggregate, False, billed),
+            ('GET', r'/api/available_slots', self.available_slots, False, ('sessions',)),
+            # Served from the snapshot files, which change on sync rather than on writes
+            ('GET', r'/api/analytics/(?P<name>\w+)', self.analytics, False, None),
+            ('GET', r'/api/jobs', self.list_jobs, False, None),
+            ('GET', r'/api/jobs/(?P<job_id>\d+)', self.job, False, None),
+            ('GET', r'/api/cache_stats', self.cache_stats, False, None),
+            ('GET', r'/api/query_stats', self.query_stats, False, None),
+            ('GET', r'/metrics', self.metrics, False, None),
+            ('POST', r'/api/students', self.add_student, True, None),
+            ('POST', r'/api/sessions', self.add_session, True, None),
+            ('POST', r'/api/sessions/recurring', self.add_recurring_sessions, True, None),
+            ('POST', r'/api/payments', self.add_payment, True, None),
+            ('POST', r'/api/sessions/status', self.update_session_statuses, True, None),
+            ('POST', r'/api/packages/rollover', self.roll_over_packages, True, None),
+            ('POST', r'/api/jobs', self.enqueue_job, True, None),
+            ('POST', r'/api/sessions/(?P<session_id>\d+)/status', self.update_session_status, True, None),
+        ]
+        self.routes = [(method, re.compile(pattern + '$'), handler, is_write, tables)
+                       for method, pattern, handler, is_write, tables in self.routes]
+
+    # Lifecycle
+
+    async def startup(self):
+        """Create the executors and backpressure limits"""
+        self._read_executor = ThreadPoolExecutor(self.read_workers, thread_name_prefix='api-read')
+        # With group commit these threads only wait on the manager's single writer,
+        # and enough of them keeps its batches full; without it, writes run one at a time
+        write_workers = min(32, self.pm.writes.max_batch) if self.pm.writes is not None else 1
+        self._write_executor = ThreadPoolExecutor(write_workers, thread_name_prefix='api-write')
+        self._read_slots = asyncio.Semaphore(self.max_pending_reads)
+        self._started = True
+
+    async def shutdown(self):
+        """Finish in-flight writes, then stop the executors and close connections"""
+        self._started = False
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        self.reader.close()
+        self.pm.close()
+
+    async def read(self, call):
+        """Run a blocking read on the read pool, waiting at most queue_timeout for a slot"""
+        try:
+            await asyncio.wait_for(self._read_slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats['rejected_reads'] += 1
+            raise Overloaded("Too many concurrent reads")
+        try:
+            self._stats['reads'] += 1
+            return await asyncio.get_running_loop().run_in_executor(self._read_executor, call)
+        finally:
+            self._read_slots.release()
+
+    async def write(self, call):
+        """Run a blocking write on the write threads, rejecting it if too many are pending"""
+        if self._pending_writes >= self.max_pending_writes:
+            self._stats['rejected_writes'] += 1
+            raise Overloaded("Write queue is full")
+        self._pending_writes += 1
+        self._stats['writes'] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._write_executor, call)
+        finally:
+            self._pending_writes -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Serving counters, including current queue depths"""
+        return dict(self._stats, pending_writes=self._pending_writes)
+
+    # Read handlers (run on the read pool)
+
+    def list_students(self, params, body):
+        return 200, [s.as_dict() for s in self.reader.get_students(as_records=True)]
+
+    def student_balance(self, params, body, student_id=None):
+        balances = self.reader.get_student_balance(
+            int(student_id) if student_id else None, as_records=True)
+        return 200, [b.as_dict() for b in balances]
+
+    def list_sessions(self, params, body):
+        limit, cursor = _page(params)
+        sessions, next_cursor = self.reader.get_sessions_page(
+            limit, cursor, as_records=True, **_filters(params, 'start_date', 'end_date', 'status'))
+        return 200, {'items': [s.as_dict() for s in sessions], 'next_cursor': next_cursor}
+
+    def list_payments(self, params, body):
+        limit, cursor = _page(params)
+        payments, next_cursor = self.reader.get_payments_page(
+            limit, cursor, as_records=True,
+            **_filters(params, 'start_date', 'end_date', 'payment_method'))
+        return 200, {'items': [p.as_dict() for p in payments], 'next_cursor': next_cursor}
+
+    def list_packages(self, params, body):
+        packages = self.reader.get_packages(params.get('month') or None, _int(params, 'student_id'),
+                                            unpaid_only=params.get('unpaid') == '1', as_records=True)
+        return 200, [p.as_dict() for p in packages]
+
+    def invoices(self, params, body, month_year):
+        return 200, list(self.reader.generate_invoices(month_year).values())
+
+    def search(self, params, body):
+        limit = max(1, min(_int(params, 'limit', 20), MAX_PAGE_SIZE))
+        results = self.reader.search(params.get('q', ''), kind=params.get('kind') or None,
+                                     student_id=_int(params, 'student_id'), limit=limit,
+                                     as_records=True)
+        return 200, [r.as_dict() for r in results]
+
+    def aggregate(self, params, body, name):
+        try:
+            return 200, aggregates.run(self.reader, name, params)
+        except LookupError as e:
+            return 404, {'error': str(e)}
+
+    def analytics(self, params, body, name):
+        try:
+            return 200, self.reader.snapshot_report(name, **params)
+        except LookupError as e:
+            return 404, {'error': str(e)}
+
+    def available_slots(self, params, body):
+        start_date = params.get('start_date') or date.today().isoformat()
+        try:
+            length = float(params.get('length') or 1.0)
+        except ValueError:
+            raise BadRequest("'length' must be a number of hours")
+        return 200, self.reader.available_slots(start_date, params.get('end_date') or start_date, length,
+                                                params.get('day_start') or scheduling.DAY_START,
+                                                params.get('day_end') or scheduling.DAY_END)
+
+    def list_jobs(self, params, body):
+        limit = max(1, min(_int(params, 'limit', 50), MAX_PAGE_SIZE))
+        return 200, self.reader.get_jobs(status=params.get('status') or None,
+                                         kind=params.get('kind') or None, limit=limit)
+
+    def job(self, params, body, job_id):
+        job = self.reader.get_job(int(job_id), include_result=True)
+        if job is None:
+            return 404, {'error': f"No job with id {job_id}"}
+        return 200, job
+
+    def cache_stats(self, params, body):
+        return 200, {'cache': self.pm.cache_stats(), 'pool': self.pm.pool_stats(),
+                     'read_pool': self.reader.pool_stats(), 'writes': self.pm.write_stats(),
+                     'server': self.stats()}
+
+    def query_stats(self, params, body):
+        return 200, {'queries': self.pm.query_stats(), 'slow_queries': self.pm.metrics.slow_queries()}
+
+    def metrics(self, params, body):
+        return 200, self.pm.metrics.prometheus({
+            'pool': self.pm.pool_stats(), 'read_pool': self.reader.pool_stats(),
+            'cache': self.pm.cache_stats(), 'writes': self.pm.write_stats(),
+            'server': self.stats(),
+        })
+
+    # Write handlers (run on the writer thread)
+
+    def add_student(self, params, body):
+        package_type = _field(body, 'package_type', required=False) or 'Individual'
+        if package_type not in PACKAGE_TYPES:
+            raise BadRequest(f"'package_type' must be one of {', '.join(PACKAGE_TYPES)}")
+        student_id = self.pm.add_student(
+            _field(body, 'name'), _field(body, 'email'),
+            _field(body, 'phone', required=False), _field(body, 'parent_name', required=False),
+            _field(body, 'parent_email', required=False), package_type,
+            _field(body, 'hourly_rate', float, required=False) or 50.00)
+        if student_id is None:
+            return 409, {'error': 'A student with this email already exists'}
+        return 201, {'id': student_id}
+
+    def add_session(self, params, body):
+        try:
+            session_id = self.pm.add_session(
+                _field(body, 'student_id', int), _field(body, 'session_date'),
+                _field(body, 'start_time'), _field(body, 'end_time'),
+                _field(body, 'duration_hours', float, required=False), _field(body, 'subject'),
+                _field(body, 'session_cost', float), _field(body, 'notes', required=False),
+                allow_conflicts=bool(body.get('allow_conflicts')))
+        except scheduling.ScheduleConflict as e:
+            return 409, {'error': str(e), 'conflicts': e.conflicts}
+        return 201, {'id': session_id}
+
+    def add_recurring_sessions(self, params, body):
+        weekdays = body.get('weekdays')
+        if weekdays is not None and not isinstance(weekdays, list):
+            raise BadRequest("'weekdays' must be a list of numbers (0 = Monday)")
+        try:
+            result = self.pm.add_recurring_sessions(
+                _field(body, 'student_id', int), _field(body, 'start_date'), _field(body, 'end_date'),
+                _field(body, 'start_time'), _field(body, 'end_time'), _field(body, 'subject'),
+                _field(body, 'session_cost', float), weekdays,
+                _field(body, 'every_weeks', int, required=False) or 1,
+                _field(body, 'notes', required=False), bool(body.get('skip_conflicts')))
+        except scheduling.ScheduleConflict as e:
+            return 409, {'error': str(e), 'conflicts': e.conflicts}
+        return 201, result
+
+    def add_payment(self, params, body):
+        payment_id = self.pm.add_payment(
+            _field(body, 'student_id', int), _field(body, 'amount', float),
+            _field(body, 'payment_method'), _field(body, 'payment_date', required=False),
+            _field(body, 'reference_number', required=False), _field(body, 'notes', required=False))
+        return 201, {'id': payment_id}
+
+    def update_session_status(self, params, body, session_id):
+        status = _field(body, 'status')
+        self.pm.update_session_status(int(session_id), status)
+        return 200, {'id': int(session_id), 'status': status}
+
+    def update_session_statuses(self, params, body):
+        if 'ids' in body:
+            status = _field(body, 'status')
+            if not isinstance(body['ids'], list):
+                raise BadRequest("'ids' must be a list of session ids")
+            updated = self.pm.update_session_statuses(body['ids'], status)
+        else:
+            status = _field(body, 'status', required=False) or 'Completed'
+            updated = self.pm.update_sessions_in_range(
+                status, _field(body, 'student_id', int, required=False),
+                _field(body, 'start_date', required=False), _field(body, 'end_date', required=False),
+                _field(body, 'from_status', required=False) or 'Scheduled')
+        return 200, {'status': status, 'updated': updated}
+
+    def roll_over_packages(self, params, body):
+        return 200, self.pm.roll_over_packages(_field(body, 'month', required=False))
+
+    def enqueue_job(self, params, body):
+        # Run by a `python payment_manager.py worker` process; poll /api/jobs/<id>
+        try:
+            job_id = self.pm.enqueue_job(_field(body, 'kind'), body.get('params') or {})
+        except LookupError as e:
+            return 404, {'error': str(e)}
+        return 202, {'id': job_id, 'status': 'queued', 'url': f"/api/jobs/{job_id}"}
+
+    # ASGI plumbing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if not self._started:
+            # Servers without lifespan support: start on the first request
+            await self.startup()
+
+        request_headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                           for name, value in scope.get('headers', [])}
+        status, payload, headers = await self._dispatch(scope, receive, request_headers)
+        if status == 304:
+            body, content_type = b'', None
+        elif isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload, default=str).encode(), 'application/json'
+        if content_type:
+            headers.append((b'content-type', content_type.encode()))
+        if status == 200:
+            headers.append((b'vary', b'Accept-Encoding'))
+            encoding = http_cache.choose_encoding(request_headers.get('accept-encoding'))
+            if encoding and http_cache.should_compress(content_type, len(body)):
+                body = http_cache.compress(body, encoding)
+                headers.append((b'content-encoding', encoding.encode()))
+        headers.append((b'content-length', str(len(body)).encode()))
+        if status == 503:
+            headers.append((b'retry-after', b'1'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, scope, receive, request_headers):
+        """Route a request; returns (status, payload, extra headers)"""
+        method, path = scope['method'], scope['path']
+        query_string = scope.get('query_string', b'').decode()
+        allowed = False
+        for route_method, pattern, handler, is_write, tables in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            try:
+                params = {k: v[-1] for k, v in parse_qs(query_string).items()}
+                body = await self._read_body(receive) if method == 'POST' else {}
+                if tables:
+                    call = lambda: self._conditional(handler, tables, f"{path}?{query_string}",
+                                                     request_headers, params, body, match.groupdict())
+                else:
+                    call = lambda: handler(params, body, **match.groupdict()) + ([],)
+                return await (self.write(call) if is_write else self.read(call))
+            except Overloaded as e:
+                return 503, {'error': str(e)}, []
+            except ValueError as e:
+                # BadRequest, bad pagination cursors and bad months all land here
+                return 400, {'error': str(e)}, []
+            except sqlite3.IntegrityError as e:
+                # A schema constraint caught what validation didn't (e.g. an unknown payment method)
+                status = 409 if 'UNIQUE' in str(e) else 400
+                return status, {'error': f"Rejected by the database: {e}"}, []
+        if allowed:
+            return 405, {'error': f"{method} not allowed on {path}"}, []
+        return 404, {'error': f"No API endpoint at {path}"}, []
+
+    def _conditional(self, handler, tables, resource, request_headers, params, body, kwargs):
+        """Run a read handler unless the client's copy is still current (read pool)"""
+        version, modified = self.reader.data_version(*tables)
+        etag = http_cache.make_etag(self.release, resource, version)
+        headers = [(b'etag', f'W/"{etag}"'.encode()),
+                   (b'last-modified', http_cache.http_date(modified).encode()),
+                   (b'cache-control', b'no-cache')]
+        if http_cache.is_fresh(request_headers.get('if-none-match'),
+                               request_headers.get('if-modified-since'), etag, modified):
+            # Answered from the version counters alone; the handler's queries never run
+            return 304, None, headers
+        status, payload = handler(params, body, **kwargs)
+        return status, payload, headers if status == 200 else []
+
+    async def _read_body(self, receive) -> Dict[str, Any]:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        raw = b''.join(chunks)
+        if not raw:
+            return {}
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            raise BadRequest("Request body must be JSON")
+        if not isinstance(body, dict):
+            raise BadRequest("Request body must be a JSON object")
+        return body
+
+
+def create_app(db_path: str = None, **options) -> AsyncAPI:
+    """Build the ASGI app (TUTORING_DB selects the database, as for app.py)"""
+    db_path = db_path or os.environ.get('TUTORING_DB', 'tutoring_payments.db')
+    return AsyncAPI(TutoringPaymentManager(db_path), **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the tutoring API with asyncio")
+    parser.add_argument('--db', default=None, help="database file (default $TUTORING_DB or tutoring_payments.db)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--read-workers', type=int, default=8, help="threads (and connections) for reads")
+    parser.add_argument('--max-pending-reads', type=int, default=512)
+    parser.add_argument('--max-pending-writes', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError("The async API server needs uvicorn (pip install uvicorn)")
+
+    api = create_app(args.db, read_workers=args.read_workers,
+                     max_pending_reads=args.max_pending_reads,
+                     max_pending_writes=args.max_pending_writes)
+    uvicorn.run(api, host=args.host, port=args.port, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Seeded synthetic data generator for benchmarking
+Fills a tutoring payments database with students, sessions and payments;
+the same seed and sizes always produce the same rows.
+Run with: python benchmarks/datagen.py bench.db --students 1000 --sessions 200 --payments 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payment_manager import TutoringPaymentManager
+
+SUBJECTS = ('Algebra', 'Geometry', 'Calculus', 'Physics', 'Chemistry', 'SAT Math', 'Statistics')
+PACKAGE_TYPES = ('Individual', 'Weekly', 'Intensive')
+HOURLY_RATES = (40.0, 50.0, 60.0, 75.0)
+DURATIONS = (1.0, 1.5, 2.0)
+STATUSES = ('Completed', 'Scheduled', 'Cancelled', 'No-Show')
+STATUS_WEIGHTS = (70, 15, 10, 5)
+PAYMENT_METHODS = ('Cash', 'Check', 'Venmo', 'Zelle', 'Bank Transfer', 'Other')
+# Session notes, so full-text search has something realistic to index
+NOTE_PHRASES = ('Reviewed homework', 'Midterm prep', 'Practice test', 'Worked on word problems',
+                'Needs more practice with fractions', 'Final exam review', 'Covered new chapter',
+                'Went over quiz mistakes', 'Great progress today', 'Assigned extra worksheets')
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert(conn, sql, rows, chunk_size):
+    count = 0
+    for chunk in _chunks(rows, chunk_size):
+        conn.executemany(sql, chunk)
+        conn.commit()
+        count += len(chunk)
+    return count
+
+
+def generate(pm: TutoringPaymentManager, students: int = 1000, sessions_per_student: int = 50,
+             payments_per_student: int = 10, months: int = 24, seed: int = 42,
+             end_date: date = None, chunk_size: int = 10000) -> dict:
+    """Insert synthetic rows through pm's connection; returns row counts and timing.
+
+    Dates fall in the `months` months up to end_date (default 2026-01-01, fixed
+    so results stay comparable across runs and days).
+    """
+    rng = random.Random(seed)
+    end_date = end_date or date(2026, 1, 1)
+    span_days = months * 30
+    started = time.perf_counter()
+
+    with pm.get_connection() as conn:
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM students").fetchone()[0] + 1
+        student_rows = [
+            (f"Student {n}", f"bench.student{seed}.{n}@example.com", f"555-{n % 10000:04d}",
+             f"Parent {n}", f"bench.parent{seed}.{n}@example.com",
+             rng.choice(PACKAGE_TYPES), rng.choice(HOURLY_RATES), int(rng.random() < 0.9))
+            for n in range(students)
+        ]
+        counts = {'students': _insert(conn, """
+            INSERT INTO students (name, email, phone, parent_name, parent_email,
+                                  package_type, hourly_rate, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, student_rows, chunk_size)}
+        rates = {first_id + n: row[6] for n, row in enumerate(student_rows)}
+
+        def session_rows():
+            for student_id, rate in rates.items():
+                for _ in range(sessions_per_student):
+                    day = end_date - timedelta(days=rng.randrange(span_days))
+                    hour = rng.randrange(8, 20)
+                    duration = rng.choice(DURATIONS)
+                    end_minutes = hour * 60 + int(duration * 60)
+                    yield (student_id, day.isoformat(), f"{hour:02d}:00",
+                           f"{end_minutes // 60:02d}:{end_minutes % 60:02d}", duration,
+                           rng.choice(SUBJECTS), rate * duration,
+                           rng.choice(NOTE_PHRASES) if rng.random() < 0.4 else None,
+                           rng.choices(STATUSES, STATUS_WEIGHTS)[0])
+
+        counts['sessions'] = _insert(conn, """
+            INSERT INTO sessions (student_id, session_date, start_time, end_time,
+                                  duration_hours, subject, session_cost, notes, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, session_rows(), chunk_size)
+
+        def payment_rows():
+            for student_id, rate in rates.items():
+                for _ in range(payments_per_student):
+                    day = end_date - timedelta(days=rng.randrange(span_days))
+                    method = rng.choice(PAYMENT_METHODS)
+                    reference = f"{method[:3].upper()}-{rng.randrange(100000):05d}" if method != 'Cash' else None
+                    yield (student_id, day.isoformat(), rate * rng.randint(1, 8),
+                           method, reference, None)
+
+        counts['payments'] = _insert(conn, """
+            INSERT INTO payments (student_id, payment_date, amount, payment_method,
+                                  reference_number, notes)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, payment_rows(), chunk_size)
+
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    pm.cache.clear()
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic tutoring payments database")
+    parser.add_argument('db', help="database file to fill (created if missing)")
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--sessions', type=int, default=50, help="sessions per student")
+    parser.add_argument('--payments', type=int, default=10, help="payments per student")
+    parser.add_argument('--months', type=int, default=24, help="months of history to spread rows over")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    pm = TutoringPaymentManager(args.db)
+    counts = generate(pm, args.students, args.sessions, args.payments, args.months, args.seed)
+    print(f"Generated {counts['students']} students, {counts['sessions']} sessions and "
+          f"{counts['payments']} payments in {counts['seconds']}s")
+    pm.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark suite for TutoringPaymentManager and the Flask routes
+Builds (or reuses) a seeded synthetic database, times each manager method and
+route, and writes JSON results that can be compared against an earlier run.
+Run with: python benchmarks/run.py --output results.json [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import migrate
+import snapshots
+from datagen import generate
+from payment_manager import TutoringPaymentManager
+
+
+def dataset_path(args) -> str:
+    """Database file for these generator settings (reused across runs)"""
+    name = (f"bench-st{args.students}-se{args.sessions}-pa{args.payments}"
+            f"-m{args.months}-seed{args.seed}-v{migrate.SCHEMA_VERSION}.db")
+    return os.path.join(args.data_dir, name)
+
+
+def build_dataset(args) -> str:
+    """Generate the benchmark database unless an identical one already exists"""
+    path = dataset_path(args)
+    if os.path.exists(path) and not args.regenerate:
+        print(f"Reusing dataset {path}")
+        return path
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    partial = path + '.partial'
+    for stale in (path, partial):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(stale + suffix):
+                os.remove(stale + suffix)
+
+    pm = TutoringPaymentManager(partial)
+    counts = generate(pm, args.students, args.sessions, args.payments, args.months, args.seed)
+    pm.close()
+    # Only a fully generated file gets the real name, so an interrupted run is never reused
+    os.replace(partial, path)
+    print(f"Generated {counts['students']} students, {counts['sessions']} sessions and "
+          f"{counts['payments']} payments in {counts['seconds']}s")
+    return path
+
+
+def time_call(call, repeat: int, warmup: int) -> dict:
+    """Run call warmup + repeat times and summarize the timed runs (milliseconds)"""
+    for _ in range(warmup):
+        call()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_ms': round(samples[0], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'runs': repeat,
+    }
+
+
+def method_benchmarks(pm: TutoringPaymentManager, student_id: int, month: str) -> dict:
+    """Manager calls to time, by name"""
+    return {
+        'get_students': lambda: pm.get_students(),
+        'get_students[records]': lambda: pm.get_students(as_records=True),
+        'get_student_balance': lambda: pm.get_student_balance(),
+        'get_student_balance[records]': lambda: pm.get_student_balance(as_records=True),
+        'get_student_balance(student_id)': lambda: pm.get_student_balance(student_id),
+        'get_sessions_page': lambda: pm.get_sessions_page(50),
+        'get_sessions_page[records]': lambda: pm.get_sessions_page(50, as_records=True),
+        'get_sessions_page(status)': lambda: pm.get_sessions_page(50, status='Completed'),
+        'get_sessions(student_id)': lambda: pm.get_sessions(student_id=student_id),
+        'get_payments_page': lambda: pm.get_payments_page(50),
+        'get_monthly_revenue': lambda: pm.get_monthly_revenue(12),
+        'get_payment_summary': lambda: pm.get_payment_summary(6),
+        'get_balance_totals': lambda: pm.get_balance_totals(),
+        'get_top_balances': lambda: pm.get_top_balances(10),
+        'get_revenue_by_subject': lambda: pm.get_revenue_by_subject(12),
+        'get_revenue_by_weekday': lambda: pm.get_revenue_by_weekday(12),
+        'get_daily_revenue': lambda: pm.get_daily_revenue(90),
+        'generate_invoice_data': lambda: pm.generate_invoice_data(student_id, month),
+        'generate_invoices': lambda: pm.generate_invoices(month),
+        'search': lambda: pm.search('midterm'),
+        'search[records]': lambda: pm.search('exam rev', as_records=True),
+        'search(student_id)': lambda: pm.search('calc', student_id=student_id, as_records=True),
+        # Report engine over the Parquet snapshot (past its result cache; tables stay loaded)
+        'snapshot:revenue_trend': lambda: snapshots.revenue_trend(pm.snapshot_dir, 60),
+        'snapshot:retention_cohorts': lambda: snapshots.retention_cohorts(pm.snapshot_dir, 24),
+        'snapshot:revenue_by_subject': lambda: snapshots.revenue_by_subject(pm.snapshot_dir, 60),
+        'snapshot:payment_method_mix': lambda: snapshots.payment_method_mix(pm.snapshot_dir, 60),
+    }
+
+
+ROUTES = ('/', '/reports', '/students', '/sessions', '/payments',
+          '/api/student_balance', '/api/sessions', '/api/payments', '/api/search?q=midterm',
+          '/api/aggregates/totals', '/api/aggregates/revenue_by_subject', '/api/aggregates/daily_revenue')
+CONDITIONAL_ROUTES = ('/reports', '/api/students', '/api/student_balance')
+
+
+def route_benchmarks(pm: TutoringPaymentManager) -> dict:
+    """Flask routes to time end to end through the test client, by name"""
+    import app as web
+
+    web.pm = pm
+    client = web.app.test_client()
+
+    def request(path, headers=None, expected=200):
+        def call():
+            response = client.get(path, headers=headers)
+            if response.status_code != expected:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return call
+
+    benchmarks = {f"GET {path}": request(path) for path in ROUTES}
+    # Polling clients revalidate with the ETag they already hold
+    for path in CONDITIONAL_ROUTES:
+        etag = client.get(path).headers['ETag']
+        benchmarks[f"GET {path} (304)"] = request(path, {'If-None-Match': etag}, 304)
+    return benchmarks
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Benchmarks whose median got slower than baseline by more than threshold"""
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous or not previous['median_ms']:
+            continue
+        change = current['median_ms'] / previous['median_ms'] - 1
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{name:<36} {previous['median_ms']:>9.2f}ms {current['median_ms']:>9.2f}ms "
+              f"{change:>+7.1%}{flag}")
+        if change > threshold:
+            regressions.append({'benchmark': name, 'baseline_ms': previous['median_ms'],
+                                'current_ms': current['median_ms'], 'change': round(change, 4)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark manager methods and Flask routes")
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--sessions', type=int, default=40, help="sessions per student")
+    parser.add_argument('--payments', type=int, default=8, help="payments per student")
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'tutoring_bench'),
+                        help="where generated databases are kept for reuse")
+    parser.add_argument('--regenerate', action='store_true', help="rebuild the dataset even if cached")
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', help="only run benchmarks whose name contains this text")
+    parser.add_argument('--no-routes', action='store_true', help="skip the Flask route timings")
+    parser.add_argument('--cache', action='store_true',
+                        help="leave the result cache on (default measures the database every call)")
+    parser.add_argument('--no-instrument', action='store_true',
+                        help="turn off per-query instrumentation (to measure its overhead)")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="fail if a median is this much slower than baseline (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    path = build_dataset(args)
+    # app.py builds its own manager on import; point it at the benchmark database
+    os.environ['TUTORING_DB'] = path
+    pm = TutoringPaymentManager(path, cache_size=256 if args.cache else 0,
+                                instrument=not args.no_instrument)
+
+    with pm.get_connection() as conn:
+        student_id = conn.execute(
+            "SELECT student_id FROM sessions GROUP BY student_id ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()[0]
+        month = conn.execute(
+            "SELECT month FROM monthly_revenue_rollup ORDER BY sessions_completed DESC LIMIT 1"
+        ).fetchone()[0]
+
+    # Kept next to the dataset, so a reused dataset only needs a no-op sync
+    pm.sync_snapshot()
+    benchmarks = method_benchmarks(pm, student_id, month)
+    if not args.no_routes:
+        benchmarks.update(route_benchmarks(pm))
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'dataset': {'students': args.students, 'sessions_per_student': args.sessions,
+                        'payments_per_student': args.payments, 'months': args.months,
+                        'seed': args.seed},
+            'repeat': args.repeat,
+            'cache': args.cache,
+            'instrument': not args.no_instrument,
+        },
+        'benchmarks': {},
+    }
+
+    for name, call in benchmarks.items():
+        if args.only and args.only not in name:
+            continue
+        timing = time_call(call, args.repeat, args.warmup)
+        results['benchmarks'][name] = timing
+        print(f"{name:<36} median {timing['median_ms']:>9.2f}ms  p95 {timing['p95_ms']:>9.2f}ms")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    pm.close()
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Startup-time benchmark for the web app and the payment_manager CLI
+Each measurement runs in a fresh interpreter so imports are really cold.
+Run with: python benchmarks/startup.py [--runs 5] [--output startup.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Timed in a child process; each prints a RESULT line of phase timings (seconds)
+PROBES = {
+    'cli': """
+import time
+started = time.perf_counter()
+import payment_manager
+imported = time.perf_counter()
+pm = payment_manager.TutoringPaymentManager('bench.db')
+ready = time.perf_counter()
+pm.get_student_balance(as_records=True)
+done = time.perf_counter()
+print('RESULT', json.dumps({'import': imported - started, 'construct': ready - imported,
+                  'first_query': done - ready, 'total': done - started,
+                  'pandas_loaded': 'pandas' in sys.modules}))
+""",
+    'app': """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/')
+done = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print('RESULT', json.dumps({'import': imported - started, 'first_request': done - imported,
+                  'total': done - started, 'pandas_loaded': 'pandas' in sys.modules}))
+""",
+}
+
+
+def run_probe(name: str, workdir: str) -> dict:
+    """Run one probe in a fresh interpreter and return its timings"""
+    code = f"import json, sys\nsys.path.insert(0, {REPO_DIR!r})\n" + PROBES[name]
+    result = subprocess.run([sys.executable, '-c', code], cwd=workdir,
+                            capture_output=True, text=True, check=True)
+    # The manager prints status messages too; only the RESULT line matters
+    line = next(line for line in result.stdout.splitlines() if line.startswith('RESULT '))
+    return json.loads(line[len('RESULT '):])
+
+
+def summarize(samples: list) -> dict:
+    """Median and best of each phase across runs"""
+    summary = {}
+    for phase, value in samples[0].items():
+        if isinstance(value, bool):
+            summary[phase] = value
+            continue
+        values = [sample[phase] for sample in samples]
+        summary[phase] = {'median_ms': round(statistics.median(values) * 1000, 2),
+                          'min_ms': round(min(values) * 1000, 2)}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import and first-request latency")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {'python': sys.version.split()[0], 'runs': args.runs}
+    with tempfile.TemporaryDirectory() as workdir:
+        # The first run creates bench.db, so timed runs all hit an existing database
+        run_probe('cli', workdir)
+        for name in PROBES:
+            samples = [run_probe(name, workdir) for _ in range(args.runs)]
+            results[name] = summarize(samples)
+
+    for name in PROBES:
+        phases = ', '.join(f"{phase} {value['median_ms']}ms"
+                           for phase, value in results[name].items() if isinstance(value, dict))
+        print(f"{name:<4} {phases} (pandas loaded: {results[name]['pandas_loaded']})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Package billing for Weekly and Intensive students
+A monthly package covers a set number of completed sessions for a flat price;
+sessions beyond that are billed at the package's per-session rate. The
+triggers from migration 6 keep completed_sessions and the balances current,
+so the batch operations here are single set-based statements
+"""
+
+import json
+from typing import Dict, Any, List, Optional
+
+# Prices from tutoring.html's "Pricing & Packages" section
+PACKAGE_PLANS = {
+    'Weekly': {'total_sessions': 4, 'package_cost': 180.00},
+    'Intensive': {'total_sessions': 8, 'package_cost': 380.00},
+}
+
+# Packages are billed in advance, due on this day of their month
+PAYMENT_DUE_DAY = 5
+
+
+def overage_rate(package_cost: float, total_sessions: int) -> float:
+    """Price of each completed session beyond a package's allowance"""
+    return round(package_cost / max(total_sessions, 1), 2)
+
+
+def package_charge(package_cost: float, total_sessions: int, completed_sessions: int) -> float:
+    """What a package month costs (the same sum the balance triggers keep)"""
+    extra = max(0, completed_sessions - total_sessions)
+    return round(package_cost + extra * overage_rate(package_cost, total_sessions), 2)
+
+
+def package_summary(package: Dict[str, Any], completed_sessions: int) -> Dict[str, Any]:
+    """Invoice figures for one monthly_packages row and its completed session count"""
+    cost, total = package['package_cost'], package['total_sessions']
+    return {
+        'package_type': package['package_type'],
+        'total_sessions': total,
+        'sessions_used': min(completed_sessions, total),
+        'extra_sessions': max(0, completed_sessions - total),
+        'package_cost': cost,
+        'overage_rate': overage_rate(cost, total),
+        'charge': package_charge(cost, total, completed_sessions),
+        'is_paid': bool(package['is_paid']),
+        'payment_due_date': package['payment_due_date'],
+    }
+
+
+def insert_packages(conn, month_year: str, student_ids: Optional[List[int]] = None) -> int:
+    """Create month_year's package for every active package student (or only
+    student_ids) that doesn't have one yet; returns the number created"""
+    plans = [(name, plan['total_sessions'], plan['package_cost']) for name, plan in PACKAGE_PLANS.items()]
+    query = f"""
+        INSERT OR IGNORE INTO monthly_packages
+            (student_id, package_type, month_year, total_sessions, package_cost, payment_due_date)
+        WITH plans (package_type, total_sessions, package_cost) AS (
+            VALUES {', '.join(['(?, ?, ?)'] * len(plans))}
+        )
+        SELECT s.id, s.package_type, ?, p.total_sessions, p.package_cost, ?
+        FROM students s
+        JOIN plans p ON p.package_type = s.package_type
+        WHERE s.is_active = 1
+    """
+    params = [value for plan in plans for value in plan]
+    params += [month_year, f"{month_year}-{PAYMENT_DUE_DAY:02d}"]
+    if student_ids is not None:
+        query += " AND s.id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(student_ids)))
+    return conn.execute(query, params).rowcount
+
+
+def settle_packages(conn) -> int:
+    """Mark unpaid packages paid for students who owe nothing; returns the number marked"""
+    return conn.execute("""
+        UPDATE monthly_packages SET is_paid = 1
+        WHERE is_paid = 0 AND student_id IN (
+            SELECT student_id FROM student_balances WHERE total_owed - total_paid <= 0.005
+        )
+    """).rowcount
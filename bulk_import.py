@@ -0,0 +1,282 @@
+"""
+Bulk import of students, sessions and payments from CSV or JSONL files
+Rows are streamed in chunks, validated against the schema's constraints up
+front, and inserted with executemany, one transaction per chunk
+"""
+
+import csv
+import json
+import os
+import sqlite3
+from datetime import date, time
+from typing import Dict, Any, Iterator, Tuple, Optional
+
+PACKAGE_TYPES = ('Individual', 'Weekly', 'Intensive')
+SESSION_STATUSES = ('Scheduled', 'Completed', 'Cancelled', 'No-Show')
+PAYMENT_METHODS = ('Cash', 'Check', 'Venmo', 'Zelle', 'Bank Transfer', 'Other')
+
+
+class RowError(ValueError):
+    """A row that fails validation; the message is reported as the reason"""
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _required(row: Dict[str, Any], field: str) -> str:
+    value = _text(row.get(field))
+    if value is None:
+        raise RowError(f"missing required field '{field}'")
+    return value
+
+
+def _number(row: Dict[str, Any], field: str, default: float = None) -> float:
+    value = _text(row.get(field))
+    if value is None:
+        if default is None:
+            raise RowError(f"missing required field '{field}'")
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise RowError(f"'{field}' is not a number: {value!r}")
+
+
+def _integer(row: Dict[str, Any], field: str) -> int:
+    value = _required(row, field)
+    try:
+        return int(float(value))
+    except ValueError:
+        raise RowError(f"'{field}' is not an integer: {value!r}")
+
+
+def _date(row: Dict[str, Any], field: str) -> str:
+    value = _required(row, field)
+    try:
+        # fromisoformat is implemented in C, far cheaper than strptime per row
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise RowError(f"'{field}' is not a YYYY-MM-DD date: {value!r}")
+
+
+def _time(row: Dict[str, Any], field: str) -> str:
+    value = _required(row, field)
+    try:
+        return time.fromisoformat(value).isoformat(timespec='minutes')
+    except ValueError:
+        raise RowError(f"'{field}' is not an HH:MM time: {value!r}")
+
+
+def _choice(row: Dict[str, Any], field: str, choices: tuple, default: str = None) -> str:
+    value = _text(row.get(field)) or default
+    if value not in choices:
+        raise RowError(f"'{field}' must be one of {', '.join(choices)}: {value!r}")
+    return value
+
+
+def _student_row(row, known):
+    email = _required(row, 'email')
+    if email in known['emails']:
+        raise RowError(f"email already exists: {email}")
+    values = (
+        _required(row, 'name'),
+        email,
+        _text(row.get('phone')),
+        _text(row.get('parent_name')),
+        _text(row.get('parent_email')),
+        _choice(row, 'package_type', PACKAGE_TYPES, 'Individual'),
+        _number(row, 'hourly_rate', 50.00),
+    )
+    known['emails'].add(email)
+    return values
+
+
+def _known_student(row, known) -> int:
+    student_id = _integer(row, 'student_id')
+    if student_id not in known['student_ids']:
+        raise RowError(f"unknown student_id: {student_id}")
+    return student_id
+
+
+def _session_row(row, known):
+    return (
+        _known_student(row, known),
+        _date(row, 'session_date'),
+        _time(row, 'start_time'),
+        _time(row, 'end_time'),
+        _number(row, 'duration_hours'),
+        _required(row, 'subject'),
+        _number(row, 'session_cost'),
+        _text(row.get('notes')),
+        _choice(row, 'status', SESSION_STATUSES, 'Scheduled'),
+    )
+
+
+def _payment_row(row, known):
+    return (
+        _known_student(row, known),
+        _date(row, 'payment_date'),
+        _number(row, 'amount'),
+        _choice(row, 'payment_method', PAYMENT_METHODS),
+        _text(row.get('reference_number')),
+        _text(row.get('notes')),
+    )
+
+
+# Per-table insert statement and row validator
+IMPORT_SPECS = {
+    'students': (
+        """INSERT INTO students (name, email, phone, parent_name, parent_email,
+                                 package_type, hourly_rate)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        _student_row,
+    ),
+    'sessions': (
+        """INSERT INTO sessions (student_id, session_date, start_time, end_time,
+                                 duration_hours, subject, session_cost, notes, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        _session_row,
+    ),
+    'payments': (
+        """INSERT INTO payments (student_id, payment_date, amount, payment_method,
+                                 reference_number, notes)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        _payment_row,
+    ),
+}
+
+
+def read_rows(path: str, fmt: str = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Stream (row number, row dict) pairs from a CSV or JSONL file"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                yield number, row
+        elif fmt == 'jsonl':
+            number = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'__error__': f"invalid JSON: {e}"}
+                yield number, row
+        else:
+            raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _load_known(conn: sqlite3.Connection) -> Dict[str, set]:
+    """Existing keys that imported rows are checked against"""
+    return {
+        'emails': {row[0] for row in conn.execute("SELECT email FROM students")},
+        'student_ids': {row[0] for row in conn.execute("SELECT id FROM students")},
+    }
+
+
+def _insert_chunk(conn, insert_sql, chunk, rejects):
+    """Insert a validated chunk, isolating rows the database still refuses"""
+    try:
+        conn.executemany(insert_sql, [values for _, values in chunk])
+        return len(chunk)
+    except sqlite3.DatabaseError:
+        # Nothing else is pending in this transaction yet, so start the chunk over
+        conn.rollback()
+
+    inserted = 0
+    for number, values in chunk:
+        try:
+            conn.execute(insert_sql, values)
+            inserted += 1
+        except sqlite3.DatabaseError as e:
+            rejects.append((number, f"database rejected row: {e}", values))
+    return inserted
+
+
+def import_file(pm, table: str, path: str, fmt: str = None, chunk_size: int = 5000,
+                resume: bool = True, reject_path: str = None) -> Dict[str, Any]:
+    """Import a CSV/JSONL file into table; see TutoringPaymentManager.bulk_import"""
+    if table not in IMPORT_SPECS:
+        raise ValueError(f"Cannot import into '{table}' (choose from {', '.join(IMPORT_SPECS)})")
+    insert_sql, validate = IMPORT_SPECS[table]
+    source = os.path.abspath(path)
+
+    summary = {'table': table, 'source': source, 'inserted': 0, 'rejected': 0,
+               'skipped': 0, 'rejects': []}
+    reject_file = None
+    reject_writer = None
+
+    with pm.get_connection() as conn:
+        if resume:
+            row = conn.execute(
+                "SELECT rows_done FROM import_checkpoints WHERE source = ? AND table_name = ?",
+                (source, table)
+            ).fetchone()
+            start_after = row[0] if row else 0
+        else:
+            conn.execute("DELETE FROM import_checkpoints WHERE source = ? AND table_name = ?",
+                         (source, table))
+            conn.commit()
+            start_after = 0
+
+        known = _load_known(conn)
+        chunk = []
+        rejects = []
+        rows_done = start_after
+
+        def flush():
+            nonlocal chunk, rejects, reject_file, reject_writer
+            if chunk:
+                summary['inserted'] += _insert_chunk(conn, insert_sql, chunk, rejects)
+            # The checkpoint commits atomically with the rows it covers
+            conn.execute("""
+                INSERT INTO import_checkpoints (source, table_name, rows_done)
+                VALUES (?, ?, ?)
+                ON CONFLICT(source, table_name) DO UPDATE SET
+                    rows_done = excluded.rows_done, updated_date = CURRENT_TIMESTAMP
+            """, (source, table, rows_done))
+            conn.commit()
+
+            for number, reason, raw in rejects:
+                summary['rejected'] += 1
+                if len(summary['rejects']) < 100:
+                    summary['rejects'].append({'row': number, 'reason': reason})
+                if reject_path:
+                    if reject_writer is None:
+                        reject_file = open(reject_path, 'a', newline='', encoding='utf-8')
+                        reject_writer = csv.writer(reject_file)
+                    reject_writer.writerow([number, reason, json.dumps(raw, default=str)])
+            chunk, rejects = [], []
+
+        try:
+            for number, raw in read_rows(path, fmt):
+                if number <= start_after:
+                    summary['skipped'] += 1
+                    continue
+                rows_done = number
+                try:
+                    if '__error__' in raw:
+                        raise RowError(raw['__error__'])
+                    chunk.append((number, validate(raw, known)))
+                except RowError as e:
+                    rejects.append((number, str(e), raw))
+
+                if len(chunk) + len(rejects) >= chunk_size:
+                    flush()
+            flush()
+
+            # Finished cleanly: the next import of this file starts from the top
+            conn.execute("DELETE FROM import_checkpoints WHERE source = ? AND table_name = ?",
+                         (source, table))
+            conn.commit()
+        finally:
+            if reject_file is not None:
+                reject_file.close()
+
+    return summary
@@ -0,0 +1,185 @@
+"""
+Streaming export of tables and report views to CSV, JSONL or Parquet
+Rows are read from a cursor in fixed-size chunks and written as they arrive,
+so memory use stays flat regardless of table size
+"""
+
+import csv
+import io
+import json
+import sqlite3
+from typing import Dict, Any, Iterator, List, Tuple
+
+# Exportable tables/views: the key column used for incremental exports and
+# the date column used for date-range filters (None where not applicable)
+EXPORT_SOURCES = {
+    'students': {'key': 'id', 'date': 'created_date'},
+    'sessions': {'key': 'id', 'date': 'session_date'},
+    'payments': {'key': 'id', 'date': 'payment_date'},
+    'monthly_packages': {'key': 'id', 'date': 'payment_due_date'},
+    'student_balance': {'key': None, 'date': None},
+    'monthly_revenue': {'key': None, 'date': None},
+    'payment_summary': {'key': None, 'date': None},
+}
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+def format_from_path(file_path: str) -> str:
+    """Guess the export format from a file extension (defaults to CSV)"""
+    extension = file_path.rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension in ('parquet', 'pq'):
+        return 'parquet'
+    return 'csv'
+
+
+def build_query(table_name: str, start_date: str = None, end_date: str = None,
+                after_id: int = None) -> Tuple[str, list]:
+    """Build the SELECT for an export, rejecting anything not whitelisted"""
+    if table_name not in EXPORT_SOURCES:
+        raise ValueError(f"Cannot export '{table_name}' "
+                         f"(choose from {', '.join(EXPORT_SOURCES)})")
+    source = EXPORT_SOURCES[table_name]
+
+    # table_name is whitelisted above, so interpolating it is safe
+    query = f"SELECT * FROM {table_name} WHERE 1=1"
+    params = []
+
+    if start_date or end_date:
+        if not source['date']:
+            raise ValueError(f"'{table_name}' does not support date filters")
+        if start_date:
+            query += f" AND {source['date']} >= ?"
+            params.append(start_date)
+        if end_date:
+            query += f" AND {source['date']} <= ?"
+            params.append(end_date)
+
+    if after_id is not None:
+        if not source['key']:
+            raise ValueError(f"'{table_name}' does not support incremental export")
+        query += f" AND {source['key']} > ?"
+        params.append(after_id)
+
+    if source['key']:
+        query += f" ORDER BY {source['key']}"
+    return query, params
+
+
+def iter_chunks(conn: sqlite3.Connection, query: str, params: list,
+                chunk_size: int = 5000) -> Tuple[List[str], Iterator[list]]:
+    """Run query and return its column names plus an iterator of row chunks"""
+    cursor = conn.execute(query, params)
+    columns = [desc[0] for desc in cursor.description]
+
+    def chunks():
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+    return columns, chunks()
+
+
+def csv_text(columns: List[str], chunks: Iterator[list]) -> Iterator[str]:
+    """Render chunks as CSV text, one string per chunk (header first)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def jsonl_text(columns: List[str], chunks: Iterator[list]) -> Iterator[str]:
+    """Render chunks as JSON Lines text, one string per chunk"""
+    for rows in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows
+        )
+
+
+def _parquet_schema(conn, table_name, columns, first_rows):
+    """Arrow schema from the declared column types, inferred where undeclared"""
+    import pyarrow as pa
+
+    declared = {row[1]: (row[2] or '').upper()
+                for row in conn.execute(f"PRAGMA table_info({table_name})")}
+    fields = []
+    for index, name in enumerate(columns):
+        decl = declared.get(name, '')
+        if 'INT' in decl or 'BOOL' in decl:
+            arrow_type = pa.int64()
+        elif any(t in decl for t in ('DEC', 'REAL', 'FLOA', 'DOUB', 'NUM')):
+            arrow_type = pa.float64()
+        elif decl:
+            arrow_type = pa.string()
+        else:
+            sample = next((row[index] for row in first_rows if row[index] is not None), None)
+            arrow_type = pa.float64() if isinstance(sample, (int, float)) else pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def write_parquet(conn, table_name: str, file_path: str, columns: List[str],
+                  chunks: Iterator[list]) -> int:
+    """Write chunks to a Parquet file, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    writer = None
+    count = 0
+    try:
+        for rows in chunks:
+            if writer is None:
+                schema = _parquet_schema(conn, table_name, columns, rows)
+                writer = pq.ParquetWriter(file_path, schema)
+            data = {
+                name: [row[index] for row in rows] for index, name in enumerate(columns)
+            }
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # Empty result: still produce a valid file with the right columns
+        schema = _parquet_schema(conn, table_name, columns, [])
+        pq.write_table(schema.empty_table(), file_path)
+    return count
+
+
+def write_export(conn, table_name: str, file_path: str, file_format: str,
+                 query: str, params: list, chunk_size: int = 5000) -> Dict[str, Any]:
+    """Stream a query result to file_path; returns row count and last key seen"""
+    key = EXPORT_SOURCES[table_name]['key']
+    columns, chunks = iter_chunks(conn, query, params, chunk_size)
+    stats = {'rows': 0, 'last_key': None}
+
+    def counted(chunks):
+        key_index = columns.index(key) if key else None
+        for rows in chunks:
+            stats['rows'] += len(rows)
+            if key_index is not None:
+                stats['last_key'] = rows[-1][key_index]
+            yield rows
+
+    if file_format == 'parquet':
+        write_parquet(conn, table_name, file_path, columns, counted(chunks))
+    else:
+        render = csv_text if file_format == 'csv' else jsonl_text
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            for text in render(columns, counted(chunks)):
+                f.write(text)
+    return stats
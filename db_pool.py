@@ -0,0 +1,156 @@
+"""
+SQLite connection pool for the tutoring payment manager
+Keeps a bounded set of long-lived connections and hands them out per thread
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Pragmas applied to every new connection
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',       # readers don't block the writer
+    'synchronous': 'NORMAL',     # safe with WAL, skips the fsync per commit
+    'cache_size': -16000,        # ~16 MB page cache (negative = KiB)
+    'mmap_size': 268435456,      # 256 MB memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
+
+class PoolExhaustedError(sqlite3.OperationalError):
+    """Raised when no pooled connection frees up within the timeout"""
+
+
+class ConnectionPool:
+    def __init__(self, db_path: str, max_size: int = 8, timeout: float = 30.0,
+                 pragmas: Dict[str, Any] = None, factory=sqlite3.Connection):
+        """Create a pool; connections (of class factory) are opened lazily up to max_size"""
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.factory = factory
+
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'reused': 0,
+            'affinity_hits': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+        }
+
+    def connect(self) -> sqlite3.Connection:
+        """Open and tune a new connection (not counted against max_size)"""
+        # Connections are handed between threads, but only ever used by one at a time
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               factory=self.factory)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, reusing the one this thread already holds"""
+        local = self._local
+        if getattr(local, 'depth', 0):
+            # Nested call on the same thread shares the outer connection
+            local.depth += 1
+            return local.conn
+
+        with self._cond:
+            self._stats['checkouts'] += 1
+            if not self._idle and self._open >= self.max_size:
+                self._stats['waits'] += 1
+                started = time.perf_counter()
+                ready = self._cond.wait_for(
+                    lambda: self._idle or self._open < self.max_size, self.timeout
+                )
+                self._stats['wait_time'] += time.perf_counter() - started
+                if not ready:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhaustedError(
+                        f"No connection available after {self.timeout}s "
+                        f"(pool size {self.max_size})"
+                    )
+
+            conn = None
+            if self._idle:
+                # Prefer the connection this thread used last - its cache is warm
+                last = getattr(local, 'last', None)
+                if last is not None and last in self._idle:
+                    self._idle.remove(last)
+                    conn = last
+                    self._stats['affinity_hits'] += 1
+                else:
+                    conn = self._idle.pop()
+                self._stats['reused'] += 1
+            else:
+                self._open += 1
+
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+
+        local.conn = conn
+        local.last = conn
+        local.depth = 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool once the outermost user is done"""
+        local = self._local
+        local.depth -= 1
+        if local.depth:
+            return
+        local.conn = None
+
+        # Never hand a half-finished transaction to the next borrower
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+            })
+        return stats
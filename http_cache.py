@@ -0,0 +1,100 @@
+"""
+HTTP caching helpers shared by the Flask app and the async API
+Builds ETag / Last-Modified validators from the manager's per-table data
+versions, decides when a conditional GET can be answered with 304, and
+compresses large text bodies with brotli (if installed) or gzip
+"""
+
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+# Bodies smaller than this aren't worth the CPU (or the extra headers)
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/csv')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def release_tag(base_dir: str) -> str:
+    """Fingerprint of the code and templates, so a deploy changes every ETag"""
+    digest = hashlib.blake2b(digest_size=8)
+    for folder in (base_dir, os.path.join(base_dir, 'templates')):
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(('.py', '.html', '.sql')):
+                stat = os.stat(os.path.join(folder, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def make_etag(release: str, resource: str, version: str) -> str:
+    """Opaque entity tag for one resource at one data version"""
+    return hashlib.blake2b(f"{release}|{resource}|{version}".encode(), digest_size=12).hexdigest()
+
+
+def http_date(moment: datetime) -> str:
+    return format_datetime(moment, usegmt=True)
+
+
+def is_fresh(if_none_match: Optional[str], if_modified_since: Optional[str],
+             etag: str, last_modified: Optional[datetime]) -> bool:
+    """True if the client's cached copy (per its conditional headers) is current.
+
+    If-None-Match wins when present (compared weakly, as for any GET);
+    If-Modified-Since is only consulted without it.
+    """
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.removeprefix('W/').strip('"') == etag for tag in tags)
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole-second resolution
+        return since is not None and last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best content coding the client accepts: br (if available), then gzip"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    if brotli is not None and accepted.get('br', wildcard) > 0:
+        return 'br'
+    if accepted.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+def should_compress(content_type: Optional[str], size: int) -> bool:
+    """Whether a body of this type and size is worth compressing"""
+    return (size >= MIN_COMPRESS_SIZE and content_type is not None
+            and content_type.split(';')[0].strip() in COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Encode body with the coding returned by choose_encoding()"""
+    if encoding == 'br':
+        # Quality 5 is close to gzip -9 in speed but noticeably smaller
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
@@ -0,0 +1,334 @@
+"""
+Query and route instrumentation for the tutoring payment manager
+Times every SQL statement run through pooled connections (grouped by
+normalized text), records Flask route latency histograms, logs slow
+statements with their query plan, and renders it all for Prometheus
+"""
+
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List
+
+logger = logging.getLogger('tutoring.slow_query')
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+_normalized = {}
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace, literals and IN (?, ?, ...) lists so similar statements group together"""
+    text = _normalized.get(sql)
+    if text is None:
+        text = _SPACE.sub(' ', sql).strip()
+        text = _STRING.sub('?', text)
+        text = _NUMBER.sub('?', text)
+        text = _IN_LIST.sub('IN (...)', text)
+        # Statements are built from a fixed set of code paths, so this stays small
+        if len(_normalized) < 10000:
+            _normalized[sql] = text
+    return text
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count', 'maximum')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.maximum:
+            self.maximum = value
+
+    def cumulative(self) -> List[tuple]:
+        """(upper bound, cumulative count) pairs, ending with +Inf"""
+        running = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+
+class Metrics:
+    def __init__(self, slow_query_seconds: float = 0.25, slow_log_size: int = 100,
+                 buckets=DEFAULT_BUCKETS):
+        """Create a registry; statements taking slow_query_seconds or longer are logged"""
+        self.slow_query_seconds = slow_query_seconds
+        self.buckets = buckets
+
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._requests = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._slow_total = 0
+
+    def record_query(self, sql: str, seconds: float, rows: int = None, error: bool = False,
+                     conn: sqlite3.Connection = None, params=()):
+        """Record one finished statement, logging it with its plan if slow"""
+        text = normalize_sql(sql)
+        with self._lock:
+            entry = self._queries.get(text)
+            if entry is None:
+                entry = self._queries[text] = {'histogram': Histogram(self.buckets),
+                                               'rows': 0, 'errors': 0}
+            entry['histogram'].observe(seconds)
+            if rows is not None and rows > 0:
+                entry['rows'] += rows
+            if error:
+                entry['errors'] += 1
+
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            self._record_slow(text, sql, seconds, rows, conn, params)
+
+    def _record_slow(self, text, sql, seconds, rows, conn, params):
+        plan = []
+        if conn is not None and sql.lstrip().upper().startswith(_EXPLAINABLE):
+            try:
+                # A plain cursor, so explaining doesn't itself get recorded
+                cursor = conn.cursor(sqlite3.Cursor)
+                plan = [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            except (sqlite3.Error, ValueError, TypeError):
+                plan = []
+        entry = {'query': text, 'seconds': round(seconds, 6), 'rows': rows, 'plan': plan,
+                 'time': time.time()}
+        with self._lock:
+            self._slow.append(entry)
+            self._slow_total += 1
+        logger.warning("Slow query (%.1f ms, %s rows): %s | plan: %s",
+                       seconds * 1000, rows if rows is not None else '?', text, '; '.join(plan))
+
+    def record_request(self, endpoint: str, method: str, status: int, seconds: float):
+        """Record one handled Flask request"""
+        key = (endpoint, method, str(status))
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def connection_factory(self):
+        """sqlite3.Connection subclass whose statements are recorded here"""
+        return type('InstrumentedConnection', (InstrumentedConnection,), {'metrics': self})
+
+    def query_stats(self) -> List[Dict[str, Any]]:
+        """Per-statement counters, slowest total time first"""
+        with self._lock:
+            stats = [{
+                'query': text,
+                'count': entry['histogram'].count,
+                'total_seconds': entry['histogram'].total,
+                'mean_ms': entry['histogram'].total / entry['histogram'].count * 1000,
+                'max_ms': entry['histogram'].maximum * 1000,
+                'rows': entry['rows'],
+                'errors': entry['errors'],
+            } for text, entry in self._queries.items()]
+        return sorted(stats, key=lambda s: s['total_seconds'], reverse=True)
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """Most recent slow statements, newest last"""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._queries.clear()
+            self._requests.clear()
+            self._slow.clear()
+            self._slow_total = 0
+
+    def prometheus(self, gauges: Dict[str, Dict[str, Any]] = None) -> str:
+        """Render metrics in the Prometheus text exposition format.
+
+        gauges maps a metric prefix to a dict of numeric stats (e.g. pool or
+        cache counters), exported as tutoring_<prefix>_<name>.
+        """
+        lines = []
+        with self._lock:
+            lines += _histogram_lines(
+                'tutoring_sql_query_duration_seconds', "Time spent running each normalized SQL statement",
+                [({'query': text}, entry['histogram']) for text, entry in self._queries.items()])
+            lines.append("# HELP tutoring_sql_query_rows_total Rows returned or changed per normalized statement")
+            lines.append("# TYPE tutoring_sql_query_rows_total counter")
+            for text, entry in self._queries.items():
+                lines.append(f"tutoring_sql_query_rows_total{_labels({'query': text})} {entry['rows']}")
+            lines.append("# HELP tutoring_sql_query_errors_total Statements that raised an error")
+            lines.append("# TYPE tutoring_sql_query_errors_total counter")
+            for text, entry in self._queries.items():
+                lines.append(f"tutoring_sql_query_errors_total{_labels({'query': text})} {entry['errors']}")
+            lines.append("# HELP tutoring_sql_slow_queries_total Statements slower than the slow-query threshold")
+            lines.append("# TYPE tutoring_sql_slow_queries_total counter")
+            lines.append(f"tutoring_sql_slow_queries_total {self._slow_total}")
+            lines += _histogram_lines(
+                'tutoring_http_request_duration_seconds', "Flask request latency by route",
+                [({'endpoint': endpoint, 'method': method, 'status': status}, histogram)
+                 for (endpoint, method, status), histogram in self._requests.items()])
+
+        for prefix, stats in (gauges or {}).items():
+            for name, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"tutoring_{prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram_lines(name: str, help_text: str, series: list) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in series:
+        for bound, count in histogram.cumulative():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement from execute until its rows are consumed"""
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self.connection.metrics.record_query(sql, time.perf_counter() - started, error=True)
+            raise
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            # Writes and DDL are done once execute returns
+            self.connection.metrics.record_query(sql, elapsed, self.rowcount,
+                                                 conn=self.connection, params=parameters)
+        else:
+            self._sql, self._params, self._elapsed, self._rows = sql, parameters, elapsed, 0
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except Exception:
+            self.connection.metrics.record_query(sql, time.perf_counter() - started, error=True)
+            raise
+        self.connection.metrics.record_query(sql, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            if row is None:
+                self._finish()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._sql is not None:
+                self._elapsed += time.perf_counter() - started
+                self._finish()
+            raise
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        """Record the pending SELECT, if any, explaining it if slow"""
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        self.connection.metrics.record_query(sql, self._elapsed, self._rows,
+                                             conn=self.connection, params=self._params)
+
+    def __del__(self):
+        # A cursor dropped before its rows ran out (e.g. after one fetchone) is
+        # recorded here, but without a plan: by now its connection may be back
+        # in the pool and in use by another thread, so it must not be touched
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        try:
+            self.connection.metrics.record_query(sql, self._elapsed, self._rows)
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements run through InstrumentedCursor"""
+
+    metrics = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,466 @@
+"""
+Background jobs for the tutoring payment manager
+Slow work - invoice runs, exports, snapshot syncs - is queued in the jobs
+table (migration 8) with TutoringPaymentManager.enqueue_job() and run by a
+JobRunner: a few threads in the web process, or `python payment_manager.py
+worker` on its own. The runner also queues the SCHEDULE (hourly snapshot
+sync, month-end invoices and package rollover) and can keep the web
+process's report cache warm, so heavy reads are done before anyone asks
+"""
+
+import importlib.util
+import json
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import aggregates
+import data_export
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+# A running job whose worker hasn't finished it within this long is assumed dead and queued again
+LEASE_SECONDS = 1800
+
+# Failed attempts are retried after 30s, 60s, 120s... up to the job's max_attempts
+RETRY_SECONDS = 30
+
+# Errors that retrying won't fix (bad parameters, missing rows)
+PERMANENT_ERRORS = (ValueError, LookupError, TypeError)
+
+# Finished jobs (and their export files) are deleted after this long
+RETENTION_HOURS = 24
+
+# Seconds between schedule checks, and between purges of finished jobs
+SCHEDULE_TICK = 30
+PURGE_EVERY = 3600
+
+# Month-end invoices run from this hour on the first night after the month ends
+INVOICE_HOUR = 2
+
+
+def month(value) -> str:
+    """A "YYYY-MM" month parameter"""
+    value = str(value)
+    datetime.strptime(value, '%Y-%m')
+    if len(value) != 7:
+        raise ValueError(f"Month must be in YYYY-MM format: {value!r}")
+    return value
+
+
+def iso_date(value) -> str:
+    """A "YYYY-MM-DD" date parameter"""
+    return date.fromisoformat(str(value)).isoformat()
+
+
+def flag(value) -> bool:
+    """A yes/no parameter (true/false, 1/0, yes/no, on/off)"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"Not a yes/no value: {value!r}")
+
+
+def choice(options):
+    """A parameter limited to options"""
+    def parse(value):
+        if value not in options:
+            raise ValueError(f"Must be one of {', '.join(options)}")
+        return value
+    return parse
+
+
+def output_dir(pm, name: str) -> str:
+    """Folder for a job kind's files, next to the database (e.g. tutoring_payments_exports/)"""
+    return os.path.splitext(pm.db_path)[0] + f'_{name}'
+
+
+def run_invoice(pm, student_id: int, month_year: str) -> Dict[str, Any]:
+    invoice = pm.generate_invoice_data(student_id, month_year)
+    if invoice is None:
+        raise LookupError(f"No student with id {student_id}")
+    return invoice
+
+
+def run_invoices(pm, month_year: str, write: bool = True) -> Dict[str, Any]:
+    """Every student's invoice for a month: written to files, or returned with write=False"""
+    invoices = pm.generate_invoices(month_year)
+    result = {
+        'month_year': month_year,
+        'count': len(invoices),
+        'balance_due': round(sum(invoice['summary']['balance_due'] for invoice in invoices.values()), 2),
+    }
+    if write:
+        result['output_dir'] = os.path.join(output_dir(pm, 'invoices'), month_year)
+        result['files'] = len(pm.write_invoices(invoices, result['output_dir']))
+    else:
+        result['invoices'] = list(invoices.values())
+    return result
+
+
+def run_export(pm, table: str, format: str = 'csv', start_date: str = None,
+               end_date: str = None) -> Dict[str, Any]:
+    """Export to a file under the exports folder; the result names it for download"""
+    folder = output_dir(pm, 'exports')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{table}_{datetime.now():%Y%m%d_%H%M%S_%f}.{format}")
+    rows = pm.export_data(table, path, format, start_date=start_date, end_date=end_date)
+    return {'path': path, 'format': format, 'rows': rows}
+
+
+def run_snapshot(pm, full: bool = False) -> Dict[str, Any]:
+    return pm.sync_snapshot(full)
+
+
+def run_rollover(pm, month_year: str = None) -> Dict[str, int]:
+    return pm.roll_over_packages(month_year)
+
+
+# kind -> (function(pm, **params), {parameter: (type, minimum, maximum)}, required parameters)
+JOB_KINDS = {
+    'invoice': (run_invoice, {'student_id': (int, 1, None), 'month_year': (month, None, None)},
+                ('student_id', 'month_year')),
+    'invoices': (run_invoices, {'month_year': (month, None, None), 'write': (flag, None, None)},
+                 ('month_year',)),
+    'export': (run_export, {'table': (choice(sorted(data_export.EXPORT_SOURCES)), None, None),
+                            'format': (choice(data_export.EXPORT_FORMATS), None, None),
+                            'start_date': (iso_date, None, None),
+                            'end_date': (iso_date, None, None)},
+               ('table',)),
+    'snapshot': (run_snapshot, {'full': (flag, None, None)}, ()),
+    'rollover': (run_rollover, {'month_year': (month, None, None)}, ()),
+}
+
+
+def check_params(kind: str, params: Dict[str, Any], kinds: Dict[str, tuple] = None) -> Dict[str, Any]:
+    """Typed keyword arguments for a job of kind, or ValueError/LookupError"""
+    kinds = JOB_KINDS if kinds is None else kinds
+    if kind not in kinds:
+        raise LookupError(f"No job kind '{kind}' (choose from {', '.join(kinds)})")
+    _, spec, required = kinds[kind]
+    params = params or {}
+    if not isinstance(params, dict):
+        raise ValueError("Job parameters must be a name -> value mapping")
+    unknown = sorted(set(params) - set(spec))
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) for {kind} jobs: {', '.join(unknown)}")
+    kwargs = aggregates.parse_params(spec, params)
+    missing = [param for param in required if param not in kwargs]
+    if missing:
+        raise ValueError(f"{kind} jobs need: {', '.join(missing)}")
+    return kwargs
+
+
+# Scheduled jobs: name -> (kind, due(now) -> (slot, params) or None when not due).
+# A slot is the period a run covers; each name runs once per slot, however many
+# workers are checking, and slots are compared as strings, so they must sort.
+def hourly_snapshot(now: datetime) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if importlib.util.find_spec('pyarrow') is None:
+        return None
+    return now.strftime('%Y-%m-%d %H'), {}
+
+
+def month_end_invoices(now: datetime) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if now.day == 1 and now.hour < INVOICE_HOUR:
+        return None
+    previous = (now.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    return previous, {'month_year': previous}
+
+
+def package_rollover(now: datetime) -> Optional[Tuple[str, Dict[str, Any]]]:
+    current = now.strftime('%Y-%m')
+    return current, {'month_year': current}
+
+
+SCHEDULE = {
+    'snapshot_sync': ('snapshot', hourly_snapshot),
+    'month_end_invoices': ('invoices', month_end_invoices),
+    'package_rollover': ('rollover', package_rollover),
+}
+
+
+# Queue operations on a connection (the manager runs the writes through _write)
+
+def insert_job(conn, kind: str, params: Dict[str, Any], delay_seconds: float = 0,
+               max_attempts: int = 3, runner: str = None) -> int:
+    return conn.execute("""
+        INSERT INTO jobs (kind, params, runner, max_attempts, run_after)
+        VALUES (?, ?, ?, ?, datetime('now', ?))
+    """, (kind, json.dumps(params), runner, max_attempts, f"+{int(delay_seconds)} seconds")).lastrowid
+
+
+def find_pending(conn, kind: str, params: Dict[str, Any]) -> Optional[int]:
+    """The newest queued or running job with exactly these params, if any"""
+    row = conn.execute("""
+        SELECT id FROM jobs
+        WHERE status IN ('queued', 'running') AND kind = ? AND params = ?
+        ORDER BY id DESC LIMIT 1
+    """, (kind, json.dumps(params))).fetchone()
+    return row[0] if row else None
+
+
+def has_due(conn, runner: str = None) -> bool:
+    """Whether any job is ready to claim (a read, so idle workers poll without writing)"""
+    return conn.execute("""
+        SELECT 1 FROM jobs
+        WHERE status = 'queued' AND run_after <= datetime('now') AND (runner IS NULL OR runner = ?)
+        LIMIT 1
+    """, (runner,)).fetchone() is not None
+
+
+def claim(conn, worker: str, runner: str = None) -> Optional[Dict[str, Any]]:
+    """Move the oldest due job to running under worker's lease"""
+    rows = conn.execute("""
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+            started_at = CURRENT_TIMESTAMP, lease_until = datetime('now', ?)
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_after <= datetime('now')
+            AND (runner IS NULL OR runner = ?)
+            ORDER BY run_after, id LIMIT 1
+        )
+        RETURNING id, kind, params, runner, attempts, max_attempts
+    """, (worker, f"+{LEASE_SECONDS} seconds", runner)).fetchall()
+    if not rows:
+        return None
+    job_id, kind, params, job_runner, attempts, max_attempts = rows[0]
+    return {'id': job_id, 'kind': kind, 'params': json.loads(params), 'runner': job_runner,
+            'attempts': attempts, 'max_attempts': max_attempts}
+
+
+def complete(conn, job_id: int, worker: str, result: Any) -> bool:
+    return conn.execute("""
+        UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL,
+            finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'running' AND worker = ?
+    """, (json.dumps(result, default=str), job_id, worker)).rowcount > 0
+
+
+def fail(conn, job_id: int, worker: str, error: str, retry_seconds: float = None) -> bool:
+    """Record a failed attempt: queue it again after retry_seconds, or give up"""
+    if retry_seconds is not None:
+        return conn.execute("""
+            UPDATE jobs SET status = 'queued', error = ?, lease_until = NULL,
+                run_after = datetime('now', ?)
+            WHERE id = ? AND status = 'running' AND worker = ?
+        """, (error, f"+{int(retry_seconds)} seconds", job_id, worker)).rowcount > 0
+    return conn.execute("""
+        UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'running' AND worker = ?
+    """, (error, job_id, worker)).rowcount > 0
+
+
+def requeue_expired(conn) -> int:
+    """Queue again (or fail, if out of attempts) jobs whose worker's lease ran out"""
+    return conn.execute("""
+        UPDATE jobs SET
+            status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END,
+            error = 'Worker stopped before finishing (lease expired)', lease_until = NULL
+        WHERE status = 'running' AND lease_until < datetime('now')
+    """).rowcount
+
+
+def queue_scheduled(conn, name: str, kind: str, slot: str, params: Dict[str, Any]) -> Optional[int]:
+    """Queue schedule entry name for slot unless it has been already (or a later slot has)"""
+    claimed = conn.execute("""
+        INSERT INTO job_schedule (name, last_slot) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_slot = excluded.last_slot, queued_at = CURRENT_TIMESTAMP
+        WHERE last_slot < excluded.last_slot
+    """, (name, slot)).rowcount
+    if not claimed:
+        return None
+    job_id = insert_job(conn, kind, params)
+    conn.execute("UPDATE job_schedule SET job_id = ? WHERE name = ?", (job_id, name))
+    return job_id
+
+
+def purge(conn, hours: float = RETENTION_HOURS) -> Tuple[int, List[str]]:
+    """Delete jobs finished more than hours ago, and pinned jobs whose runner
+    never claimed them; returns the number deleted and the export files they leave behind"""
+    cutoff = f"-{int(hours * 3600)} seconds"
+    finished = "status IN ('done', 'failed') AND finished_at < datetime('now', ?)"
+    files = [row[0] for row in conn.execute(f"""
+        SELECT json_extract(result, '$.path') FROM jobs
+        WHERE kind = 'export' AND status = 'done' AND {finished}
+    """, (cutoff,)) if row[0]]
+    deleted = conn.execute(f"""
+        DELETE FROM jobs
+        WHERE ({finished})
+        OR (status = 'queued' AND runner IS NOT NULL AND created_at < datetime('now', ?))
+    """, (cutoff, cutoff)).rowcount
+    return deleted, files
+
+
+def job_dict(row) -> Dict[str, Any]:
+    """A jobs row (sqlite3.Row) as the status dict the APIs return"""
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    if 'result' in job:
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+
+class JobRunner:
+    def __init__(self, pm, workers: int = 2, poll_interval: float = 1.0,
+                 schedule: Dict[str, tuple] = None, warm=None, warm_every: float = None,
+                 name: str = None):
+        """Run queued jobs on `workers` threads and queue scheduled ones.
+
+        schedule defaults to SCHEDULE (pass {} for a runner that only works
+        the queue). warm(pm), if given, is run every warm_every seconds
+        (default: three quarters of the result cache's TTL) as a job pinned
+        to this runner, so it fills this process's cache.
+        """
+        self.pm = pm
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.schedule = SCHEDULE if schedule is None else schedule
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = dict(JOB_KINDS)
+        self.warm_every = None
+        if warm is not None:
+            self.kinds['warm_cache'] = (lambda pm: _timed(warm, pm), {}, ())
+            self.warm_every = warm_every or max(1.0, pm.cache.ttl * 0.75)
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._warm_job = None
+        self._warmed_at = None
+        self._purged_at = None
+        self._stats = {'claimed': 0, 'done': 0, 'retried': 0, 'failed': 0, 'scheduled': 0}
+
+    def start(self) -> 'JobRunner':
+        """Start the worker and scheduler threads (once; later calls do nothing)"""
+        with self._lock:
+            if self._threads:
+                return self
+            self._stop.clear()
+            for n in range(self.workers):
+                self._threads.append(threading.Thread(
+                    target=self._work, args=(f"{self.name}/{n}",), name=f'job-worker-{n}', daemon=True))
+            self._threads.append(threading.Thread(target=self._plan, name='job-scheduler', daemon=True))
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def stop(self):
+        """Stop taking jobs and wait for the ones running to finish"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join()
+
+    def notify(self):
+        """Wake idle workers now (after queueing a job in this process)"""
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, workers=self.workers, running=bool(self._threads))
+
+    def run_pending(self, worker: str = None) -> int:
+        """Run due jobs on the calling thread until none are left; returns how many ran"""
+        worker = worker or f"{self.name}/main"
+        count = 0
+        while True:
+            job = self._claim(worker)
+            if job is None:
+                return count
+            self._run(job, worker)
+            count += 1
+
+    def tick(self, now: datetime = None) -> List[int]:
+        """Queue whatever is due: expired leases, SCHEDULE entries and cache warming"""
+        now = now or datetime.now()
+        queued = self.pm.schedule_jobs(self.schedule, now)
+
+        if self.warm_every is not None:
+            started = time.monotonic()
+            warm = self.pm.get_job(self._warm_job) if self._warm_job else None
+            idle = warm is None or warm['status'] in ('done', 'failed')
+            if idle and (self._warmed_at is None or started - self._warmed_at >= self.warm_every):
+                self._warm_job = self.pm.enqueue_job('warm_cache', max_attempts=1, runner=self.name,
+                                                     kinds=self.kinds)
+                self._warmed_at = started
+                queued.append(self._warm_job)
+
+        if self._purged_at is None or time.monotonic() - self._purged_at >= PURGE_EVERY:
+            self.pm.purge_jobs()
+            self._purged_at = time.monotonic()
+
+        if queued:
+            with self._lock:
+                self._stats['scheduled'] += len(queued)
+            self._wake.set()
+        return queued
+
+    def _plan(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Job scheduler error: {type(e).__name__}: {e}")
+            self._stop.wait(min(SCHEDULE_TICK, self.warm_every or SCHEDULE_TICK))
+
+    def _work(self, worker: str):
+        while not self._stop.is_set():
+            try:
+                job = self._claim(worker)
+            except Exception as e:
+                print(f"Job worker {worker} error: {type(e).__name__}: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job, worker)
+
+    def _claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        if not self.pm.has_due_jobs(self.name):
+            return None
+        job = self.pm.claim_job(worker, self.name)
+        if job is not None:
+            with self._lock:
+                self._stats['claimed'] += 1
+        return job
+
+    def _run(self, job: Dict[str, Any], worker: str):
+        started = time.perf_counter()
+        label = f"Job {job['id']} ({job['kind']})"
+        try:
+            function = self.kinds[job['kind']][0]
+            # Checked again here: the job may have been queued by an older version
+            result = function(self.pm, **check_params(job['kind'], job['params'], self.kinds))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retry = not isinstance(e, PERMANENT_ERRORS) and job['attempts'] < job['max_attempts']
+            delay = RETRY_SECONDS * 2 ** (job['attempts'] - 1) if retry else None
+            self.pm.fail_job(job['id'], worker, error, delay)
+            with self._lock:
+                self._stats['retried' if retry else 'failed'] += 1
+            print(f"{label} failed (attempt {job['attempts']}/{job['max_attempts']}): {error}"
+                  + (f"; retrying in {delay}s" if retry else ""))
+            return
+        self.pm.finish_job(job['id'], worker, result)
+        with self._lock:
+            self._stats['done'] += 1
+        if job['runner'] is None:
+            print(f"{label} done in {time.perf_counter() - started:.2f}s")
+
+
+def _timed(function, pm) -> Dict[str, float]:
+    started = time.perf_counter()
+    function(pm)
+    return {'seconds': round(time.perf_counter() - started, 3)}
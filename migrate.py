@@ -0,0 +1,93 @@
+"""
+Versioned schema migrations for the tutoring payments database
+The applied version lives in PRAGMA user_version; each numbered migration
+runs once, in order, inside its own transaction
+"""
+
+import os
+import sqlite3
+from typing import List, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (version, description, SQL file) in application order. Never edit an applied
+# migration - add a new one. Version 1 is the original idempotent schema script,
+# which also upgrades databases created before versioning existed.
+MIGRATIONS = [
+    (1, "baseline schema", 'tutoring_payments.sql'),
+    (2, "indexes for the manager's query shapes", os.path.join('migrations', '0002_query_indexes.sql')),
+    (3, "full-text search index", os.path.join('migrations', '0003_search_index.sql')),
+    (4, "per-table data versions", os.path.join('migrations', '0004_table_versions.sql')),
+    (5, "daily revenue rollup for dashboard aggregates",
+     os.path.join('migrations', '0005_daily_revenue_rollup.sql')),
+    (6, "package billing for Weekly and Intensive students",
+     os.path.join('migrations', '0006_package_billing.sql')),
+    (7, "change tracking for the analytics snapshot",
+     os.path.join('migrations', '0007_snapshot_changes.sql')),
+    (8, "background jobs", os.path.join('migrations', '0008_jobs.sql')),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Schema version recorded in the database file (0 if never migrated)"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending_migrations(conn: sqlite3.Connection) -> List[Tuple[int, str, str]]:
+    """Migrations newer than the database's recorded version"""
+    version = current_version(conn)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def _statements(script: str):
+    """Split a migration script into single statements (trigger bodies included)"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+    if statement.strip():
+        yield statement
+
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """Apply every pending migration in order; returns the versions applied.
+
+    Each migration takes the write lock (BEGIN IMMEDIATE) and re-reads the
+    recorded version under it, so when several processes start against the
+    same file only one applies a given migration and the others skip it.
+    """
+    applied = []
+    # executescript would commit our BEGIN IMMEDIATE before running, dropping
+    # the lock, so statements run one at a time with no implicit transactions
+    isolation_level = conn.isolation_level
+    if conn.in_transaction:
+        conn.commit()
+    conn.isolation_level = None
+    try:
+        for version, description, file_name in pending_migrations(conn):
+            with open(os.path.join(BASE_DIR, file_name), 'r') as f:
+                script = f.read()
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) >= version:
+                    # Another process got here first; never move the version back
+                    conn.execute("ROLLBACK")
+                    continue
+                for statement in _statements(script):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            print(f"Applied migration {version}: {description}")
+            applied.append(version)
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
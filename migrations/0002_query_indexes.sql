@@ -0,0 +1,24 @@
+-- Migration 2: indexes shaped after the manager's actual queries
+
+-- get_students(): active students ordered by name, without a sort step
+CREATE INDEX IF NOT EXISTS idx_students_active_name ON students(name) WHERE is_active = 1;
+-- Listing every student (invoice runs, active_only=False) in name order
+CREATE INDEX IF NOT EXISTS idx_students_name ON students(name);
+-- Duplicates the index SQLite already keeps for UNIQUE(email)
+DROP INDEX IF EXISTS idx_students_email;
+
+-- get_sessions(student_id=...): newest-first within one student, no sort step
+-- (supersedes idx_sessions_student_date, which is its prefix)
+CREATE INDEX IF NOT EXISTS idx_sessions_student_date_time ON sessions(student_id, session_date, start_time);
+DROP INDEX IF EXISTS idx_sessions_student_date;
+
+-- get_sessions(status=...): seek to one status and walk it in page order;
+-- also serves the monthly_revenue view's status = 'Completed' filter
+CREATE INDEX IF NOT EXISTS idx_sessions_status_date_time ON sessions(status, session_date, start_time);
+
+-- student_balance view and balance rebuilds: per-student completed totals,
+-- covering so the sessions table itself is never read
+CREATE INDEX IF NOT EXISTS idx_sessions_status_student ON sessions(status, student_id, session_cost);
+
+-- get_payments(payment_method=...): seek to one method, newest first
+CREATE INDEX IF NOT EXISTS idx_payments_method_date ON payments(payment_method, payment_date);
@@ -0,0 +1,101 @@
+-- Migration 3: full-text search over students, sessions and payments
+
+-- One FTS5 index for all three tables so a single query ranks them together.
+-- Each entry's rowid is the source row's id * 4 + a kind code (1 student,
+-- 2 session, 3 payment), so triggers reach their entry without a lookup.
+--   students: title = name,             detail = email, parent_name
+--   sessions: title = subject,          detail = notes
+--   payments: title = reference_number, detail = notes
+-- tags holds the kind and an "s<student id>" token, so filtering by either is
+-- a doclist intersection inside the index rather than a check on every match.
+-- prefix = '2 3' keeps short prefix queries ("ca*") off the slow path.
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title, detail, tags, kind UNINDEXED, student_id UNINDEXED,
+    prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- A match in the title counts for more than one in the notes; tags never count
+INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(5.0, 1.0, 0.0)');
+
+-- Backfill existing rows. FTS5 ignores OR IGNORE, so rows already indexed are
+-- skipped explicitly and the migration can run again without a rowid clash
+INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+SELECT id * 4 + 1, name, email || COALESCE(' ' || parent_name, ''), 'student s' || id, 'student', id
+FROM students
+WHERE id * 4 + 1 NOT IN (SELECT rowid FROM search_index);
+
+INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+SELECT id * 4 + 2, subject, notes, 'session s' || student_id, 'session', student_id
+FROM sessions
+WHERE id * 4 + 2 NOT IN (SELECT rowid FROM search_index);
+
+INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+SELECT id * 4 + 3, reference_number, notes, 'payment s' || student_id, 'payment', student_id
+FROM payments
+WHERE id * 4 + 3 NOT IN (SELECT rowid FROM search_index);
+
+-- Keep the index in step with every insert, edit and delete
+CREATE TRIGGER IF NOT EXISTS trg_search_student_insert
+AFTER INSERT ON students
+BEGIN
+    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+    VALUES (new.id * 4 + 1, new.name, new.email || COALESCE(' ' || new.parent_name, ''),
+            'student s' || new.id, 'student', new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_student_update
+AFTER UPDATE OF name, email, parent_name ON students
+BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+    VALUES (new.id * 4 + 1, new.name, new.email || COALESCE(' ' || new.parent_name, ''),
+            'student s' || new.id, 'student', new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_student_delete
+AFTER DELETE ON students
+BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_session_insert
+AFTER INSERT ON sessions
+BEGIN
+    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+    VALUES (new.id * 4 + 2, new.subject, new.notes, 'session s' || new.student_id, 'session', new.student_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_session_update
+AFTER UPDATE OF subject, notes, student_id ON sessions
+BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 2;
+    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+    VALUES (new.id * 4 + 2, new.subject, new.notes, 'session s' || new.student_id, 'session', new.student_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_session_delete
+AFTER DELETE ON sessions
+BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 2;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_payment_insert
+AFTER INSERT ON payments
+BEGIN
+    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+    VALUES (new.id * 4 + 3, new.reference_number, new.notes, 'payment s' || new.student_id, 'payment', new.student_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_payment_update
+AFTER UPDATE OF reference_number, notes, student_id ON payments
+BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 3;
+    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+    VALUES (new.id * 4 + 3, new.reference_number, new.notes, 'payment s' || new.student_id, 'payment', new.student_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_payment_delete
+AFTER DELETE ON payments
+BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 3;
+END;
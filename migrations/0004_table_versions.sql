@@ -0,0 +1,86 @@
+-- Migration 4: per-table data versions for HTTP caching (ETag / Last-Modified)
+
+-- One row per base table, bumped by triggers on every insert, update and
+-- delete. Living in the database (rather than in one process's memory) means
+-- writes from the CLI, an import or another web worker change the version too.
+-- The rollup and balance tables are derived from these, so they need no row.
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    modified_at DATETIME DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO table_versions (table_name)
+VALUES ('students'), ('sessions'), ('payments'), ('monthly_packages');
+
+CREATE TRIGGER IF NOT EXISTS trg_version_students_insert AFTER INSERT ON students
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'students';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_students_update AFTER UPDATE ON students
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'students';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_students_delete AFTER DELETE ON students
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'students';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_sessions_insert AFTER INSERT ON sessions
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'sessions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_sessions_update AFTER UPDATE ON sessions
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'sessions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_sessions_delete AFTER DELETE ON sessions
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'sessions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_payments_insert AFTER INSERT ON payments
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'payments';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_payments_update AFTER UPDATE ON payments
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'payments';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_payments_delete AFTER DELETE ON payments
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'payments';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_packages_insert AFTER INSERT ON monthly_packages
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'monthly_packages';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_packages_update AFTER UPDATE ON monthly_packages
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'monthly_packages';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_version_packages_delete AFTER DELETE ON monthly_packages
+BEGIN
+    UPDATE table_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP
+    WHERE table_name = 'monthly_packages';
+END;
@@ -0,0 +1,67 @@
+-- Migration 5: rollups and indexes for the dashboard aggregates
+
+-- Completed-session totals per day and subject, kept current by triggers like
+-- the monthly rollups. Revenue by subject, by weekday and as a daily series
+-- then read a few thousand rollup rows instead of every session.
+CREATE TABLE IF NOT EXISTS daily_revenue_rollup (
+    day DATE NOT NULL,
+    subject TEXT NOT NULL,
+    sessions_completed INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(10,2) NOT NULL DEFAULT 0,
+    total_hours DECIMAL(10,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, subject)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_rollup_session_insert
+AFTER INSERT ON sessions
+WHEN NEW.status = 'Completed'
+BEGIN
+    INSERT INTO daily_revenue_rollup (day, subject, sessions_completed, revenue, total_hours)
+    VALUES (NEW.session_date, NEW.subject, 1, NEW.session_cost, NEW.duration_hours)
+    ON CONFLICT(day, subject) DO UPDATE SET
+        sessions_completed = sessions_completed + 1,
+        revenue = ROUND(revenue + excluded.revenue, 2),
+        total_hours = ROUND(total_hours + excluded.total_hours, 2);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_rollup_session_update
+AFTER UPDATE OF status, session_date, subject, session_cost, duration_hours ON sessions
+WHEN OLD.status = 'Completed' OR NEW.status = 'Completed'
+BEGIN
+    UPDATE daily_revenue_rollup
+    SET sessions_completed = sessions_completed - 1,
+        revenue = ROUND(revenue - OLD.session_cost, 2),
+        total_hours = ROUND(total_hours - OLD.duration_hours, 2)
+    WHERE day = OLD.session_date AND subject = OLD.subject AND OLD.status = 'Completed';
+    INSERT INTO daily_revenue_rollup (day, subject, sessions_completed, revenue, total_hours)
+    SELECT NEW.session_date, NEW.subject, 1, NEW.session_cost, NEW.duration_hours
+    WHERE NEW.status = 'Completed'
+    ON CONFLICT(day, subject) DO UPDATE SET
+        sessions_completed = sessions_completed + 1,
+        revenue = ROUND(revenue + excluded.revenue, 2),
+        total_hours = ROUND(total_hours + excluded.total_hours, 2);
+    DELETE FROM daily_revenue_rollup
+    WHERE day = OLD.session_date AND subject = OLD.subject AND sessions_completed <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_rollup_session_delete
+AFTER DELETE ON sessions
+WHEN OLD.status = 'Completed'
+BEGIN
+    UPDATE daily_revenue_rollup
+    SET sessions_completed = sessions_completed - 1,
+        revenue = ROUND(revenue - OLD.session_cost, 2),
+        total_hours = ROUND(total_hours - OLD.duration_hours, 2)
+    WHERE day = OLD.session_date AND subject = OLD.subject;
+    DELETE FROM daily_revenue_rollup
+    WHERE day = OLD.session_date AND subject = OLD.subject AND sessions_completed <= 0;
+END;
+
+INSERT OR IGNORE INTO daily_revenue_rollup (day, subject, sessions_completed, revenue, total_hours)
+SELECT session_date, subject, COUNT(*), ROUND(SUM(session_cost), 2), ROUND(SUM(duration_hours), 2)
+FROM sessions
+WHERE status = 'Completed'
+GROUP BY session_date, subject;
+
+-- Top-N outstanding balances: walk students in balance order and stop at N
+CREATE INDEX IF NOT EXISTS idx_student_balances_due ON student_balances((total_owed - total_paid));
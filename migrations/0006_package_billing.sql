@@ -0,0 +1,187 @@
+-- Migration 6: package billing for Weekly and Intensive students
+
+-- A monthly package is billed as a whole: its price, plus any completed
+-- sessions beyond total_sessions at the package's per-session rate
+-- (package_cost / total_sessions). Completed sessions in a month the student
+-- has a package for count towards it instead of being billed one by one.
+-- completed_sessions and student_balances follow every session change through
+-- the triggers below, so nothing is recounted when a session is marked done.
+--
+-- charge(p) = ROUND(p.package_cost + MAX(0, p.completed_sessions - p.total_sessions)
+--                   * ROUND(p.package_cost * 1.0 / MAX(p.total_sessions, 1), 2), 2)
+
+-- Counts for any packages entered by hand before the billing engine existed
+-- (set before the triggers exist, so balances are recomputed once below)
+UPDATE monthly_packages
+SET completed_sessions = (
+    SELECT COUNT(*) FROM sessions s
+    WHERE s.student_id = monthly_packages.student_id AND s.status = 'Completed'
+      AND s.session_date >= monthly_packages.month_year || '-01'
+      AND s.session_date < date(monthly_packages.month_year || '-01', '+1 month')
+);
+
+-- Sessions: bill per session unless the month has a package, in which case
+-- move its completed count (the package triggers then adjust the balance)
+DROP TRIGGER IF EXISTS trg_balance_session_insert;
+CREATE TRIGGER trg_balance_session_insert
+AFTER INSERT ON sessions
+WHEN NEW.status = 'Completed'
+BEGIN
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed + NEW.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id AND NOT EXISTS (
+        SELECT 1 FROM monthly_packages p
+        WHERE p.student_id = NEW.student_id AND p.month_year = strftime('%Y-%m', NEW.session_date));
+    UPDATE monthly_packages SET completed_sessions = completed_sessions + 1
+    WHERE student_id = NEW.student_id AND month_year = strftime('%Y-%m', NEW.session_date);
+END;
+
+DROP TRIGGER IF EXISTS trg_balance_session_update;
+CREATE TRIGGER trg_balance_session_update
+AFTER UPDATE OF status, session_cost, student_id, session_date ON sessions
+WHEN OLD.status = 'Completed' OR NEW.status = 'Completed'
+BEGIN
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed - OLD.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id AND OLD.status = 'Completed' AND NOT EXISTS (
+        SELECT 1 FROM monthly_packages p
+        WHERE p.student_id = OLD.student_id AND p.month_year = strftime('%Y-%m', OLD.session_date));
+    UPDATE monthly_packages SET completed_sessions = completed_sessions - 1
+    WHERE student_id = OLD.student_id AND month_year = strftime('%Y-%m', OLD.session_date)
+      AND OLD.status = 'Completed';
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed + NEW.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id AND NEW.status = 'Completed' AND NOT EXISTS (
+        SELECT 1 FROM monthly_packages p
+        WHERE p.student_id = NEW.student_id AND p.month_year = strftime('%Y-%m', NEW.session_date));
+    UPDATE monthly_packages SET completed_sessions = completed_sessions + 1
+    WHERE student_id = NEW.student_id AND month_year = strftime('%Y-%m', NEW.session_date)
+      AND NEW.status = 'Completed';
+END;
+
+DROP TRIGGER IF EXISTS trg_balance_session_delete;
+CREATE TRIGGER trg_balance_session_delete
+AFTER DELETE ON sessions
+WHEN OLD.status = 'Completed'
+BEGIN
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed - OLD.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id AND NOT EXISTS (
+        SELECT 1 FROM monthly_packages p
+        WHERE p.student_id = OLD.student_id AND p.month_year = strftime('%Y-%m', OLD.session_date));
+    UPDATE monthly_packages SET completed_sessions = completed_sessions - 1
+    WHERE student_id = OLD.student_id AND month_year = strftime('%Y-%m', OLD.session_date);
+END;
+
+-- Packages: a new package takes over the month's completed sessions (which
+-- were billed one by one until now) and charges its own price instead
+CREATE TRIGGER IF NOT EXISTS trg_balance_package_insert
+AFTER INSERT ON monthly_packages
+BEGIN
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed
+            + NEW.package_cost + MAX(0, NEW.completed_sessions - NEW.total_sessions)
+              * ROUND(NEW.package_cost * 1.0 / MAX(NEW.total_sessions, 1), 2)
+            - COALESCE((
+                SELECT SUM(session_cost) FROM sessions
+                WHERE student_id = NEW.student_id AND status = 'Completed'
+                  AND session_date >= NEW.month_year || '-01'
+                  AND session_date < date(NEW.month_year || '-01', '+1 month')), 0), 2),
+        updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id;
+    UPDATE monthly_packages
+    SET completed_sessions = (
+        SELECT COUNT(*) FROM sessions
+        WHERE student_id = NEW.student_id AND status = 'Completed'
+          AND session_date >= NEW.month_year || '-01'
+          AND session_date < date(NEW.month_year || '-01', '+1 month'))
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_package_update
+AFTER UPDATE OF package_cost, total_sessions, completed_sessions ON monthly_packages
+BEGIN
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed
+            + NEW.package_cost + MAX(0, NEW.completed_sessions - NEW.total_sessions)
+              * ROUND(NEW.package_cost * 1.0 / MAX(NEW.total_sessions, 1), 2)
+            - OLD.package_cost - MAX(0, OLD.completed_sessions - OLD.total_sessions)
+              * ROUND(OLD.package_cost * 1.0 / MAX(OLD.total_sessions, 1), 2), 2),
+        updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_package_delete
+AFTER DELETE ON monthly_packages
+BEGIN
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed
+            - OLD.package_cost - MAX(0, OLD.completed_sessions - OLD.total_sessions)
+              * ROUND(OLD.package_cost * 1.0 / MAX(OLD.total_sessions, 1), 2)
+            + COALESCE((
+                SELECT SUM(session_cost) FROM sessions
+                WHERE student_id = OLD.student_id AND status = 'Completed'
+                  AND session_date >= OLD.month_year || '-01'
+                  AND session_date < date(OLD.month_year || '-01', '+1 month')), 0), 2),
+        updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id;
+END;
+
+-- Moving a package to another student or month would need both months
+-- re-billed; delete it and create the new one instead
+CREATE TRIGGER IF NOT EXISTS trg_package_move
+BEFORE UPDATE OF student_id, month_year ON monthly_packages
+WHEN NEW.student_id != OLD.student_id OR NEW.month_year != OLD.month_year
+BEGIN
+    SELECT RAISE(ABORT, 'Packages cannot be moved; delete the package and create a new one');
+END;
+
+-- A month's packages (invoicing, listings) and the unpaid ones (month-end settle pass)
+CREATE INDEX IF NOT EXISTS idx_monthly_packages_month ON monthly_packages(month_year);
+CREATE INDEX IF NOT EXISTS idx_monthly_packages_unpaid ON monthly_packages(student_id) WHERE is_paid = 0;
+
+-- Ledger view: the same billing rules computed from scratch (used to verify student_balances)
+DROP VIEW IF EXISTS student_balance;
+CREATE VIEW student_balance AS
+SELECT
+    s.id,
+    s.name,
+    s.email,
+    ROUND(COALESCE(o.total_owed, 0) + COALESCE(k.total_owed, 0), 2) as total_owed,
+    COALESCE(p.total_paid, 0) as total_paid,
+    ROUND(COALESCE(o.total_owed, 0) + COALESCE(k.total_owed, 0) - COALESCE(p.total_paid, 0), 2) as balance_due
+FROM students s
+LEFT JOIN (
+    SELECT student_id, SUM(session_cost) as total_owed
+    FROM sessions se
+    WHERE status = 'Completed' AND NOT EXISTS (
+        SELECT 1 FROM monthly_packages mp
+        WHERE mp.student_id = se.student_id AND mp.month_year = strftime('%Y-%m', se.session_date))
+    GROUP BY student_id
+) o ON o.student_id = s.id
+LEFT JOIN (
+    SELECT mp.student_id, SUM(ROUND(mp.package_cost + MAX(0, (
+        SELECT COUNT(*) FROM sessions se
+        WHERE se.student_id = mp.student_id AND se.status = 'Completed'
+          AND se.session_date >= mp.month_year || '-01'
+          AND se.session_date < date(mp.month_year || '-01', '+1 month')) - mp.total_sessions)
+        * ROUND(mp.package_cost * 1.0 / MAX(mp.total_sessions, 1), 2), 2)) as total_owed
+    FROM monthly_packages mp
+    GROUP BY mp.student_id
+) k ON k.student_id = s.id
+LEFT JOIN (
+    SELECT student_id, SUM(amount) as total_paid
+    FROM payments GROUP BY student_id
+) p ON p.student_id = s.id
+WHERE s.is_active = 1;
+
+-- Re-bill students who already had packages under the rules above (the view
+-- only covers active students; rebuild_balances repairs anyone else)
+UPDATE student_balances
+SET total_owed = (SELECT v.total_owed FROM student_balance v WHERE v.id = student_balances.student_id),
+    updated_date = CURRENT_TIMESTAMP
+WHERE student_id IN (SELECT student_id FROM monthly_packages)
+  AND student_id IN (SELECT id FROM students WHERE is_active = 1);
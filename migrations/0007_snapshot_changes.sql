@@ -0,0 +1,42 @@
+-- Migration 7: change tracking for the columnar analytics snapshot
+
+-- The snapshot (snapshots.py) copies new sessions and payments by id
+-- watermark, which misses rows edited or deleted after they were copied -
+-- a session marked Completed, a payment corrected. These triggers note the
+-- month of every such change, and the next sync rewrites just those month
+-- partitions. version is bumped on every change, so a sync only clears the
+-- marks it actually read.
+CREATE TABLE IF NOT EXISTS snapshot_changes (
+    table_name TEXT NOT NULL,
+    month TEXT NOT NULL, -- Format: "2025-10"
+    version INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (table_name, month)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_snapshot_sessions_update AFTER UPDATE ON sessions
+BEGIN
+    INSERT INTO snapshot_changes (table_name, month)
+    VALUES ('sessions', substr(OLD.session_date, 1, 7)), ('sessions', substr(NEW.session_date, 1, 7))
+    ON CONFLICT(table_name, month) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_snapshot_sessions_delete AFTER DELETE ON sessions
+BEGIN
+    INSERT INTO snapshot_changes (table_name, month)
+    VALUES ('sessions', substr(OLD.session_date, 1, 7))
+    ON CONFLICT(table_name, month) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_snapshot_payments_update AFTER UPDATE ON payments
+BEGIN
+    INSERT INTO snapshot_changes (table_name, month)
+    VALUES ('payments', substr(OLD.payment_date, 1, 7)), ('payments', substr(NEW.payment_date, 1, 7))
+    ON CONFLICT(table_name, month) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_snapshot_payments_delete AFTER DELETE ON payments
+BEGIN
+    INSERT INTO snapshot_changes (table_name, month)
+    VALUES ('payments', substr(OLD.payment_date, 1, 7))
+    ON CONFLICT(table_name, month) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,36 @@
+-- Migration 8: background jobs (jobs.py)
+
+-- Slow work - invoice runs, exports, snapshot syncs - is queued here and run
+-- by a worker pool instead of inside a web request. Workers claim a job by
+-- moving it from queued to running with a lease; a job whose lease runs out
+-- (its worker died) is queued again. runner pins a job to one worker process
+-- (e.g. cache warming for the web process it runs in); NULL means any.
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}', -- JSON keyword arguments
+    status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'running', 'done', 'failed')),
+    runner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    lease_until DATETIME,
+    worker TEXT,
+    result TEXT, -- JSON
+    error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME,
+    finished_at DATETIME
+);
+
+-- Claiming: the oldest due queued job
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after, id);
+
+-- Scheduled jobs: the last period each schedule entry was queued for, so
+-- several worker processes queue a month-end run once between them
+CREATE TABLE IF NOT EXISTS job_schedule (
+    name TEXT PRIMARY KEY,
+    last_slot TEXT NOT NULL,
+    job_id INTEGER,
+    queued_at DATETIME DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
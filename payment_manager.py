@@ -4,82 +4,404 @@ A Python script to manage student payments, sessions, and billing
 """
 
 import sqlite3
-import pandas as pd
-from datetime import datetime, date
-from typing import Optional, List, Dict, Any
+from datetime import datetime, date, timedelta, timezone
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+import argparse
+import base64
+import json
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aggregates
+import billing
+import bulk_import
+import data_export
+import jobs
+import migrate
+import query_plans
+import scheduling
+import snapshots
+from db_pool import ConnectionPool
+from instrumentation import Metrics
+from write_queue import WriteQueue
+from result_cache import ResultCache, cached
+from records import (Student, Session, Payment, Balance, MonthlyRevenue, PaymentMethodSummary,
+                     SearchResult, Package)
+
+# search_index entries by kind: (rowid code, source table, title, detail, student id).
+# Must match the triggers in migrations/0003_search_index.sql
+SEARCH_SOURCES = {
+    'student': (1, 'students', "name", "email || COALESCE(' ' || parent_name, '')", "id"),
+    'session': (2, 'sessions', "subject", "notes", "student_id"),
+    'payment': (3, 'payments', "reference_number", "notes", "student_id"),
+}
+
+SEARCH_WORD = re.compile(r'\w+')
+
+# Status columns of the jobs table (results are only read when asked for)
+JOB_COLUMNS = ("id, kind, params, status, attempts, max_attempts, run_after, worker, error, "
+               "created_at, started_at, finished_at")
+
+
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode a pagination cursor, rejecting anything malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"Invalid pagination cursor: {cursor!r}")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError(f"Invalid pagination cursor: {cursor!r}")
+    return values
+
+
+def month_bounds(month_year: str) -> Tuple[str, str]:
+    """First day of a "YYYY-MM" month and first day of the next, for range seeks"""
+    try:
+        first = datetime.strptime(month_year, '%Y-%m').date()
+    except ValueError:
+        raise ValueError(f"Month must be in YYYY-MM format: {month_year!r}")
+    if first.month == 12:
+        following = first.replace(year=first.year + 1, month=1)
+    else:
+        following = first.replace(month=first.month + 1)
+    return first.isoformat(), following.isoformat()
+
+
+def check_session_status(status: str):
+    """Reject statuses the sessions table's CHECK constraint would refuse"""
+    if status not in bulk_import.SESSION_STATUSES:
+        raise ValueError(f"Invalid session status '{status}' "
+                         f"(expected one of {', '.join(bulk_import.SESSION_STATUSES)})")
+
+
+def search_query(text: str, kind: str = None, student_id: int = None) -> str:
+    """Turn free text into an FTS5 query where every word must match as a prefix.
+    
+    Words only match the title and detail columns; kind and student_id become
+    exact matches on the tags column.
+    """
+    words = SEARCH_WORD.findall(text or '')
+    if not words:
+        raise ValueError("Search text must contain at least one letter or digit")
+    # Quoting each word keeps FTS5 operators and punctuation in user input inert
+    query = '{title detail} : (' + ' '.join(f'"{word}"*' for word in words) + ')'
+    if kind:
+        if kind not in SEARCH_SOURCES:
+            raise ValueError(f"Unknown search kind '{kind}' "
+                             f"(expected one of {', '.join(SEARCH_SOURCES)})")
+        query += f' AND tags : "{kind}"'
+    if student_id:
+        query += f' AND tags : "s{int(student_id)}"'
+    return query
+
+
+def fetch_dicts(conn: sqlite3.Connection, query: str, params: list = ()) -> List[Dict[str, Any]]:
+    """Run a query and return its rows as plain dicts"""
+    cursor = conn.execute(query, params)
+    columns = [desc[0] for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def render_invoice_text(invoice: Dict[str, Any]) -> str:
+    """Format invoice data as a plain-text invoice"""
+    student = invoice['student']
+    summary = invoice['summary']
+    lines = [
+        f"INVOICE - {summary['month']}",
+        f"Student: {student['name']} <{student['email']}>",
+    ]
+    parent = ' '.join(part for part in (student.get('parent_name'), student.get('parent_email')) if part)
+    if parent:
+        lines.append(f"Parent: {parent}")
+    package = invoice.get('package')
+    lines.append("")
+    if package:
+        lines.append(f"Package: {package['package_type']} ({package['total_sessions']} sessions)  "
+                     f"${package['package_cost']:.2f}" + ("  PAID" if package['is_paid'] else ""))
+        if package['payment_due_date']:
+            lines.append(f"Due: {package['payment_due_date']}")
+        lines.append("")
+    lines.append("Sessions:")
+    for number, session in enumerate(invoice['sessions'], 1):
+        # The first total_sessions sessions of a package month are included in its price
+        if package and number <= package['total_sessions']:
+            price = "included"
+        else:
+            price = f"${package['overage_rate'] if package else session['session_cost']:.2f}"
+        lines.append(f"  {session['session_date']}  {session['start_time']}-{session['end_time']}  "
+                     f"{session['subject']:<20} {session['duration_hours']}h  {price}")
+    if not invoice['sessions']:
+        lines.append("  (none)")
+    lines.append("")
+    lines.append("Payments:")
+    for payment in invoice['payments']:
+        lines.append(f"  {payment['payment_date']}  {payment['payment_method'] or '':<14} ${payment['amount']:.2f}")
+    if not invoice['payments']:
+        lines.append("  (none)")
+    lines += [
+        "",
+        f"Total Sessions: {summary['total_sessions']}"
+        + (f" ({package['sessions_used']} of {package['total_sessions']} in package, "
+           f"{package['extra_sessions']} extra)" if package else ""),
+        f"Total Hours: {summary['total_hours']}",
+        f"Amount Owed: ${summary['total_owed']:.2f}",
+        f"Amount Paid: ${summary['total_paid']:.2f}",
+        f"Balance Due: ${summary['balance_due']:.2f}",
+    ]
+    return "\n".join(lines) + "\n"
+
 
 class TutoringPaymentManager:
-    def __init__(self, db_path: str = "tutoring_payments.db"):
-        """Initialize the payment manager with database connection"""
+    def __init__(self, db_path: str = "tutoring_payments.db", pool_size: int = 8,
+                 pool_timeout: float = 30.0, pragmas: Dict[str, Any] = None,
+                 cache_size: int = 256, cache_ttl: float = 60.0, auto_init: bool = True,
+                 instrument: bool = True, slow_query_ms: float = 250.0,
+                 cache: ResultCache = None, metrics: Metrics = None,
+                 group_commit: bool = True, commit_batch: int = 100, commit_delay_ms: float = 0.0,
+                 snapshot_dir: str = None):
+        """Initialize the payment manager with a pool of database connections.
+        
+        With auto_init=False pending migrations are left alone until
+        ensure_schema() or init_database() is called (e.g. once per deployment
+        rather than per worker). With instrument=True every statement is timed
+        into self.metrics, and ones slower than slow_query_ms are logged.
+        Passing cache/metrics shares them with another manager on the same database.
+        With group_commit=True, writes from all threads are funneled through one
+        writer that commits up to commit_batch of them per transaction.
+        The analytics snapshot lives in snapshot_dir (default: next to the
+        database, e.g. tutoring_payments_snapshot/).
+        """
         self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """Initialize the database with schema if it doesn't exist"""
-        if not os.path.exists(self.db_path):
-            # Read and execute the SQL schema
-            with open('tutoring_payments.sql', 'r') as f:
-                schema = f.read()
-            
-            conn = sqlite3.connect(self.db_path)
-            conn.executescript(schema)
-            conn.commit()
-            conn.close()
+        self.snapshot_dir = snapshot_dir or os.path.splitext(db_path)[0] + '_snapshot'
+        self.metrics = metrics or Metrics(slow_query_seconds=slow_query_ms / 1000)
+        factory = self.metrics.connection_factory() if instrument else sqlite3.Connection
+        self.pool = ConnectionPool(db_path, max_size=pool_size, timeout=pool_timeout,
+                                   pragmas=pragmas, factory=factory)
+        self.cache = cache or ResultCache(max_entries=cache_size, ttl=cache_ttl)
+        self.writes = WriteQueue(self.pool.connect, max_batch=commit_batch,
+                                 max_delay=commit_delay_ms / 1000) if group_commit else None
+        if auto_init:
+            self.ensure_schema()
+    
+    def read_only_copy(self, pool_size: int = 8) -> 'TutoringPaymentManager':
+        """A manager on the same database whose pooled connections refuse writes.
+        
+        It shares this manager's cache and metrics, so writes made here still
+        invalidate what readers see.
+        """
+        return TutoringPaymentManager(
+            self.db_path, pool_size=pool_size, pool_timeout=self.pool.timeout,
+            pragmas=dict(self.pool.pragmas, query_only='ON'), auto_init=False,
+            instrument=self.pool.factory is not sqlite3.Connection,
+            cache=self.cache, metrics=self.metrics, group_commit=False,
+            snapshot_dir=self.snapshot_dir,
+        )
+    
+    def schema_version(self) -> int:
+        """Schema version recorded in the database file (0 if never initialized)"""
+        with self.get_connection() as conn:
+            return migrate.current_version(conn)
+    
+    def ensure_schema(self) -> bool:
+        """Apply migrations only if the database is behind migrate.SCHEMA_VERSION.
+        
+        Up-to-date databases cost a single PRAGMA read; returns True if any
+        migration was applied.
+        """
+        if self.schema_version() >= migrate.SCHEMA_VERSION:
+            print(f"Using existing database at {self.db_path}")
+            return False
+        return bool(self.init_database())
+    
+    def init_database(self) -> List[int]:
+        """Create the database, or migrate an existing one to the current schema"""
+        with self.get_connection() as conn:
+            is_new = not conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]
+            applied = migrate.apply_migrations(conn)
+        self.cache.clear()
+        
+        if is_new:
             print(f"Database initialized at {self.db_path}")
+        elif applied:
+            print(f"Database schema updated to version {applied[-1]} at {self.db_path}")
         else:
-            print(f"Using existing database at {self.db_path}")
+            print(f"Database schema already at version {migrate.SCHEMA_VERSION} at {self.db_path}")
+        return applied
+    
+    def check_query_plans(self) -> List[Dict[str, Any]]:
+        """EXPLAIN every read query the manager issues; returns those that plan a full table scan"""
+        first, _ = month_bounds(date.today().strftime('%Y-%m'))
+        month = first[:7]
+        calls = [
+            ('get_students', lambda: self.get_students()),
+            ('get_students(active_only=False)', lambda: self.get_students(active_only=False)),
+            ('get_student_by_email', lambda: self.get_student_by_email('student@example.com')),
+            ('get_sessions', lambda: self.get_sessions(limit=50)),
+            ('get_sessions(student_id)', lambda: self.get_sessions(student_id=1, limit=50)),
+            ('get_sessions(status)', lambda: self.get_sessions(status='Completed', limit=50)),
+            ('get_sessions(dates)', lambda: self.get_sessions(start_date=first, end_date=first, limit=50)),
+            ('get_sessions(cursor)', lambda: self.get_sessions(
+                limit=50, cursor=encode_cursor(first, '12:00', 1))),
+            ('available_slots', lambda: self.available_slots(first, first)),
+            ('get_payments', lambda: self.get_payments(limit=50)),
+            ('get_payments(student_id)', lambda: self.get_payments(student_id=1, limit=50)),
+            ('get_payments(payment_method)', lambda: self.get_payments(payment_method='Cash', limit=50)),
+            ('get_payments(cursor)', lambda: self.get_payments(limit=50, cursor=encode_cursor(first, 1))),
+            ('get_student_balance', lambda: self.get_student_balance()),
+            ('get_student_balance(student_id)', lambda: self.get_student_balance(1)),
+            ('get_student_balance(limit)', lambda: self.get_student_balance(limit=10)),
+            ('get_balance_totals', lambda: self.get_balance_totals()),
+            ('get_top_balances', lambda: self.get_top_balances()),
+            ('get_revenue_by_subject', lambda: self.get_revenue_by_subject()),
+            ('get_revenue_by_weekday', lambda: self.get_revenue_by_weekday()),
+            ('get_daily_revenue', lambda: self.get_daily_revenue()),
+            ('get_revenue_trend', lambda: self.get_revenue_trend()),
+            ('get_monthly_revenue', lambda: self.get_monthly_revenue()),
+            ('get_payment_summary', lambda: self.get_payment_summary()),
+            ('generate_invoices', lambda: self.generate_invoices(month)),
+            ('get_packages(month_year)', lambda: self.get_packages(month)),
+            ('get_packages(student_id)', lambda: self.get_packages(student_id=1)),
+            ('generate_invoices(student_ids)', lambda: self.generate_invoices(month, [1])),
+            ('search', lambda: self.search('calculus')),
+            ('search(kind, student_id)', lambda: self.search('calc', kind='session', student_id=1)),
+            ('get_job', lambda: self.get_job(1, include_result=True)),
+            ('get_jobs(status)', lambda: self.get_jobs(status='queued')),
+            ('has_due_jobs', lambda: self.has_due_jobs('runner')),
+        ]
+        return query_plans.full_scans(query_plans.collect_plans(self, calls))
+    
+    def data_version(self, *tables: str) -> Tuple[str, datetime]:
+        """Version token and last-modified time (UTC) of the data in tables.
+        
+        The counters are bumped by triggers on every write from any process,
+        so an unchanged token means the tables haven't changed. Costs one read
+        of a four-row table, cheap enough to check on every request. Tables
+        whose version moved since the last check are invalidated in the cache,
+        so a fresh token never comes with a result cached before another
+        process's write.
+        """
+        with self.get_connection() as conn:
+            known = {name: (version, modified) for name, version, modified in conn.execute(
+                "SELECT table_name, version, modified_at FROM table_versions")}
+        self.cache.track_versions({name: version for name, (version, _) in known.items()})
+        unknown = [table for table in tables if table not in known]
+        if unknown:
+            raise ValueError(f"No data version kept for: {', '.join(unknown)}")
+        
+        token = '.'.join(str(known[table][0]) for table in tables)
+        modified = max(known[table][1] for table in tables)
+        return token, datetime.strptime(modified, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
     
     def get_connection(self):
-        """Get database connection"""
-        return sqlite3.connect(self.db_path)
+        """Borrow a pooled database connection (use as a context manager)"""
+        return self.pool.connection()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool usage statistics"""
+        return self.pool.stats()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get result cache hit/miss statistics"""
+        return self.cache.stats()
+    
+    def query_stats(self) -> List[Dict[str, Any]]:
+        """Get per-statement timings, slowest total time first"""
+        return self.metrics.query_stats()
+    
+    def prometheus_metrics(self) -> str:
+        """Query, route, pool and cache metrics in Prometheus text format"""
+        return self.metrics.prometheus({'pool': self.pool_stats(), 'cache': self.cache_stats(),
+                                        'writes': self.write_stats()})
+    
+    def write_stats(self) -> Dict[str, Any]:
+        """Get group-commit writer statistics (empty when group commit is off)"""
+        return self.writes.stats() if self.writes is not None else {}
+    
+    def close(self):
+        """Finish queued writes and close all pooled connections"""
+        if self.writes is not None:
+            self.writes.close()
+        self.pool.close_all()
+    
+    def _write(self, op, *tables: str):
+        """Run op(conn) in a transaction and invalidate the tables it wrote.
+        
+        With group commit the op is batched with other threads' writes;
+        either way it has been committed by the time this returns.
+        """
+        if self.writes is not None:
+            result = self.writes.execute(op)
+        else:
+            with self.get_connection() as conn:
+                try:
+                    result = op(conn)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        self.cache.invalidate(*tables)
+        return result
+    
+    def _read(self, query: str, params: list, record_type, as_records: bool):
+        """Run a read query as a DataFrame, or as a list of lightweight records"""
+        with self.get_connection() as conn:
+            if not as_records:
+                # pandas is only needed for DataFrame results; importing it
+                # lazily keeps web workers and CLI commands quick to start
+                import pandas as pd
+                return pd.read_sql_query(query, conn, params=params)
+            cursor = conn.execute(query, params)
+            cursor.row_factory = record_type.factory
+            return cursor.fetchall()
     
     # Student Management Functions
     def add_student(self, name: str, email: str, phone: str = None, 
                    parent_name: str = None, parent_email: str = None, 
                    package_type: str = 'Individual', hourly_rate: float = 50.00) -> int:
         """Add a new student to the database"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
+        def insert(conn):
+            return conn.execute("""
                 INSERT INTO students (name, email, phone, parent_name, parent_email, package_type, hourly_rate)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (name, email, phone, parent_name, parent_email, package_type, hourly_rate))
-            
-            student_id = cursor.lastrowid
-            conn.commit()
-            print(f"Student '{name}' added successfully with ID: {student_id}")
-            return student_id
-            
+            """, (name, email, phone, parent_name, parent_email, package_type, hourly_rate)).lastrowid
+        
+        try:
+            student_id = self._write(insert, 'students')
         except sqlite3.IntegrityError as e:
             print(f"Error adding student: {e}")
             return None
-        finally:
-            conn.close()
-    
-    def get_students(self, active_only: bool = True) -> pd.DataFrame:
-        """Get all students as a pandas DataFrame"""
-        conn = self.get_connection()
         
-        query = "SELECT * FROM students"
+        print(f"Student '{name}' added successfully with ID: {student_id}")
+        return student_id
+    
+    @cached('students')
+    def get_students(self, active_only: bool = True, as_records: bool = False):
+        """Get all students as a pandas DataFrame (or a list of Student records)"""
+        query = """
+            SELECT id, name, email, phone, parent_name, parent_email, package_type,
+                   hourly_rate, created_date, is_active
+            FROM students
+        """
         if active_only:
             query += " WHERE is_active = 1"
         query += " ORDER BY name"
         
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df
+        return self._read(query, [], Student, as_records)
     
+    @cached('students')
     def get_student_by_email(self, email: str) -> Optional[Dict]:
         """Get student information by email"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM students WHERE email = ?", (email,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM students WHERE email = ?", (email,))
+            row = cursor.fetchone()
         
         if row:
             columns = [desc[0] for desc in cursor.description]
@@ -89,43 +411,190 @@ class TutoringPaymentManager:
     # Session Management Functions
     def add_session(self, student_id: int, session_date: str, start_time: str, 
                    end_time: str, duration_hours: float, subject: str, 
-                   session_cost: float, notes: str = None) -> int:
-        """Add a new tutoring session"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO sessions (student_id, session_date, start_time, end_time, 
-                                duration_hours, subject, session_cost, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (student_id, session_date, start_time, end_time, duration_hours, 
-              subject, session_cost, notes))
-        
-        session_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+                   session_cost: float, notes: str = None, allow_conflicts: bool = False) -> int:
+        """Add a new tutoring session.
+        
+        duration_hours may be None to take it from the times; if given it must
+        agree with them. Raises scheduling.ScheduleConflict if the session
+        overlaps one already booked, unless allow_conflicts=True.
+        """
+        session_date = date.fromisoformat(session_date).isoformat()
+        start_time = scheduling.normalize_time(start_time)
+        end_time = scheduling.normalize_time(end_time)
+        duration_hours = scheduling.session_hours(start_time, end_time, duration_hours)
+        
+        def insert(conn):
+            # Checked on the writer, so nothing can be booked between check and insert
+            if not allow_conflicts:
+                booked = scheduling.load_booked(conn, days=[session_date])
+                conflicts = scheduling.find_conflicts(booked, [(session_date, start_time, end_time)])
+                if conflicts:
+                    raise scheduling.ScheduleConflict(conflicts)
+            return conn.execute("""
+                INSERT INTO sessions (student_id, session_date, start_time, end_time, 
+                                    duration_hours, subject, session_cost, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (student_id, session_date, start_time, end_time, duration_hours, 
+                  subject, session_cost, notes)).lastrowid
+        
+        session_id = self._write(insert, 'sessions')
         
         print(f"Session added successfully with ID: {session_id}")
         return session_id
     
+    def add_recurring_sessions(self, student_id: int, start_date: str, end_date: str,
+                               start_time: str, end_time: str, subject: str, session_cost: float,
+                               weekdays: List[int] = None, every_weeks: int = 1, notes: str = None,
+                               skip_conflicts: bool = False) -> Dict[str, Any]:
+        """Book a session at the same time every week (e.g. a Weekly package for a term).
+        
+        Occurrences fall on weekdays (0 = Monday; default start_date's weekday)
+        from start_date to end_date. All of them are checked against the booked
+        sessions of those days in one query, then inserted in one transaction.
+        If any clash, nothing is booked and scheduling.ScheduleConflict lists
+        every clash - unless skip_conflicts=True, which books the rest.
+        Returns {'created': n, 'dates': [...], 'skipped': [conflicts]}.
+        """
+        start_time = scheduling.normalize_time(start_time)
+        end_time = scheduling.normalize_time(end_time)
+        duration_hours = scheduling.session_hours(start_time, end_time)
+        dates = scheduling.weekly_dates(start_date, end_date, weekdays, every_weeks)
+        
+        def insert(conn):
+            booked = scheduling.load_booked(conn, days=dates)
+            conflicts = scheduling.find_conflicts(booked, [(day, start_time, end_time) for day in dates])
+            if conflicts and not skip_conflicts:
+                raise scheduling.ScheduleConflict(conflicts)
+            
+            clashing = {conflict['session_date'] for conflict in conflicts}
+            free = [day for day in dates if day not in clashing]
+            conn.executemany("""
+                INSERT INTO sessions (student_id, session_date, start_time, end_time,
+                                      duration_hours, subject, session_cost, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(student_id, day, start_time, end_time, duration_hours, subject, session_cost, notes)
+                  for day in free])
+            return {'created': len(free), 'dates': free, 'skipped': conflicts}
+        
+        result = self._write(insert, 'sessions')
+        
+        print(f"{result['created']} recurring session(s) added for student {student_id}"
+              + (f", {len(result['skipped'])} skipped for conflicts" if result['skipped'] else ""))
+        return result
+    
+    @cached('sessions')
+    def available_slots(self, start_date: str, end_date: str, slot_length: float = 1.0,
+                        day_start: str = scheduling.DAY_START, day_end: str = scheduling.DAY_END,
+                        weekdays: Tuple[int, ...] = None) -> List[Dict[str, str]]:
+        """Free slots of slot_length hours between day_start and day_end on each day
+        from start_date to end_date (optionally only on weekdays, 0 = Monday).
+        
+        Slots start on the half hour and may overlap each other; they only
+        avoid booked (Scheduled or Completed) sessions.
+        """
+        first, last = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        if last < first:
+            raise ValueError("End date must not be before start date")
+        if (last - first).days >= 366:
+            raise ValueError("Ask for at most a year of slots at a time")
+        length = round(float(slot_length) * 60)
+        if length <= 0:
+            raise ValueError("Slot length must be positive")
+        opens = scheduling.minutes(scheduling.normalize_time(day_start))
+        closes = scheduling.minutes(scheduling.normalize_time(day_end))
+        
+        with self.get_connection() as conn:
+            booked = scheduling.load_booked(conn, start_date=first.isoformat(), end_date=last.isoformat())
+        
+        slots = []
+        day = first
+        while day <= last:
+            if weekdays is None or day.weekday() in weekdays:
+                slots += [{'session_date': day.isoformat(), 'start_time': scheduling.clock(start),
+                           'end_time': scheduling.clock(end)}
+                          for start, end in booked.free_slots(day.isoformat(), opens, closes, length)]
+            day += timedelta(days=1)
+        return slots
+    
     def update_session_status(self, session_id: int, status: str):
         """Update session status (Scheduled, Completed, Cancelled, No-Show)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("UPDATE sessions SET status = ? WHERE id = ?", (status, session_id))
-        conn.commit()
-        conn.close()
+        check_session_status(status)
+        self._write(lambda conn: conn.execute(
+            "UPDATE sessions SET status = ? WHERE id = ?", (status, session_id)
+        ).rowcount, 'sessions')
         
         print(f"Session {session_id} status updated to '{status}'")
     
+    def update_session_statuses(self, session_ids: List[int], status: str) -> int:
+        """Set the status of many sessions in one statement; returns how many changed"""
+        check_session_status(status)
+        try:
+            ids = sorted({int(session_id) for session_id in session_ids})
+        except (TypeError, ValueError):
+            raise ValueError("Session ids must be integers")
+        if not ids:
+            return 0
+        
+        # The ids go in as a single JSON array parameter, so any number of them
+        # is still one prepared statement (and one entry in the query stats)
+        updated = self._write(lambda conn: conn.execute("""
+            UPDATE sessions SET status = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND status != ?
+        """, (status, json.dumps(ids), status)).rowcount, 'sessions')
+        
+        print(f"{updated} of {len(ids)} sessions updated to '{status}'")
+        return updated
+    
+    def update_sessions_in_range(self, status: str = 'Completed', student_id: int = None,
+                                 start_date: str = None, end_date: str = None,
+                                 from_status: str = 'Scheduled') -> int:
+        """Move every from_status session for a student and/or date range to status.
+        
+        Runs as a single UPDATE; at least one of student_id, start_date or
+        end_date is required so a stray call can't rewrite the whole table.
+        Returns how many sessions changed.
+        """
+        check_session_status(status)
+        check_session_status(from_status)
+        if not (student_id or start_date or end_date):
+            raise ValueError("Give a student or a date range to update")
+        if status == from_status:
+            return 0
+        
+        query = "UPDATE sessions SET status = ? WHERE status = ?"
+        params = [status, from_status]
+        
+        if student_id:
+            query += " AND student_id = ?"
+            params.append(student_id)
+        
+        if start_date:
+            query += " AND session_date >= ?"
+            params.append(start_date)
+        
+        if end_date:
+            query += " AND session_date <= ?"
+            params.append(end_date)
+        
+        updated = self._write(lambda conn: conn.execute(query, params).rowcount, 'sessions')
+        
+        print(f"{updated} '{from_status}' sessions updated to '{status}'")
+        return updated
+    
+    @cached('sessions', 'students')
     def get_sessions(self, student_id: int = None, start_date: str = None, 
-                    end_date: str = None) -> pd.DataFrame:
-        """Get sessions with optional filtering"""
-        conn = self.get_connection()
+                    end_date: str = None, status: str = None, limit: int = None,
+                    cursor: str = None, as_records: bool = False):
+        """Get sessions with optional filtering, newest first.
         
+        With a cursor, only sessions after that position in the ordering are
+        returned (keyset pagination on session_date, start_time, id).
+        Returns a DataFrame, or a list of Session records with as_records=True.
+        """
         query = """
-            SELECT s.*, st.name as student_name, st.email as student_email
+            SELECT s.id, s.student_id, s.session_date, s.start_time, s.end_time,
+                   s.duration_hours, s.subject, s.session_cost, s.notes, s.status,
+                   s.created_date, st.name as student_name, st.email as student_email
             FROM sessions s
             JOIN students st ON s.student_id = st.id
             WHERE 1=1
@@ -144,11 +613,33 @@ class TutoringPaymentManager:
             query += " AND s.session_date <= ?"
             params.append(end_date)
         
-        query += " ORDER BY s.session_date DESC, s.start_time DESC"
+        if status:
+            query += " AND s.status = ?"
+            params.append(status)
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
+        if cursor:
+            query += " AND (s.session_date, s.start_time, s.id) < (?, ?, ?)"
+            params.extend(decode_cursor(cursor, 3))
+        
+        query += " ORDER BY s.session_date DESC, s.start_time DESC, s.id DESC"
+        
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        return self._read(query, params, Session, as_records)
+    
+    def get_sessions_page(self, limit: int = 50, cursor: str = None,
+                          as_records: bool = False, **filters) -> Tuple[Any, Optional[str]]:
+        """Get one page of sessions and the cursor for the next page (None at the end)"""
+        # Fetch one extra row to learn whether another page exists
+        rows = self.get_sessions(limit=limit + 1, cursor=cursor, as_records=as_records, **filters)
+        if len(rows) <= limit:
+            return rows, None
+        
+        rows = rows[:limit] if as_records else rows.iloc[:limit]
+        last = rows[-1] if as_records else rows.iloc[-1]
+        return rows, encode_cursor(last.session_date, last.start_time, int(last.id))
     
     # Payment Management Functions
     def add_payment(self, student_id: int, amount: float, payment_method: str,
@@ -158,29 +649,32 @@ class TutoringPaymentManager:
         if not payment_date:
             payment_date = date.today().isoformat()
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO payments (student_id, payment_date, amount, payment_method, 
-                                reference_number, notes)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (student_id, payment_date, amount, payment_method, reference_number, notes))
+        def insert(conn):
+            return conn.execute("""
+                INSERT INTO payments (student_id, payment_date, amount, payment_method, 
+                                    reference_number, notes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (student_id, payment_date, amount, payment_method, reference_number, notes)).lastrowid
         
-        payment_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        payment_id = self._write(insert, 'payments')
         
         print(f"Payment of ${amount} recorded successfully with ID: {payment_id}")
         return payment_id
     
+    @cached('payments', 'students')
     def get_payments(self, student_id: int = None, start_date: str = None, 
-                    end_date: str = None) -> pd.DataFrame:
-        """Get payment records with optional filtering"""
-        conn = self.get_connection()
+                    end_date: str = None, payment_method: str = None,
+                    limit: int = None, cursor: str = None, as_records: bool = False):
+        """Get payment records with optional filtering, newest first.
         
+        With a cursor, only payments after that position in the ordering are
+        returned (keyset pagination on payment_date, id).
+        Returns a DataFrame, or a list of Payment records with as_records=True.
+        """
         query = """
-            SELECT p.*, s.name as student_name, s.email as student_email
+            SELECT p.id, p.student_id, p.payment_date, p.amount, p.payment_method,
+                   p.reference_number, p.notes, p.created_date,
+                   s.name as student_name, s.email as student_email
             FROM payments p
             JOIN students s ON p.student_id = s.id
             WHERE 1=1
@@ -199,123 +693,1053 @@ class TutoringPaymentManager:
             query += " AND p.payment_date <= ?"
             params.append(end_date)
         
-        query += " ORDER BY p.payment_date DESC"
+        if payment_method:
+            query += " AND p.payment_method = ?"
+            params.append(payment_method)
+        
+        if cursor:
+            query += " AND (p.payment_date, p.id) < (?, ?)"
+            params.extend(decode_cursor(cursor, 2))
+        
+        query += " ORDER BY p.payment_date DESC, p.id DESC"
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        return self._read(query, params, Payment, as_records)
     
-    # Reporting Functions
-    def get_student_balance(self, student_id: int = None) -> pd.DataFrame:
-        """Get student balance summary"""
-        conn = self.get_connection()
+    def get_payments_page(self, limit: int = 50, cursor: str = None,
+                          as_records: bool = False, **filters) -> Tuple[Any, Optional[str]]:
+        """Get one page of payments and the cursor for the next page (None at the end)"""
+        rows = self.get_payments(limit=limit + 1, cursor=cursor, as_records=as_records, **filters)
+        if len(rows) <= limit:
+            return rows, None
+        
+        rows = rows[:limit] if as_records else rows.iloc[:limit]
+        last = rows[-1] if as_records else rows.iloc[-1]
+        return rows, encode_cursor(last.payment_date, int(last.id))
+    
+    # Package Billing Functions (Weekly/Intensive students; see billing.py)
+    def generate_packages(self, month_year: str = None, student_ids: List[int] = None) -> int:
+        """Create month_year's (default this month's) package for every active
+        Weekly/Intensive student, or only student_ids, in one transaction.
+        
+        Students who already have that month's package are left alone, so this
+        is safe to re-run. Returns the number of packages created.
+        """
+        month_year = month_year or date.today().strftime('%Y-%m')
+        month_bounds(month_year)
+        if student_ids is not None and not all(isinstance(i, int) for i in student_ids):
+            raise ValueError("Student ids must be integers")
+        
+        created = self._write(lambda conn: billing.insert_packages(conn, month_year, student_ids),
+                              'monthly_packages')
+        
+        print(f"Created {created} package(s) for {month_year}")
+        return created
+    
+    def roll_over_packages(self, month_year: str = None) -> Dict[str, int]:
+        """Month-end rollover: mark packages paid for students who owe nothing,
+        then open month_year's (default this month's) packages, in one transaction.
+        
+        Both steps are single set-based statements, so thousands of students
+        roll over in one short write. Returns {'settled': n, 'created': n}.
+        """
+        month_year = month_year or date.today().strftime('%Y-%m')
+        month_bounds(month_year)
+        
+        def roll_over(conn):
+            # Settle before the new month's charges land on the balances
+            settled = billing.settle_packages(conn)
+            created = billing.insert_packages(conn, month_year)
+            return {'settled': settled, 'created': created}
         
-        query = "SELECT * FROM student_balance"
+        result = self._write(roll_over, 'monthly_packages')
+        
+        print(f"Rolled over to {month_year}: {result['created']} package(s) created, "
+              f"{result['settled']} marked paid")
+        return result
+    
+    @cached('monthly_packages', 'sessions', 'students')
+    def get_packages(self, month_year: str = None, student_id: int = None,
+                     unpaid_only: bool = False, as_records: bool = False):
+        """Get monthly packages with their usage and amount due, newest month first
+        (a DataFrame, or a list of Package records with as_records=True)"""
+        query = """
+            SELECT p.id, p.student_id, s.name as student_name, p.package_type, p.month_year,
+                   p.total_sessions, p.completed_sessions,
+                   MAX(0, p.total_sessions - p.completed_sessions) as sessions_remaining,
+                   p.package_cost,
+                   ROUND(p.package_cost + MAX(0, p.completed_sessions - p.total_sessions)
+                         * ROUND(p.package_cost * 1.0 / MAX(p.total_sessions, 1), 2), 2) as amount_due,
+                   p.is_paid, p.payment_due_date
+            FROM monthly_packages p
+            JOIN students s ON s.id = p.student_id
+            WHERE 1=1
+        """
         params = []
         
+        if month_year:
+            month_bounds(month_year)
+            query += " AND p.month_year = ?"
+            params.append(month_year)
+        
         if student_id:
-            query += " WHERE id = ?"
+            query += " AND p.student_id = ?"
             params.append(student_id)
         
-        query += " ORDER BY balance_due DESC"
+        if unpaid_only:
+            query += " AND p.is_paid = 0"
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
+        query += " ORDER BY p.month_year DESC, s.name"
+        return self._read(query, params, Package, as_records)
     
-    def get_monthly_revenue(self, months: int = 12) -> pd.DataFrame:
-        """Get monthly revenue report"""
-        conn = self.get_connection()
+    # Search Functions
+    @cached('students', 'sessions', 'payments')
+    def search(self, text: str, kind: str = None, student_id: int = None, limit: int = 20,
+               as_records: bool = False):
+        """Full-text search over students, sessions and payments, best matches first.
         
-        df = pd.read_sql_query(f"""
-            SELECT * FROM monthly_revenue 
-            ORDER BY month DESC 
-            LIMIT {months}
-        """, conn)
+        Every word is matched as a prefix, so "calc mid" finds Calculus sessions
+        whose notes mention the midterm. Names, subjects and reference numbers
+        outweigh notes in the ranking. Matched words are wrapped in [brackets].
+        Returns a DataFrame, or a list of SearchResult records with as_records=True.
+        """
+        # Rank and cut inside the index before joining, so common words stay cheap
+        query = """
+            SELECT h.kind, h.id, h.student_id, st.name as student_name,
+                   COALESCE(se.session_date, pa.payment_date) as date,
+                   h.title, h.snippet, h.score
+            FROM (
+                SELECT kind, rowid / 4 as id, student_id, ROUND(-rank, 4) as score,
+                       highlight(search_index, 0, '[', ']') as title,
+                       snippet(search_index, 1, '[', ']', '...', 12) as snippet
+                FROM search_index
+                WHERE search_index MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) h
+            LEFT JOIN students st ON st.id = h.student_id
+            LEFT JOIN sessions se ON h.kind = 'session' AND se.id = h.id
+            LEFT JOIN payments pa ON h.kind = 'payment' AND pa.id = h.id
+            ORDER BY h.score DESC
+        """
+        return self._read(query, [search_query(text, kind, student_id), limit],
+                          SearchResult, as_records)
+    
+    def rebuild_search_index(self, verify_only: bool = False,
+                             batch_size: int = 5000) -> Dict[str, Any]:
+        """Bring the search index back in line with the tables it covers.
+        
+        Works through each table in id order, batch_size rows at a time, and
+        only rewrites entries that are missing, stale or left over from deleted
+        rows. Each batch is its own short write, so normal writes carry on while
+        a large index is repaired. With verify_only=True nothing is changed.
+        """
+        totals = {'entries': 0, 'missing': 0, 'stale': 0, 'orphaned': 0}
+        
+        def sync_batch(conn, kind, after, write):
+            code, table, title, detail, student = SEARCH_SOURCES[kind]
+            rows = conn.execute(f"""
+                SELECT id * 4 + {code}, {title}, {detail}, '{kind} s' || {student}, {student}
+                FROM {table} WHERE id > ? ORDER BY id LIMIT ?
+            """, (after, batch_size)).fetchall()
+            low = after * 4 + 4
+            high = rows[-1][0] if len(rows) == batch_size else None
+            if high is None:
+                # The last batch also covers entries left by deleted rows past the last
+                # one; AUTOINCREMENT ids never exceed the table's sqlite_sequence value
+                last_id = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?",
+                                       (table,)).fetchone()
+                end = (last_id[0] if last_id else after) * 4 + code
+            indexed = conn.execute(
+                "SELECT rowid, title, detail, tags, student_id FROM search_index "
+                "WHERE rowid >= ? AND rowid <= ?",
+                (low, high if high is not None else end)
+            ).fetchall()
+            indexed = {row[0]: row for row in indexed if row[0] % 4 == code}
+            
+            expected = {row[0]: row for row in rows}
+            missing = [rowid for rowid in expected if rowid not in indexed]
+            stale = [rowid for rowid in expected
+                     if rowid in indexed and tuple(indexed[rowid]) != tuple(expected[rowid])]
+            orphaned = [rowid for rowid in indexed if rowid not in expected]
+            
+            if write and (missing or stale or orphaned):
+                conn.executemany("DELETE FROM search_index WHERE rowid = ?",
+                                 [(rowid,) for rowid in stale + orphaned])
+                conn.executemany("""
+                    INSERT INTO search_index (rowid, title, detail, tags, kind, student_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [expected[rowid][:4] + (kind,) + expected[rowid][4:]
+                      for rowid in missing + stale])
+            
+            totals['entries'] += len(rows)
+            totals['missing'] += len(missing)
+            totals['stale'] += len(stale)
+            totals['orphaned'] += len(orphaned)
+            return rows[-1][0] // 4 if high is not None else None
         
-        conn.close()
-        return df
+        for kind in SEARCH_SOURCES:
+            after = 0
+            while after is not None:
+                if verify_only:
+                    with self.get_connection() as conn:
+                        after = sync_batch(conn, kind, after, False)
+                else:
+                    # Read and repair in the same transaction so triggers can't interleave
+                    after = self._write(
+                        lambda conn: sync_batch(conn, kind, after, True),
+                        'students', 'sessions', 'payments')
+        
+        action = "Verified" if verify_only else "Rebuilt"
+        print(f"{action} search index for {totals['entries']} rows: {totals['missing']} missing, "
+              f"{totals['stale']} stale and {totals['orphaned']} orphaned entries found")
+        return totals
+    
+    # Reporting Functions
+    @cached('students', 'sessions', 'payments', 'monthly_packages')
+    def get_student_balance(self, student_id: int = None, limit: int = None,
+                            as_records: bool = False):
+        """Get student balance summary from the trigger-maintained balance table,
+        largest balance first; limit keeps only the top N
+        (a DataFrame, or a list of Balance records with as_records=True)"""
+        query = """
+            SELECT s.id, s.name, s.email, b.total_owed, b.total_paid,
+                   ROUND(b.total_owed - b.total_paid, 2) as balance_due
+            FROM student_balances b
+            JOIN students s ON s.id = b.student_id
+            WHERE s.is_active = 1
+        """
+        params = []
+        
+        if student_id:
+            query += " AND s.id = ?"
+            params.append(student_id)
+        
+        # Same expression as idx_student_balances_due, so a LIMIT stops early
+        query += " ORDER BY b.total_owed - b.total_paid DESC"
+        
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        return self._read(query, params, Balance, as_records)
     
-    def get_payment_summary(self, months: int = 6) -> pd.DataFrame:
-        """Get payment method summary"""
-        conn = self.get_connection()
+    def rebuild_balances(self, verify_only: bool = False) -> Dict[str, Any]:
+        """Recompute student_balances (and package session counts) from the ledger.
         
-        df = pd.read_sql_query(f"""
-            SELECT * FROM payment_summary 
+        Returns the students whose stored totals disagreed with the ledger and
+        the number of packages whose completed_sessions count was off.
+        With verify_only=True the tables are checked but left untouched.
+        """
+        # Completed sessions in each package's month, counted from the sessions table
+        package_counts = """
+            SELECT mp.id, (
+                SELECT COUNT(*) FROM sessions se
+                WHERE se.student_id = mp.student_id AND se.status = 'Completed'
+                  AND se.session_date >= mp.month_year || '-01'
+                  AND se.session_date < date(mp.month_year || '-01', '+1 month')
+            ) as counted
+            FROM monthly_packages mp
+        """
+        # Sessions in a package month are covered by the package (see billing.py)
+        ledger_query = f"""
+            SELECT
+                s.id as student_id,
+                ROUND(COALESCE(o.total_owed, 0) + COALESCE(k.total_owed, 0), 2) as total_owed,
+                ROUND(COALESCE(p.total_paid, 0), 2) as total_paid
+            FROM students s
+            LEFT JOIN (
+                SELECT student_id, SUM(session_cost) as total_owed
+                FROM sessions se
+                WHERE status = 'Completed' AND NOT EXISTS (
+                    SELECT 1 FROM monthly_packages mp
+                    WHERE mp.student_id = se.student_id
+                      AND mp.month_year = strftime('%Y-%m', se.session_date))
+                GROUP BY student_id
+            ) o ON o.student_id = s.id
+            LEFT JOIN (
+                SELECT mp.student_id, SUM(ROUND(mp.package_cost + MAX(0, c.counted - mp.total_sessions)
+                    * ROUND(mp.package_cost * 1.0 / MAX(mp.total_sessions, 1), 2), 2)) as total_owed
+                FROM monthly_packages mp
+                JOIN ({package_counts}) c ON c.id = mp.id
+                GROUP BY mp.student_id
+            ) k ON k.student_id = s.id
+            LEFT JOIN (
+                SELECT student_id, SUM(amount) as total_paid
+                FROM payments GROUP BY student_id
+            ) p ON p.student_id = s.id
+        """
+        
+        def rebuild(conn):
+            ledger = conn.execute(ledger_query).fetchall()
+            package_mismatches = conn.execute(f"""
+                SELECT COUNT(*) FROM monthly_packages mp
+                JOIN ({package_counts}) c ON c.id = mp.id
+                WHERE mp.completed_sessions != c.counted
+            """).fetchone()[0]
+            stored = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute(
+                    "SELECT student_id, total_owed, total_paid FROM student_balances"
+                )
+            }
+            
+            mismatches = []
+            for student_id, total_owed, total_paid in ledger:
+                current = stored.get(student_id)
+                if (current is None
+                        or abs(current[0] - total_owed) > 0.005
+                        or abs(current[1] - total_paid) > 0.005):
+                    mismatches.append({
+                        'student_id': student_id,
+                        'stored_owed': current[0] if current else None,
+                        'stored_paid': current[1] if current else None,
+                        'ledger_owed': total_owed,
+                        'ledger_paid': total_paid,
+                    })
+            
+            if not verify_only:
+                # Fix the counts first; the balances are rewritten wholesale below
+                conn.execute("""
+                    UPDATE monthly_packages
+                    SET completed_sessions = (
+                        SELECT COUNT(*) FROM sessions se
+                        WHERE se.student_id = monthly_packages.student_id AND se.status = 'Completed'
+                          AND se.session_date >= monthly_packages.month_year || '-01'
+                          AND se.session_date < date(monthly_packages.month_year || '-01', '+1 month')
+                    )
+                """)
+                conn.execute("DELETE FROM student_balances")
+                conn.executemany("""
+                    INSERT INTO student_balances (student_id, total_owed, total_paid)
+                    VALUES (?, ?, ?)
+                """, ledger)
+            return ledger, package_mismatches, mismatches
+        
+        if verify_only:
+            with self.get_connection() as conn:
+                ledger, package_mismatches, mismatches = rebuild(conn)
+        else:
+            # One write op: the writer's lock keeps sessions and payments from
+            # landing between reading the ledger and rewriting the balances
+            ledger, package_mismatches, mismatches = self._write(
+                rebuild, 'students', 'sessions', 'payments', 'monthly_packages')
+        
+        action = "Verified" if verify_only else "Rebuilt"
+        print(f"{action} balances for {len(ledger)} students, "
+              f"{len(mismatches)} mismatch(es) and {package_mismatches} package count(s) off")
+        return {'students': len(ledger), 'mismatches': mismatches,
+                'package_mismatches': package_mismatches}
+    
+    @cached('sessions')
+    def get_monthly_revenue(self, months: int = 12, as_records: bool = False):
+        """Get monthly revenue report from the per-month rollup table"""
+        return self._read("""
+            SELECT month, sessions_completed, revenue, total_hours
+            FROM monthly_revenue_rollup
+            ORDER BY month DESC
+            LIMIT ?
+        """, [months], MonthlyRevenue, as_records)
+    
+    @cached('payments')
+    def get_payment_summary(self, months: int = 6, as_records: bool = False):
+        """Get payment method summary for the most recent months"""
+        return self._read("""
+            SELECT
+                month,
+                payment_count,
+                total_received,
+                NULLIF(payment_method, '') as payment_method,
+                payment_count * 100.0 / SUM(payment_count) OVER (PARTITION BY month) as percentage
+            FROM payment_method_rollup
+            WHERE month IN (
+                SELECT DISTINCT month FROM payment_method_rollup
+                ORDER BY month DESC
+                LIMIT ?
+            )
             ORDER BY month DESC, total_received DESC
-            LIMIT {months * 5}
-        """, conn)
+        """, [months], PaymentMethodSummary, as_records)
+    
+    def rebuild_rollups(self, verify_only: bool = False) -> Dict[str, Any]:
+        """Recompute the monthly and daily rollup tables from the ledger views.
         
-        conn.close()
-        return df
+        Returns the number of months (or days and subjects) whose stored rollup
+        disagreed with the ledger. With verify_only=True the tables are checked
+        but left untouched.
+        """
+        revenue_diff = """
+            SELECT COUNT(*) FROM (
+                SELECT month, sessions_completed, ROUND(revenue, 2), ROUND(total_hours, 2)
+                FROM monthly_revenue
+                EXCEPT
+                SELECT month, sessions_completed, ROUND(revenue, 2), ROUND(total_hours, 2)
+                FROM monthly_revenue_rollup
+            )
+        """
+        payment_diff = """
+            SELECT COUNT(*) FROM (
+                SELECT month, COALESCE(payment_method, ''), payment_count, ROUND(total_received, 2)
+                FROM payment_summary
+                EXCEPT
+                SELECT month, payment_method, payment_count, ROUND(total_received, 2)
+                FROM payment_method_rollup
+            )
+        """
+        daily_totals = """
+            SELECT session_date, subject, COUNT(*), ROUND(SUM(session_cost), 2), ROUND(SUM(duration_hours), 2)
+            FROM sessions
+            WHERE status = 'Completed'
+            GROUP BY session_date, subject
+        """
+        daily_rollup = """
+            SELECT day, subject, sessions_completed, ROUND(revenue, 2), ROUND(total_hours, 2)
+            FROM daily_revenue_rollup
+        """
+        
+        def rebuild(conn):
+            # Compare both directions so stale months in the rollup count too
+            revenue_mismatches = conn.execute(revenue_diff).fetchone()[0]
+            revenue_mismatches += conn.execute(
+                "SELECT COUNT(*) FROM monthly_revenue_rollup "
+                "WHERE month NOT IN (SELECT month FROM monthly_revenue)"
+            ).fetchone()[0]
+            payment_mismatches = conn.execute(payment_diff).fetchone()[0]
+            payment_mismatches += conn.execute(
+                "SELECT COUNT(*) FROM payment_method_rollup r WHERE NOT EXISTS ("
+                "SELECT 1 FROM payment_summary p WHERE p.month = r.month "
+                "AND COALESCE(p.payment_method, '') = r.payment_method)"
+            ).fetchone()[0]
+            daily_mismatches = conn.execute(
+                f"SELECT COUNT(*) FROM ({daily_totals} EXCEPT {daily_rollup})"
+            ).fetchone()[0]
+            daily_mismatches += conn.execute(
+                f"SELECT COUNT(*) FROM ({daily_rollup} EXCEPT {daily_totals})"
+            ).fetchone()[0]
+            
+            if not verify_only:
+                conn.execute("DELETE FROM monthly_revenue_rollup")
+                conn.execute("""
+                    INSERT INTO monthly_revenue_rollup (month, sessions_completed, revenue, total_hours)
+                    SELECT month, sessions_completed, ROUND(revenue, 2), ROUND(total_hours, 2)
+                    FROM monthly_revenue
+                """)
+                conn.execute("DELETE FROM payment_method_rollup")
+                conn.execute("""
+                    INSERT INTO payment_method_rollup (month, payment_method, payment_count, total_received)
+                    SELECT month, COALESCE(payment_method, ''), payment_count, ROUND(total_received, 2)
+                    FROM payment_summary
+                """)
+                conn.execute("DELETE FROM daily_revenue_rollup")
+                conn.execute(f"""
+                    INSERT INTO daily_revenue_rollup (day, subject, sessions_completed, revenue, total_hours)
+                    {daily_totals}
+                """)
+            return revenue_mismatches, payment_mismatches, daily_mismatches
+        
+        if verify_only:
+            with self.get_connection() as conn:
+                revenue_mismatches, payment_mismatches, daily_mismatches = rebuild(conn)
+        else:
+            # As with the balances, comparing and rewriting in one write op
+            # keeps a concurrent session or payment from being dropped
+            revenue_mismatches, payment_mismatches, daily_mismatches = self._write(
+                rebuild, 'students', 'sessions', 'payments', 'monthly_packages')
+        
+        action = "Verified" if verify_only else "Rebuilt"
+        print(f"{action} rollups: {revenue_mismatches} revenue and "
+              f"{payment_mismatches} payment month(s), {daily_mismatches} day/subject row(s) out of date")
+        return {'revenue_mismatches': revenue_mismatches,
+                'payment_mismatches': payment_mismatches,
+                'daily_mismatches': daily_mismatches}
+    
+    # Aggregation Functions (compact columns for dashboard charts; see aggregates.py)
+    @cached('students', 'sessions', 'payments', 'monthly_packages')
+    def get_balance_totals(self) -> Dict[str, Any]:
+        """Balance totals over active students, computed in SQL as a single row"""
+        with self.get_connection() as conn:
+            return fetch_dicts(conn, """
+                SELECT COUNT(*) as students,
+                       ROUND(COALESCE(SUM(b.total_owed), 0), 2) as total_owed,
+                       ROUND(COALESCE(SUM(b.total_paid), 0), 2) as total_paid,
+                       ROUND(COALESCE(SUM(b.total_owed - b.total_paid), 0), 2) as total_outstanding,
+                       COUNT(*) FILTER (WHERE b.total_owed - b.total_paid > 0.005) as students_owing
+                FROM students s
+                JOIN student_balances b ON b.student_id = s.id
+                WHERE s.is_active = 1
+            """)[0]
+    
+    @cached('students', 'sessions', 'payments', 'monthly_packages')
+    def get_top_balances(self, n: int = 10) -> Dict[str, list]:
+        """The n largest outstanding balances among active students"""
+        with self.get_connection() as conn:
+            return aggregates.columns(conn.execute("""
+                SELECT s.id, s.name, ROUND(b.total_owed - b.total_paid, 2) as balance_due
+                FROM student_balances b
+                JOIN students s ON s.id = b.student_id
+                WHERE s.is_active = 1 AND b.total_owed - b.total_paid > 0.005
+                ORDER BY b.total_owed - b.total_paid DESC
+                LIMIT ?
+            """, (n,)))
+    
+    @cached('sessions')
+    def get_revenue_by_subject(self, months: int = 12) -> Dict[str, list]:
+        """Completed-session totals per subject over the last `months` months, highest revenue first"""
+        with self.get_connection() as conn:
+            return aggregates.columns(conn.execute("""
+                SELECT subject, SUM(sessions_completed) as sessions,
+                       ROUND(SUM(revenue), 2) as revenue, ROUND(SUM(total_hours), 2) as hours
+                FROM daily_revenue_rollup
+                WHERE day >= ?
+                GROUP BY subject
+                ORDER BY revenue DESC
+            """, (aggregates.months_ago(months),)))
+    
+    @cached('sessions')
+    def get_revenue_by_weekday(self, months: int = 12) -> Dict[str, list]:
+        """Completed-session totals per day of the week (Sunday first) over the last `months` months"""
+        with self.get_connection() as conn:
+            rows = conn.execute("""
+                SELECT CAST(strftime('%w', day) AS INTEGER) as weekday, SUM(sessions_completed),
+                       ROUND(SUM(revenue), 2), ROUND(SUM(total_hours), 2)
+                FROM daily_revenue_rollup
+                WHERE day >= ?
+                GROUP BY weekday
+            """, (aggregates.months_ago(months),)).fetchall()
+        
+        totals = {row[0]: row[1:] for row in rows}
+        empty = (0, 0.0, 0.0)
+        return {
+            'weekday': list(aggregates.WEEKDAYS),
+            'sessions': [totals.get(n, empty)[0] for n in range(7)],
+            'revenue': [totals.get(n, empty)[1] for n in range(7)],
+            'hours': [totals.get(n, empty)[2] for n in range(7)],
+        }
+    
+    @cached('sessions')
+    def get_daily_revenue(self, days: int = 90, window: int = 7,
+                          end_date: date = None) -> Dict[str, list]:
+        """Revenue and completed sessions for each of the last `days` days up to end_date
+        (default today), with a trailing `window`-day average of revenue"""
+        end = end_date or date.today()
+        start = end - timedelta(days=days - 1)
+        # Start the series early so the first days' averages have a full window
+        lead_in = start - timedelta(days=window - 1)
+        with self.get_connection() as conn:
+            data = aggregates.columns(conn.execute("""
+                SELECT day, SUM(sessions_completed) as sessions, ROUND(SUM(revenue), 2) as revenue
+                FROM daily_revenue_rollup
+                WHERE day BETWEEN ? AND ?
+                GROUP BY day
+            """, (lead_in.isoformat(), end.isoformat())))
+        
+        series = aggregates.daily_series(data, lead_in, end, {'sessions': int, 'revenue': float})
+        rolling = aggregates.rolling_mean(series['revenue'], window)
+        skip = window - 1
+        return {'day': series['day'][skip:], 'sessions': series['sessions'][skip:],
+                'revenue': series['revenue'][skip:], 'rolling_revenue': rolling[skip:]}
+    
+    @cached('sessions')
+    def get_revenue_trend(self, months: int = 12, window: int = 3) -> Dict[str, list]:
+        """Monthly revenue for the last `months` months, oldest first (empty months as 0),
+        with a trailing `window`-month average"""
+        first = aggregates.months_ago(months + window - 1)
+        with self.get_connection() as conn:
+            totals = {row[0]: row[1:] for row in conn.execute("""
+                SELECT month, sessions_completed, revenue, total_hours
+                FROM monthly_revenue_rollup
+                WHERE month >= ?
+            """, (first[:7],))}
+        
+        labels = aggregates.month_labels(first, months + window - 1)
+        revenue = [totals[month][1] if month in totals else 0.0 for month in labels]
+        rolling = aggregates.rolling_mean(revenue, window)
+        skip = window - 1
+        return {
+            'month': labels[skip:],
+            'sessions': [totals[month][0] if month in totals else 0 for month in labels[skip:]],
+            'revenue': revenue[skip:],
+            'hours': [totals[month][2] if month in totals else 0.0 for month in labels[skip:]],
+            'rolling_revenue': rolling[skip:],
+        }
+    
+    # Analytics Snapshot Functions (Parquet copy for long-range reports; see snapshots.py)
+    
+    def sync_snapshot(self, full: bool = False) -> Dict[str, Any]:
+        """Copy new and changed sessions and payments into the analytics snapshot.
+        
+        Only rows added since the last sync and months edited since are
+        copied, so a regular sync (e.g. hourly from cron) is quick. full=True
+        rebuilds the whole snapshot.
+        """
+        with self.get_connection() as conn:
+            stats = snapshots.sync(conn, self.snapshot_dir, full)
+        
+        changes = stats.pop('changes')
+        if changes:
+            # Only marks whose version is unchanged: a month edited during the sync stays marked
+            self._write(lambda conn: conn.executemany(
+                "DELETE FROM snapshot_changes WHERE table_name = ? AND month = ? AND version = ?",
+                changes))
+        
+        for table in snapshots.SNAPSHOT_TABLES:
+            print(f"Snapshot {table}: {stats[table]['appended']} new row(s), "
+                  f"{len(stats[table]['rewritten_months'])} month(s) rewritten")
+        return stats
     
+    def snapshot_report(self, name: str, **params) -> Dict[str, Any]:
+        """Run a report from snapshots.REPORTS over the snapshot (as of its last sync)"""
+        return snapshots.run(self.snapshot_dir, name, params)
+    
+    @cached('students', 'sessions', 'payments', 'monthly_packages')
     def generate_invoice_data(self, student_id: int, month_year: str) -> Dict[str, Any]:
         """Generate invoice data for a student for a specific month"""
-        conn = self.get_connection()
+        return self.generate_invoices(month_year, [student_id]).get(student_id)
+    
+    def generate_invoices(self, month_year: str,
+                          student_ids: List[int] = None) -> Dict[int, Dict[str, Any]]:
+        """Generate invoice data for many students for one month in a single pass.
         
-        # Get student info
-        student_df = pd.read_sql_query(
-            "SELECT * FROM students WHERE id = ?", conn, params=[student_id]
-        )
+        Sessions and payments for the month are fetched with one date-range
+        query each and grouped per student in memory. Without student_ids,
+        every active student (and anyone with activity that month) is invoiced.
+        A student with a package that month owes the package charge rather
+        than each session's cost; invoice['package'] holds its breakdown.
+        Returns {student_id: invoice} in the same shape as generate_invoice_data.
+        """
+        month_start, month_end = month_bounds(month_year)
         
-        if student_df.empty:
-            return None
+        student_filter = ""
+        params = [month_start, month_end]
+        if student_ids is not None:
+            student_ids = list(student_ids)
+            if not student_ids:
+                return {}
+            student_filter = f" AND student_id IN ({', '.join('?' * len(student_ids))})"
+            params += student_ids
         
-        student = student_df.iloc[0]
+        with self.get_connection() as conn:
+            sessions = fetch_dicts(conn, f"""
+                SELECT * FROM sessions
+                WHERE session_date >= ? AND session_date < ?
+                AND status = 'Completed'{student_filter}
+                ORDER BY session_date, start_time
+            """, params)
+            
+            payments = fetch_dicts(conn, f"""
+                SELECT * FROM payments
+                WHERE payment_date >= ? AND payment_date < ?{student_filter}
+                ORDER BY payment_date
+            """, params)
+            
+            packages = {package['student_id']: package for package in fetch_dicts(conn, f"""
+                SELECT * FROM monthly_packages
+                WHERE month_year = ?{student_filter}
+            """, [month_year] + params[2:])}
+            
+            if student_ids is not None:
+                students = fetch_dicts(
+                    conn, f"SELECT * FROM students WHERE id IN ({', '.join('?' * len(student_ids))})",
+                    student_ids
+                )
+            else:
+                students = fetch_dicts(conn, "SELECT * FROM students ORDER BY name")
         
-        # Get sessions for the month
-        sessions_df = pd.read_sql_query("""
-            SELECT * FROM sessions 
-            WHERE student_id = ? 
-            AND strftime('%Y-%m', session_date) = ?
-            AND status = 'Completed'
-            ORDER BY session_date
-        """, conn, params=[student_id, month_year])
+        sessions_by_student = {}
+        for session in sessions:
+            sessions_by_student.setdefault(session['student_id'], []).append(session)
+        payments_by_student = {}
+        for payment in payments:
+            payments_by_student.setdefault(payment['student_id'], []).append(payment)
         
-        # Get payments for the month
-        payments_df = pd.read_sql_query("""
-            SELECT * FROM payments 
-            WHERE student_id = ? 
-            AND strftime('%Y-%m', payment_date) = ?
-            ORDER BY payment_date
-        """, conn, params=[student_id, month_year])
+        invoices = {}
+        for student in students:
+            student_id = student['id']
+            student_sessions = sessions_by_student.get(student_id, [])
+            student_payments = payments_by_student.get(student_id, [])
+            package = packages.get(student_id)
+            if (student_ids is None and not student['is_active']
+                    and not student_sessions and not student_payments and not package):
+                continue
+            
+            if package:
+                package = billing.package_summary(package, len(student_sessions))
+                total_owed = package['charge']
+            else:
+                total_owed = sum(session['session_cost'] for session in student_sessions)
+            total_paid = sum(payment['amount'] for payment in student_payments)
+            
+            invoices[student_id] = {
+                'student': student,
+                'sessions': student_sessions,
+                'payments': student_payments,
+                'package': package,
+                'summary': {
+                    'month': month_year,
+                    'total_sessions': len(student_sessions),
+                    'total_hours': sum(session['duration_hours'] for session in student_sessions),
+                    'total_owed': total_owed,
+                    'total_paid': total_paid,
+                    'balance_due': total_owed - total_paid
+                }
+            }
+        return invoices
+    
+    def write_invoices(self, invoices: Dict[int, Dict[str, Any]], output_dir: str,
+                       workers: int = 4) -> List[str]:
+        """Render invoices to text files in output_dir using a pool of workers"""
+        os.makedirs(output_dir, exist_ok=True)
         
-        conn.close()
+        def write(invoice):
+            student = invoice['student']
+            path = os.path.join(
+                output_dir, f"invoice_{invoice['summary']['month']}_{student['id']}.txt"
+            )
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(render_invoice_text(invoice))
+            return path
         
-        total_owed = sessions_df['session_cost'].sum() if not sessions_df.empty else 0
-        total_paid = payments_df['amount'].sum() if not payments_df.empty else 0
-        balance_due = total_owed - total_paid
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            paths = list(executor.map(write, invoices.values()))
         
-        return {
-            'student': student.to_dict(),
-            'sessions': sessions_df.to_dict('records'),
-            'payments': payments_df.to_dict('records'),
-            'summary': {
-                'month': month_year,
-                'total_sessions': len(sessions_df),
-                'total_hours': sessions_df['duration_hours'].sum() if not sessions_df.empty else 0,
-                'total_owed': total_owed,
-                'total_paid': total_paid,
-                'balance_due': balance_due
-            }
-        }
+        print(f"Wrote {len(paths)} invoice(s) to {output_dir}")
+        return paths
     
-    def export_data(self, table_name: str, file_path: str):
-        """Export table data to CSV"""
-        conn = self.get_connection()
+    def bulk_import(self, table: str, file_path: str, file_format: str = None,
+                    chunk_size: int = 5000, resume: bool = True,
+                    reject_path: str = None) -> Dict[str, Any]:
+        """Bulk load students, sessions or payments from a CSV or JSONL file.
         
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-        df.to_csv(file_path, index=False)
+        Rows are validated against the schema before insert; bad rows are
+        skipped and reported (and appended to reject_path as CSV if given).
+        Progress is checkpointed per chunk, so re-running an interrupted
+        import continues where it stopped unless resume=False.
+        """
+        summary = bulk_import.import_file(self, table, file_path, fmt=file_format,
+                                          chunk_size=chunk_size, resume=resume,
+                                          reject_path=reject_path)
+        self.cache.invalidate(table)
         
-        conn.close()
-        print(f"Data exported to {file_path}")
-
-
+        print(f"Imported {summary['inserted']} {table} row(s) from {file_path}, "
+              f"{summary['rejected']} rejected, {summary['skipped']} already imported")
+        return summary
+    
+    def export_data(self, table_name: str, file_path: str, file_format: str = None,
+                    start_date: str = None, end_date: str = None,
+                    incremental: bool = False, chunk_size: int = 5000) -> int:
+        """Export a table or report view to CSV, JSONL or Parquet.
+        
+        Rows are streamed in chunks, so memory use doesn't grow with the table.
+        With incremental=True only rows added since the last incremental
+        export of this table are written.
+        """
+        file_format = file_format or data_export.format_from_path(file_path)
+        if file_format not in data_export.EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {file_format}")
+        
+        with self.get_connection() as conn:
+            after_id = None
+            if incremental:
+                row = conn.execute(
+                    "SELECT last_key FROM export_watermarks WHERE table_name = ?",
+                    (table_name,)
+                ).fetchone()
+                after_id = row[0] if row else 0
+            
+            query, params = data_export.build_query(table_name, start_date, end_date, after_id)
+            stats = data_export.write_export(conn, table_name, file_path, file_format,
+                                             query, params, chunk_size)
+            
+            if incremental and stats['last_key'] is not None:
+                conn.execute("""
+                    INSERT INTO export_watermarks (table_name, last_key)
+                    VALUES (?, ?)
+                    ON CONFLICT(table_name) DO UPDATE SET
+                        last_key = excluded.last_key, exported_date = CURRENT_TIMESTAMP
+                """, (table_name, stats['last_key']))
+                conn.commit()
+        
+        print(f"Exported {stats['rows']} row(s) to {file_path}")
+        return stats['rows']
+    
+    def iter_export(self, table_name: str, file_format: str = 'csv',
+                    start_date: str = None, end_date: str = None,
+                    chunk_size: int = 5000) -> Iterator[str]:
+        """Yield an export as CSV or JSONL text chunks, for streaming responses"""
+        if file_format not in ('csv', 'jsonl'):
+            raise ValueError(f"Cannot stream '{file_format}' exports (use csv or jsonl)")
+        # Validate before the first chunk is requested, so callers can still fail cleanly
+        query, params = data_export.build_query(table_name, start_date, end_date)
+        render = data_export.csv_text if file_format == 'csv' else data_export.jsonl_text
+        
+        def generate():
+            with self.get_connection() as conn:
+                columns, chunks = data_export.iter_chunks(conn, query, params, chunk_size)
+                yield from render(columns, chunks)
+        
+        return generate()
+    
+    # Background Job Functions (slow work run by a jobs.JobRunner; see jobs.py)
+    
+    def enqueue_job(self, kind: str, params: Dict[str, Any] = None, delay_seconds: float = 0,
+                    max_attempts: int = 3, runner: str = None, kinds: Dict[str, tuple] = None,
+                    reuse: bool = False) -> int:
+        """Queue a background job of a jobs.JOB_KINDS kind; returns its id.
+        
+        params are checked now, so a bad request fails here rather than in a
+        worker. runner pins the job to one JobRunner (by its name). With
+        reuse=True an identical job still queued or running is returned
+        instead of queuing another.
+        """
+        kwargs = jobs.check_params(kind, params, kinds)
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        
+        def insert(conn):
+            if reuse:
+                job_id = jobs.find_pending(conn, kind, kwargs)
+                if job_id is not None:
+                    return job_id
+            return jobs.insert_job(conn, kind, kwargs, delay_seconds, max_attempts, runner)
+        return self._write(insert)
+    
+    def get_job(self, job_id: int, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        """A job's status, attempts, timestamps and last error (and result, if asked)"""
+        columns = JOB_COLUMNS + (', result' if include_result else '')
+        with self.get_connection() as conn:
+            rows = fetch_dicts(conn, f"SELECT {columns} FROM jobs WHERE id = ?", [job_id])
+        return jobs.job_dict(rows[0]) if rows else None
+    
+    def get_job_result(self, job_id: int) -> Any:
+        """A finished job's result; LookupError if there is no such job,
+        ValueError if it is still queued or running or has failed"""
+        job = self.get_job(job_id, include_result=True)
+        if job is None:
+            raise LookupError(f"No job with id {job_id}")
+        if job['status'] != 'done':
+            raise ValueError(f"Job {job_id} is {job['status']}"
+                             + (f": {job['error']}" if job['error'] else ""))
+        return job['result']
+    
+    def get_jobs(self, status: str = None, kind: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Recent jobs, newest first (results left out)"""
+        query = f"SELECT {JOB_COLUMNS} FROM jobs WHERE 1=1"
+        params = []
+        if status:
+            if status not in jobs.STATUSES:
+                raise ValueError(f"Invalid job status: {status}. Must be one of {', '.join(jobs.STATUSES)}")
+            query += " AND status = ?"
+            params.append(status)
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        
+        with self.get_connection() as conn:
+            return [jobs.job_dict(row) for row in fetch_dicts(conn, query, params)]
+    
+    def has_due_jobs(self, runner: str = None) -> bool:
+        """Whether a job is ready for a worker (of the given runner)"""
+        with self.get_connection() as conn:
+            return jobs.has_due(conn, runner)
+    
+    def claim_job(self, worker: str, runner: str = None) -> Optional[Dict[str, Any]]:
+        """Take the oldest due job for worker, or None if there is none"""
+        return self._write(lambda conn: jobs.claim(conn, worker, runner))
+    
+    def finish_job(self, job_id: int, worker: str, result: Any) -> bool:
+        """Store a claimed job's result; False if worker no longer holds it"""
+        return self._write(lambda conn: jobs.complete(conn, job_id, worker, result))
+    
+    def fail_job(self, job_id: int, worker: str, error: str, retry_seconds: float = None) -> bool:
+        """Record a claimed job's failure, retrying after retry_seconds if given"""
+        return self._write(lambda conn: jobs.fail(conn, job_id, worker, error, retry_seconds))
+    
+    def schedule_jobs(self, schedule: Dict[str, tuple] = None, now: datetime = None) -> List[int]:
+        """Queue the schedule's due entries (default jobs.SCHEDULE) and re-queue
+        jobs whose worker died; returns the ids of the jobs queued.
+        
+        Safe to call from any number of processes: each entry is queued once per slot.
+        """
+        schedule = jobs.SCHEDULE if schedule is None else schedule
+        now = now or datetime.now()
+        due = []
+        for name, (kind, when) in schedule.items():
+            entry = when(now)
+            if entry is not None:
+                slot, params = entry
+                due.append((name, kind, slot, jobs.check_params(kind, params)))
+        
+        def queue(conn):
+            requeued = jobs.requeue_expired(conn)
+            queued = [jobs.queue_scheduled(conn, *entry) for entry in due]
+            return requeued, [(entry[0], job_id) for entry, job_id in zip(due, queued) if job_id]
+        
+        requeued, queued = self._write(queue)
+        if requeued:
+            print(f"Re-queued {requeued} job(s) whose worker stopped")
+        for name, job_id in queued:
+            print(f"Queued scheduled job {job_id} ({name})")
+        return [job_id for _, job_id in queued]
+    
+    def purge_jobs(self, hours: float = jobs.RETENTION_HOURS) -> int:
+        """Delete jobs finished more than hours ago, and their export files"""
+        deleted, files = self._write(lambda conn: jobs.purge(conn, hours))
+        for path in files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return deleted
+    
 # Example usage and CLI interface
-def main():
+def main(argv: List[str] = None):
     """Command line interface for the payment manager"""
-    pm = TutoringPaymentManager()
+    parser = argparse.ArgumentParser(description="Tutoring Payment Management System")
+    parser.add_argument('--db', default='tutoring_payments.db', help="database file")
+    commands = parser.add_subparsers(dest='command')
+    
+    import_parser = commands.add_parser('import', help="bulk import a CSV or JSONL file")
+    import_parser.add_argument('table', choices=sorted(bulk_import.IMPORT_SPECS))
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'],
+                               help="file format (default: from extension)")
+    import_parser.add_argument('--chunk-size', type=int, default=5000)
+    import_parser.add_argument('--no-resume', action='store_true',
+                               help="start from the top even if a previous run was interrupted")
+    import_parser.add_argument('--rejects', help="append rejected rows to this CSV file")
+    
+    export_parser = commands.add_parser('export', help="export a table or report to a file")
+    export_parser.add_argument('table', choices=sorted(data_export.EXPORT_SOURCES))
+    export_parser.add_argument('file')
+    export_parser.add_argument('--format', choices=data_export.EXPORT_FORMATS,
+                               help="file format (default: from extension)")
+    export_parser.add_argument('--start-date', help="only rows on or after this date")
+    export_parser.add_argument('--end-date', help="only rows on or before this date")
+    export_parser.add_argument('--incremental', action='store_true',
+                               help="only rows added since the last incremental export")
+    
+    invoice_parser = commands.add_parser('invoices', help="generate every student's invoice for a month")
+    invoice_parser.add_argument('month', help="month in YYYY-MM format")
+    invoice_parser.add_argument('--output-dir', help="folder for the invoice files (default invoices/<month>)")
+    invoice_parser.add_argument('--workers', type=int, default=4)
+    
+    rollover_parser = commands.add_parser(
+        'rollover', help="month-end package rollover: settle paid-up packages, open the month's packages")
+    rollover_parser.add_argument('--month', help="month to open, in YYYY-MM format (default this month)")
+    
+    snapshot_parser = commands.add_parser(
+        'snapshot', help="copy new and changed rows into the Parquet analytics snapshot")
+    snapshot_parser.add_argument('--full', action='store_true', help="rebuild the whole snapshot")
+    
+    worker_parser = commands.add_parser('worker', help="run background jobs (and scheduled ones) until stopped")
+    worker_parser.add_argument('--workers', type=int, default=2, help="jobs run at once")
+    worker_parser.add_argument('--no-schedule', action='store_true',
+                               help="only run queued jobs; leave the schedule to another worker")
+    worker_parser.add_argument('--once', action='store_true', help="run the jobs due now, then exit")
+    
+    enqueue_parser = commands.add_parser('enqueue', help="queue a background job")
+    enqueue_parser.add_argument('kind', choices=sorted(jobs.JOB_KINDS))
+    enqueue_parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                                help="job parameter, e.g. --param month_year=2025-10")
+    
+    jobs_parser = commands.add_parser('jobs', help="list recent background jobs")
+    jobs_parser.add_argument('--status', choices=jobs.STATUSES)
+    jobs_parser.add_argument('--limit', type=int, default=20)
+    
+    commands.add_parser('init-db', help="create the database or apply pending migrations, then exit")
+    commands.add_parser('check-plans', help="fail if any manager query plans a full table scan")
+    
+    search_parser = commands.add_parser('rebuild-search', help="repair the full-text search index")
+    search_parser.add_argument('--verify', action='store_true', help="only report what is out of date")
+    search_parser.add_argument('--batch-size', type=int, default=5000, help="rows checked per transaction")
+    
+    args = parser.parse_args(argv)
+    if args.command == 'init-db':
+        TutoringPaymentManager(args.db, auto_init=False).init_database()
+        return
+    
+    pm = TutoringPaymentManager(args.db)
+    
+    if args.command == 'check-plans':
+        problems = pm.check_query_plans()
+        for problem in problems:
+            print(f"{problem['call']}: full scan of {', '.join(problem['scanned'])}")
+            print(f"  {problem['sql']}")
+            for step in problem['plan']:
+                print(f"    {step}")
+        if problems:
+            raise SystemExit(1)
+        print("No full table scans in the manager's queries")
+        return
+    
+    if args.command == 'rebuild-search':
+        pm.rebuild_search_index(verify_only=args.verify, batch_size=args.batch_size)
+        return
     
+    if args.command == 'import':
+        summary = pm.bulk_import(args.table, args.file, file_format=args.format,
+                                 chunk_size=args.chunk_size, resume=not args.no_resume,
+                                 reject_path=args.rejects)
+        for reject in summary['rejects']:
+            print(f"  Row {reject['row']}: {reject['reason']}")
+        return
+    
+    if args.command == 'export':
+        pm.export_data(args.table, args.file, file_format=args.format,
+                       start_date=args.start_date, end_date=args.end_date,
+                       incremental=args.incremental)
+        return
+    
+    if args.command == 'rollover':
+        pm.roll_over_packages(args.month)
+        return
+    
+    if args.command == 'snapshot':
+        pm.sync_snapshot(full=args.full)
+        return
+    
+    if args.command == 'worker':
+        runner = jobs.JobRunner(pm, workers=args.workers, schedule={} if args.no_schedule else None)
+        if args.once:
+            runner.tick()
+            print(f"Ran {runner.run_pending()} job(s)")
+            return
+        print(f"Job worker {runner.name} running {args.workers} at a time (Ctrl-C to stop)")
+        runner.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("Stopping after the running jobs finish...")
+            runner.stop()
+        return
+    
+    if args.command == 'enqueue':
+        params = dict(param.split('=', 1) for param in args.param)
+        print(f"Queued job {pm.enqueue_job(args.kind, params)} ({args.kind})")
+        return
+    
+    if args.command == 'jobs':
+        for job in pm.get_jobs(status=args.status, limit=args.limit):
+            print(f"{job['id']:>6}  {job['kind']:<10} {job['status']:<8} {job['created_at']}  "
+                  f"{json.dumps(job['params'])}" + (f"  {job['error']}" if job['error'] else ""))
+        return
+    
+    if args.command == 'invoices':
+        invoices = pm.generate_invoices(args.month)
+        pm.write_invoices(invoices, args.output_dir or os.path.join('invoices', args.month),
+                          workers=args.workers)
+        return
+    
+    interactive_menu(pm)
+
+
+def interactive_menu(pm: TutoringPaymentManager):
+    """Menu-driven interface for day-to-day use"""
     print("Tutoring Payment Management System")
     print("=" * 40)
     
@@ -330,9 +1754,14 @@ def main():
         print("7. Export Data")
         print("8. View Recent Sessions")
         print("9. View Recent Payments")
+        print("10. Rebuild Student Balances")
+        print("11. Rebuild Monthly Reports")
+        print("12. Bulk Import From File")
+        print("13. Generate All Invoices For A Month")
+        print("14. Month-End Package Rollover")
         print("0. Exit")
         
-        choice = input("\nEnter your choice (0-9): ")
+        choice = input("\nEnter your choice (0-14): ")
         
         try:
             if choice == "1":
@@ -407,8 +1836,9 @@ def main():
             
             elif choice == "7":
                 table = input("Table name (students/sessions/payments): ")
-                filename = input("Export filename (e.g., students.csv): ")
-                pm.export_data(table, filename)
+                filename = input("Export filename (.csv, .jsonl or .parquet): ")
+                incremental = input("Only rows added since the last export? (y/N): ").lower() == 'y'
+                pm.export_data(table, filename, incremental=incremental)
             
             elif choice == "8":
                 sessions_df = pm.get_sessions()
@@ -420,6 +1850,35 @@ def main():
                 print("\nRecent Payments:")
                 print(payments_df[['payment_date', 'student_name', 'amount', 'payment_method']].head(10).to_string(index=False))
             
+            elif choice == "10":
+                result = pm.rebuild_balances()
+                for row in result['mismatches']:
+                    print(f"  Student {row['student_id']}: stored owed/paid "
+                          f"{row['stored_owed']}/{row['stored_paid']}, "
+                          f"ledger {row['ledger_owed']}/{row['ledger_paid']}")
+            
+            elif choice == "11":
+                pm.rebuild_rollups()
+            
+            elif choice == "12":
+                table = input("Table (students/sessions/payments): ")
+                path = input("CSV or JSONL file: ")
+                summary = pm.bulk_import(table, path)
+                for reject in summary['rejects']:
+                    print(f"  Row {reject['row']}: {reject['reason']}")
+            
+            elif choice == "13":
+                month_year = input("Month (YYYY-MM): ")
+                output_dir = input(f"Output folder (default invoices/{month_year}): ") or f"invoices/{month_year}"
+                invoices = pm.generate_invoices(month_year)
+                pm.write_invoices(invoices, output_dir)
+                total_due = sum(invoice['summary']['balance_due'] for invoice in invoices.values())
+                print(f"Total balance due across {len(invoices)} invoice(s): ${total_due:.2f}")
+            
+            elif choice == "14":
+                month_year = input("Month to open (YYYY-MM, default this month): ") or None
+                pm.roll_over_packages(month_year)
+            
             elif choice == "0":
                 print("Goodbye!")
                 break
@@ -0,0 +1,57 @@
+"""
+EXPLAIN QUERY PLAN checks for the payment manager's read queries
+Read methods are called with representative arguments while their SQL is
+traced, then every SELECT they issued is explained and full scans reported
+"""
+
+import re
+from typing import Callable, Dict, Any, List, Tuple
+
+# Rollup tables hold one row per month, so walking them end to end is expected
+SCAN_ALLOWED = {'monthly_revenue_rollup', 'payment_method_rollup'}
+# Calls that aggregate over every active student read every row whichever way
+# they go; a scan there is the cheapest plan, not a missing index
+SCAN_EXPECTED_CALLS = {'get_balance_totals'}
+
+# "SCAN sessions" is a full table scan; "SCAN s USING INDEX ..." walks an
+# index in order (bounded by LIMIT) and "SCAN (subquery-1)" reads a temp result
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+# Named subqueries and CTEs are announced before they're scanned ("CO-ROUTINE h"
+# ... "SCAN h"); scanning those reads the temp result, not a table
+TEMP_RESULT = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)$')
+
+
+def collect_plans(pm, calls: List[Tuple[str, Callable[[], Any]]]) -> List[Dict[str, Any]]:
+    """Run each (label, call) and return the query plan of every SELECT it issued"""
+    plans = []
+    with pm.get_connection() as conn:
+        for label, call in calls:
+            statements = []
+            # Cached results would skip the database, so start every call cold
+            pm.cache.clear()
+            conn.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                conn.set_trace_callback(None)
+
+            for sql in statements:
+                if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                steps = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                plans.append({'call': label, 'sql': ' '.join(sql.split()), 'plan': steps})
+    return plans
+
+
+def full_scans(plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Plans containing a full table scan outside SCAN_ALLOWED and SCAN_EXPECTED_CALLS"""
+    problems = []
+    for plan in plans:
+        if plan['call'] in SCAN_EXPECTED_CALLS:
+            continue
+        temp = {match.group(1) for match in map(TEMP_RESULT.match, plan['plan']) if match}
+        scanned = [match.group(1) for match in map(FULL_SCAN.match, plan['plan'])
+                   if match and match.group(1) not in SCAN_ALLOWED | temp]
+        if scanned:
+            problems.append(dict(plan, scanned=scanned))
+    return problems
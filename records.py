@@ -0,0 +1,135 @@
+"""
+Lightweight row records for the web layer
+Small __slots__ classes built straight from sqlite cursor rows, so pages and
+JSON APIs that just iterate rows don't pay for a DataFrame per request
+"""
+
+from dataclasses import dataclass
+
+
+class Record:
+    __slots__ = ()
+
+    @classmethod
+    def factory(cls, cursor, row):
+        """sqlite3 row_factory building this record from a row in field order"""
+        return cls(*row)
+
+    def as_dict(self) -> dict:
+        """Plain dict of the record's fields (for JSON responses)"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+@dataclass
+class Student(Record):
+    __slots__ = ('id', 'name', 'email', 'phone', 'parent_name', 'parent_email',
+                 'package_type', 'hourly_rate', 'created_date', 'is_active')
+    id: int
+    name: str
+    email: str
+    phone: str
+    parent_name: str
+    parent_email: str
+    package_type: str
+    hourly_rate: float
+    created_date: str
+    is_active: int
+
+
+@dataclass
+class Session(Record):
+    __slots__ = ('id', 'student_id', 'session_date', 'start_time', 'end_time',
+                 'duration_hours', 'subject', 'session_cost', 'notes', 'status',
+                 'created_date', 'student_name', 'student_email')
+    id: int
+    student_id: int
+    session_date: str
+    start_time: str
+    end_time: str
+    duration_hours: float
+    subject: str
+    session_cost: float
+    notes: str
+    status: str
+    created_date: str
+    student_name: str
+    student_email: str
+
+
+@dataclass
+class Payment(Record):
+    __slots__ = ('id', 'student_id', 'payment_date', 'amount', 'payment_method',
+                 'reference_number', 'notes', 'created_date', 'student_name',
+                 'student_email')
+    id: int
+    student_id: int
+    payment_date: str
+    amount: float
+    payment_method: str
+    reference_number: str
+    notes: str
+    created_date: str
+    student_name: str
+    student_email: str
+
+
+@dataclass
+class Balance(Record):
+    __slots__ = ('id', 'name', 'email', 'total_owed', 'total_paid', 'balance_due')
+    id: int
+    name: str
+    email: str
+    total_owed: float
+    total_paid: float
+    balance_due: float
+
+
+@dataclass
+class MonthlyRevenue(Record):
+    __slots__ = ('month', 'sessions_completed', 'revenue', 'total_hours')
+    month: str
+    sessions_completed: int
+    revenue: float
+    total_hours: float
+
+
+@dataclass
+class PaymentMethodSummary(Record):
+    __slots__ = ('month', 'payment_count', 'total_received', 'payment_method', 'percentage')
+    month: str
+    payment_count: int
+    total_received: float
+    payment_method: str
+    percentage: float
+
+
+@dataclass
+class SearchResult(Record):
+    __slots__ = ('kind', 'id', 'student_id', 'student_name', 'date', 'title', 'snippet', 'score')
+    kind: str
+    id: int
+    student_id: int
+    student_name: str
+    date: str
+    title: str
+    snippet: str
+    score: float
+
+
+@dataclass
+class Package(Record):
+    __slots__ = ('id', 'student_id', 'student_name', 'package_type', 'month_year', 'total_sessions',
+                 'completed_sessions', 'sessions_remaining', 'package_cost', 'amount_due', 'is_paid',
+                 'payment_due_date')
+    id: int
+    student_id: int
+    student_name: str
+    package_type: str
+    month_year: str
+    total_sessions: int
+    completed_sessions: int
+    sessions_remaining: int
+    package_cost: float
+    amount_due: float
+    is_paid: int
+    payment_due_date: str
@@ -0,0 +1,163 @@
+"""
+In-process read-through cache for TutoringPaymentManager query results
+Entries expire after a TTL, the least recently used are evicted first, and
+each entry is tagged with the tables it reads so writes can invalidate it
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0):
+        """Create a cache; max_entries=0 disables caching entirely"""
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def generation(self, tables: Iterable[str]) -> tuple:
+        """Current write generation of each table"""
+        return tuple(self._generations.get(table, 0) for table in tables)
+
+    def get_or_compute(self, key, tables: Iterable[str], compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it on a miss"""
+        if not self.max_entries:
+            return compute()
+        if getattr(self._local, 'refreshing', False):
+            return self.refresh(key, tables, compute)
+
+        tables = tuple(tables)
+        with self._lock:
+            generation = self.generation(tables)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_generation, expires = entry
+                if entry_generation != generation:
+                    del self._entries[key]
+                elif expires < time.monotonic():
+                    del self._entries[key]
+                    self._stats['expirations'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+            self._stats['misses'] += 1
+
+        # Computed outside the lock; a write that lands meanwhile bumps the
+        # generation, so this result is already stale on the next lookup
+        value = compute()
+        self._store(key, value, generation)
+        return value
+
+    def refresh(self, key, tables: Iterable[str], compute: Callable[[], Any]) -> Any:
+        """Recompute and store the value for key even if a valid one is cached,
+        restarting its TTL (used to keep entries warm before they expire)"""
+        if not self.max_entries:
+            return compute()
+        tables = tuple(tables)
+        with self._lock:
+            generation = self.generation(tables)
+            self._stats['refreshes'] += 1
+        value = compute()
+        self._store(key, value, generation)
+        return value
+
+    @contextmanager
+    def refreshing(self):
+        """Within the block, this thread's lookups refresh() instead of reading
+        the cache, so calling the cached methods renews their entries"""
+        self._local.refreshing = True
+        try:
+            yield self
+        finally:
+            self._local.refreshing = False
+
+    def _store(self, key, value, generation: tuple):
+        with self._lock:
+            self._entries[key] = (value, generation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, *tables: str):
+        """Bump the generation of each written table, staling dependent entries"""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self._stats['invalidations'] += 1
+
+    def track_versions(self, versions: Dict[str, Any]):
+        """Invalidate the tables whose data version moved since it was last seen.
+
+        invalidate() only hears about this process's writes; the database's
+        per-table versions count every process's, so checking them before
+        serving catches writes made elsewhere.
+        """
+        with self._lock:
+            changed = [table for table, version in versions.items()
+                       if self._versions.get(table) != version]
+            if not changed:
+                return
+            for table in changed:
+                self._versions[table] = versions[table]
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+                'generations': dict(self._generations),
+            })
+        return stats
+
+
+def cached(*tables: str):
+    """Cache a TutoringPaymentManager read method, keyed on its arguments.
+
+    The method's result is shared between callers, so treat it as read-only.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                # Unhashable arguments (e.g. lists) just skip the cache
+                return method(self, *args, **kwargs)
+            return self.cache.get_or_compute(
+                key, tables, lambda: method(self, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,171 @@
+"""
+Scheduling checks for the tutoring calendar
+Booked sessions (Scheduled or Completed) are loaded for just the days in
+question (through idx_sessions_status_date_time) and kept in a per-day
+interval index, so conflict checks and free-slot searches cost
+O(sessions on those days) rather than O(history)
+"""
+
+import bisect
+import json
+from datetime import date, time, timedelta
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+
+# Sessions that hold their time slot; Cancelled and No-Show ones free it
+BOOKED_STATUSES = ('Scheduled', 'Completed')
+
+# Default working hours and slot grid for available_slots()
+DAY_START = '09:00'
+DAY_END = '21:00'
+SLOT_STEP_MINUTES = 30
+
+# Upper bound on one recurring-session request (a school year of twice-weekly sessions)
+MAX_OCCURRENCES = 120
+
+
+class ScheduleConflict(ValueError):
+    """Raised when a session would overlap one already booked.
+
+    conflicts lists {'session_date', 'start_time', 'end_time', 'conflicts_with'}
+    for every clashing occurrence; conflicts_with holds the booked session ids.
+    """
+
+    def __init__(self, conflicts: List[Dict[str, Any]]):
+        self.conflicts = conflicts
+        first = conflicts[0]
+        booked = ', '.join(str(i) for i in first['conflicts_with'] if i is not None)
+        message = (f"{first['session_date']} {first['start_time']}-{first['end_time']} overlaps "
+                   + (f"session(s) {booked}" if booked else "another new session"))
+        if len(conflicts) > 1:
+            message += f" (and {len(conflicts) - 1} more conflict(s))"
+        super().__init__(message)
+
+
+def normalize_time(value: str) -> str:
+    """'9:00', '09:00' or '09:00:00' -> '09:00', as sessions store times"""
+    try:
+        return time.fromisoformat(str(value).strip().zfill(5)).isoformat(timespec='minutes')
+    except ValueError:
+        raise ValueError(f"Time must be in HH:MM format: {value!r}")
+
+
+def minutes(value: str) -> int:
+    """Minutes since midnight of an HH:MM time"""
+    hours, mins = value.split(':')[:2]
+    return int(hours) * 60 + int(mins)
+
+
+def clock(total_minutes: int) -> str:
+    return f"{total_minutes // 60:02d}:{total_minutes % 60:02d}"
+
+
+def session_hours(start_time: str, end_time: str, duration_hours: float = None) -> float:
+    """Length of a session from its times, checked against duration_hours if given"""
+    length = minutes(end_time) - minutes(start_time)
+    if length <= 0:
+        raise ValueError(f"End time {end_time} must be after start time {start_time}")
+    hours = round(length / 60, 2)
+    if duration_hours is not None and abs(float(duration_hours) - hours) > 0.01:
+        raise ValueError(f"Duration {duration_hours}h does not match {start_time}-{end_time} ({hours}h)")
+    return hours
+
+
+def weekly_dates(start_date: str, end_date: str, weekdays: Iterable[int] = None,
+                 every_weeks: int = 1) -> List[str]:
+    """Dates from start_date to end_date (inclusive) falling on weekdays
+    (0 = Monday, default start_date's weekday), every every_weeks weeks"""
+    first, last = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    if last < first:
+        raise ValueError("End date must not be before start date")
+    if every_weeks < 1:
+        raise ValueError("every_weeks must be at least 1")
+    weekdays = sorted(set(weekdays)) if weekdays is not None else [first.weekday()]
+    if not weekdays or any(day not in range(7) for day in weekdays):
+        raise ValueError("Weekdays must be numbers from 0 (Monday) to 6 (Sunday)")
+
+    # Weeks are counted from the Monday of start_date's week
+    week_start = first - timedelta(days=first.weekday())
+    dates = []
+    while week_start <= last:
+        for weekday in weekdays:
+            day = week_start + timedelta(days=weekday)
+            if first <= day <= last:
+                dates.append(day.isoformat())
+        week_start += timedelta(weeks=every_weeks)
+    if len(dates) > MAX_OCCURRENCES:
+        raise ValueError(f"{len(dates)} occurrences requested; at most {MAX_OCCURRENCES} at a time")
+    return dates
+
+
+class IntervalIndex:
+    """Booked intervals per day, sorted by start time (in minutes)"""
+
+    def __init__(self):
+        self.days: Dict[str, Tuple[List[int], List[Tuple[int, int, Optional[int]]]]] = {}
+
+    def add(self, day: str, start: int, end: int, session_id: int = None):
+        starts, intervals = self.days.setdefault(day, ([], []))
+        position = bisect.bisect_right(starts, start)
+        starts.insert(position, start)
+        intervals.insert(position, (start, end, session_id))
+
+    def overlapping(self, day: str, start: int, end: int) -> List[Tuple[int, int, Optional[int]]]:
+        """Booked intervals on day overlapping [start, end); back-to-back is fine"""
+        if day not in self.days:
+            return []
+        starts, intervals = self.days[day]
+        # Only intervals starting before `end` can overlap; of those, keep the ones ending after `start`
+        return [interval for interval in intervals[:bisect.bisect_left(starts, end)]
+                if interval[1] > start]
+
+    def free_slots(self, day: str, day_start: int, day_end: int, length: int,
+                   step: int = SLOT_STEP_MINUTES) -> List[Tuple[int, int]]:
+        """Start-aligned (multiples of step) slots of length minutes free on day"""
+        slots = []
+        cursor = day_start
+        _, intervals = self.days.get(day, ([], []))
+        for start, end, _ in intervals + [(day_end, day_end, None)]:
+            gap_end = min(start, day_end)
+            slot = -(-cursor // step) * step
+            while slot + length <= gap_end:
+                slots.append((slot, slot + length))
+                slot += step
+            cursor = max(cursor, end)
+            if cursor >= day_end:
+                break
+        return slots
+
+
+def load_booked(conn, days: Iterable[str] = None, start_date: str = None,
+                end_date: str = None) -> IntervalIndex:
+    """IntervalIndex of booked sessions on the given days, or from start_date to end_date"""
+    query = f"""
+        SELECT session_date, start_time, end_time, id FROM sessions
+        WHERE status IN ({', '.join(f"'{status}'" for status in BOOKED_STATUSES)})
+    """
+    if days is not None:
+        query += " AND session_date IN (SELECT value FROM json_each(?))"
+        params = [json.dumps(sorted(set(days)))]
+    else:
+        query += " AND session_date BETWEEN ? AND ?"
+        params = [start_date, end_date]
+
+    index = IntervalIndex()
+    for day, start_time, end_time, session_id in conn.execute(query, params):
+        index.add(day, minutes(start_time), minutes(end_time), session_id)
+    return index
+
+
+def find_conflicts(index: IntervalIndex, occurrences: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """Check (date, start, end) occurrences against the index and each other,
+    adding each free one to the index; returns the ones that clash"""
+    conflicts = []
+    for day, start_time, end_time in occurrences:
+        start, end = minutes(start_time), minutes(end_time)
+        clashes = index.overlapping(day, start, end)
+        if clashes:
+            conflicts.append({'session_date': day, 'start_time': start_time, 'end_time': end_time,
+                              'conflicts_with': [session_id for _, _, session_id in clashes]})
+        else:
+            index.add(day, start, end)
+    return conflicts
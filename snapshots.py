@@ -0,0 +1,430 @@
+"""
+Columnar analytics snapshot of sessions and payments
+sync() copies rows added since the last sync (by id watermark) into Parquet
+files partitioned by month, and rewrites the months whose rows changed since
+(noted by the triggers from migration 7). The reports load each table into
+NumPy columns once per sync and aggregate with bincount/unique, so
+long-range reports never touch the transactional database
+"""
+
+import json
+import os
+import shutil
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+import aggregates
+
+# Snapshotted tables: the date column that picks a row's month partition, and
+# the columns copied with their Arrow types (notes and other free text stay behind)
+SNAPSHOT_TABLES = {
+    'sessions': {'date': 'session_date', 'columns': {
+        'id': 'int64', 'student_id': 'int64', 'session_date': 'string', 'subject': 'string',
+        'duration_hours': 'float64', 'session_cost': 'float64', 'status': 'string'}},
+    'payments': {'date': 'payment_date', 'columns': {
+        'id': 'int64', 'student_id': 'int64', 'payment_date': 'string', 'amount': 'float64',
+        'payment_method': 'string'}},
+}
+
+# Watermarks and generation, next to the table directories
+STATE_FILE = '_state.json'
+
+# Rows per Parquet part while copying, and how many appended parts a month
+# collects before they are merged into one
+CHUNK_SIZE = 50000
+MAX_PARTS = 16
+
+# /api/analytics/<name> -> (report function, {query parameter: (type, minimum, maximum)})
+REPORTS = {
+    'revenue_trend': ('revenue_trend', {'months': (int, 1, 600)}),
+    'retention_cohorts': ('retention_cohorts', {'months': (int, 1, 120), 'horizon': (int, 1, 36)}),
+    'revenue_by_subject': ('revenue_by_subject', {'months': (int, 1, 600)}),
+    'payment_method_mix': ('payment_method_mix', {'months': (int, 1, 600)}),
+}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise RuntimeError("The analytics snapshot needs pyarrow (pip install pyarrow)")
+
+
+def load_state(root: str) -> Dict[str, Any]:
+    """Watermarks and generation of the snapshot under root (zeros if never synced)"""
+    try:
+        with open(os.path.join(root, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'watermarks': {}, 'generation': 0, 'synced_at': None}
+
+
+def _save_state(root: str, state: Dict[str, Any]):
+    path = os.path.join(root, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _schema(table: str):
+    import pyarrow as pa
+
+    return pa.schema([(name, getattr(pa, kind)())
+                      for name, kind in SNAPSHOT_TABLES[table]['columns'].items()])
+
+
+def _parts(directory: str) -> List[str]:
+    """Part files in a month directory, oldest ids first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith('part-') and name.endswith('.parquet'))
+
+
+def _write_part(root: str, table: str, month: str, rows: List[tuple], replace: bool = False):
+    """Write one month's rows as a part file named by their id range.
+
+    With replace=True the month's existing parts are swapped for it (an empty
+    rows list removes the month). Files are written under a dot-name first,
+    which readers skip, then renamed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = os.path.join(root, table, f"month={month}")
+    old = _parts(directory) if replace else []
+    if rows:
+        os.makedirs(directory, exist_ok=True)
+        ids = [row[0] for row in rows]
+        name = f"part-{min(ids):012d}-{max(ids):012d}.parquet"
+        schema = _schema(table)
+        data = pa.Table.from_pydict(
+            {field: [row[i] for row in rows] for i, field in enumerate(schema.names)}, schema=schema)
+        pq.write_table(data, os.path.join(directory, '.' + name))
+        for stale in old:
+            os.remove(os.path.join(directory, stale))
+        os.replace(os.path.join(directory, '.' + name), os.path.join(directory, name))
+    elif old:
+        shutil.rmtree(directory)
+
+
+def _compact(root: str, table: str, month: str):
+    """Merge a month's appended parts into one file once there are too many"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = os.path.join(root, table, f"month={month}")
+    parts = _parts(directory)
+    if len(parts) <= MAX_PARTS:
+        return
+    merged = pa.concat_tables([pq.read_table(os.path.join(directory, name)) for name in parts])
+    _write_part(root, table, month, list(zip(*merged.to_pydict().values())), replace=True)
+
+
+def _discard_unfinished(root: str, table: str, watermark: int):
+    """Remove what an interrupted sync left past the recorded watermark"""
+    table_dir = os.path.join(root, table)
+    if not os.path.isdir(table_dir):
+        return
+    for month_dir in os.listdir(table_dir):
+        directory = os.path.join(table_dir, month_dir)
+        for name in os.listdir(directory):
+            # Temporaries, and appended parts whose rows will be copied again
+            if name.startswith('.') or (name.startswith('part-') and int(name.split('-')[1]) > watermark):
+                os.remove(os.path.join(directory, name))
+
+
+def _next_month(month: str) -> str:
+    return aggregates.month_labels(month, 2)[1]
+
+
+def sync(conn, root: str, full: bool = False) -> Dict[str, Any]:
+    """Bring the snapshot under root up to date with the database behind conn.
+
+    Everything is read in one transaction, so the snapshot is consistent as
+    of a single moment. Rows past each table's watermark are appended to
+    their month; months noted in snapshot_changes are rewritten whole. With
+    full=True every month is rewritten. Returns per-table counts, plus
+    'changes': the (table, month, version) marks now reflected, which the
+    caller deletes from snapshot_changes once this returns.
+    """
+    require_pyarrow()
+    state = load_state(root)
+    os.makedirs(root, exist_ok=True)
+    stats = {'changes': []}
+
+    conn.execute("BEGIN")
+    try:
+        for table, spec in SNAPSHOT_TABLES.items():
+            # table and its columns come from SNAPSHOT_TABLES, so interpolating them is safe
+            columns, date_column = ', '.join(spec['columns']), spec['date']
+            watermark = 0 if full else state['watermarks'].get(table, 0)
+            if full:
+                shutil.rmtree(os.path.join(root, table), ignore_errors=True)
+            else:
+                _discard_unfinished(root, table, watermark)
+
+            high = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            marks = conn.execute("SELECT month, version FROM snapshot_changes WHERE table_name = ?",
+                                 (table,)).fetchall()
+            stats['changes'] += [(table, month, version) for month, version in marks]
+            # A full sync copies every row as new, which covers the marked months too
+            changed = [] if full else sorted(month for month, _ in marks if month)
+
+            for month in changed:
+                rows = conn.execute(f"""
+                    SELECT {columns} FROM {table}
+                    WHERE {date_column} >= ? AND {date_column} < ? AND id <= ?
+                    ORDER BY id
+                """, (f"{month}-01", f"{_next_month(month)}-01", high)).fetchall()
+                _write_part(root, table, month, rows, replace=True)
+
+            # New rows outside the rewritten months, grouped into months in id order
+            cursor = conn.execute(f"""
+                SELECT {columns}, substr({date_column}, 1, 7) AS month FROM {table}
+                WHERE id > ? AND id <= ?
+                  AND substr({date_column}, 1, 7) NOT IN (SELECT value FROM json_each(?))
+                ORDER BY month, id
+            """, (watermark, high, json.dumps(changed)))
+            appended, month, pending = 0, None, []
+            touched = set()
+            while True:
+                chunk = cursor.fetchmany(CHUNK_SIZE)
+                for row in chunk:
+                    if row[-1] != month or len(pending) >= CHUNK_SIZE:
+                        if pending:
+                            _write_part(root, table, month, pending)
+                        month, pending = row[-1], []
+                        touched.add(month)
+                    pending.append(row[:-1])
+                    appended += 1
+                if not chunk:
+                    break
+            if pending:
+                _write_part(root, table, month, pending)
+            for month in touched:
+                _compact(root, table, month)
+
+            state['watermarks'][table] = high
+            stats[table] = {'appended': appended, 'rewritten_months': changed, 'watermark': high}
+    finally:
+        conn.rollback()
+
+    state['generation'] += 1
+    state['synced_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    _save_state(root, state)
+    stats['generation'] = state['generation']
+    return stats
+
+
+# Reports
+
+@lru_cache(maxsize=len(SNAPSHOT_TABLES))
+def _load(root: str, table: str, generation: int) -> Dict[str, Any]:
+    """One snapshot table in memory as NumPy columns, cached until the next sync.
+
+    Numeric columns are arrays; text columns are (distinct values, per-row
+    codes); 'month' holds each row's month as months since year 0.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    path = os.path.join(root, table)
+    if os.path.isdir(path) and any(_parts(os.path.join(path, d)) for d in os.listdir(path)):
+        partitioning = ds.partitioning(pa.schema([('month', pa.dictionary(pa.int32(), pa.string()))]),
+                                       flavor='hive', dictionaries='infer')
+        data = ds.dataset(path, partitioning=partitioning).to_table().unify_dictionaries().combine_chunks()
+        month = data.column('month').chunk(0)
+        labels = month.dictionary.to_pylist()
+        lookup = np.array([int(label[:4]) * 12 + int(label[5:7]) - 1 for label in labels], dtype=np.int64)
+        months = lookup[month.indices.to_numpy()]
+    else:
+        data, months = _schema(table).empty_table(), np.empty(0, dtype=np.int64)
+
+    columns = {'month': months}
+    for field in _schema(table):
+        if pa.types.is_string(field.type):
+            # Only payment_method is nullable, and 'Other' is its catch-all anyway
+            encoded = pc.dictionary_encode(pc.fill_null(data.column(field.name), 'Other')).combine_chunks()
+            columns[field.name] = (encoded.dictionary.to_pylist(),
+                                   encoded.indices.to_numpy(zero_copy_only=False))
+        else:
+            columns[field.name] = data.column(field.name).to_numpy()
+    return columns
+
+
+def _columns(root: str, table: str) -> Dict[str, Any]:
+    return _load(os.path.abspath(root), table, load_state(root)['generation'])
+
+
+def _equals(column, value: str):
+    """Row mask of a text column (as returned by _load) equal to value"""
+    import numpy as np
+
+    values, codes = column
+    return codes == values.index(value) if value in values else np.zeros(len(codes), dtype=bool)
+
+
+def _month_label(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _window(months: Optional[int], *month_arrays) -> Tuple[int, int]:
+    """(first, last) month indexes of a report: the last `months` months up to
+    this month, or from the earliest month in month_arrays if months is None"""
+    today = date.today()
+    last = today.year * 12 + today.month - 1
+    if months:
+        return last - months + 1, last
+    earliest = [int(array.min()) for array in month_arrays if len(array)]
+    return min(earliest + [last]), last
+
+
+def _sorted_unique(values):
+    """Distinct values, sorted (by sorting: much faster than np.unique's hashing here)"""
+    import numpy as np
+
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+def _distinct_per_bucket(buckets, keys, size: int):
+    """Number of distinct keys in each bucket (0 .. size-1)"""
+    import numpy as np
+
+    pairs = _sorted_unique(buckets.astype(np.int64) << 32 | keys.astype(np.int64))
+    return np.bincount(pairs >> 32, minlength=size)
+
+
+def _sums(buckets, weights, size: int) -> List[float]:
+    """Sum of weights in each bucket (0 .. size-1), rounded to cents"""
+    import numpy as np
+
+    return np.round(np.bincount(buckets, weights, size).astype(float), 2).tolist()
+
+
+def revenue_trend(root: str, months: int = 24) -> Dict[str, list]:
+    """Monthly completed sessions, revenue, hours, active students and payments received"""
+    import numpy as np
+
+    sessions, payments = _columns(root, 'sessions'), _columns(root, 'payments')
+    first, last = _window(months, sessions['month'], payments['month'])
+    size = last - first + 1
+
+    done = _equals(sessions['status'], 'Completed') & (sessions['month'] >= first) & (sessions['month'] <= last)
+    offset = sessions['month'][done] - first
+    paid = (payments['month'] >= first) & (payments['month'] <= last)
+    return {
+        'month': [_month_label(first + n) for n in range(size)],
+        'sessions_completed': np.bincount(offset, minlength=size).tolist(),
+        'revenue': _sums(offset, sessions['session_cost'][done], size),
+        'hours': _sums(offset, sessions['duration_hours'][done], size),
+        'active_students': _distinct_per_bucket(offset, sessions['student_id'][done], size).tolist(),
+        'payments_received': _sums(payments['month'][paid] - first, payments['amount'][paid], size),
+    }
+
+
+def retention_cohorts(root: str, months: int = 12, horizon: int = 6) -> Dict[str, list]:
+    """Students grouped by the month of their first completed session.
+
+    retention[i][k] is the percentage of cohort i with a completed session k
+    months after their first (None for months that haven't happened yet).
+    """
+    import numpy as np
+
+    # First sessions can be years back, so the whole history counts
+    sessions = _columns(root, 'sessions')
+    done = _equals(sessions['status'], 'Completed')
+    pairs = _sorted_unique(sessions['student_id'][done].astype(np.int64) << 32 | sessions['month'][done])
+    students, active = pairs >> 32, pairs & 0xFFFFFFFF
+    # pairs are sorted by student then month, so each student's first row is their first month
+    starts = np.flatnonzero(np.concatenate(([True], students[1:] != students[:-1])))
+    cohort = np.repeat(active[starts], np.diff(np.append(starts, len(pairs))))
+    offset = active - cohort
+
+    first, last = _window(months)
+    size = last - first + 1
+    keep = (cohort >= first) & (cohort <= last) & (offset < horizon)
+    table = np.zeros((size, horizon), dtype=np.int64)
+    np.add.at(table, (cohort[keep] - first, offset[keep]), 1)
+
+    sizes = table[:, 0]
+    rates = np.round(table * 100.0 / np.maximum(sizes, 1)[:, None], 1)
+    return {
+        'cohort': [_month_label(first + n) for n in range(size)],
+        'students': sizes.tolist(),
+        'retention': [[float(rates[i, k]) if sizes[i] and first + i + k <= last else None
+                       for k in range(horizon)] for i in range(size)],
+    }
+
+
+def revenue_by_subject(root: str, months: int = 12) -> Dict[str, list]:
+    """Completed sessions, revenue, hours and revenue share per subject, highest revenue first"""
+    import numpy as np
+
+    sessions = _columns(root, 'sessions')
+    first, last = _window(months, sessions['month'])
+    done = _equals(sessions['status'], 'Completed') & (sessions['month'] >= first) & (sessions['month'] <= last)
+    subjects, codes = sessions['subject']
+    codes = codes[done]
+
+    count = np.bincount(codes, minlength=len(subjects))
+    revenue = np.bincount(codes, sessions['session_cost'][done], len(subjects))
+    hours = np.bincount(codes, sessions['duration_hours'][done], len(subjects))
+    order = [i for i in np.argsort(-revenue, kind='stable') if count[i]]
+    total = revenue.sum()
+    return {
+        'subject': [subjects[i] for i in order],
+        'sessions': [int(count[i]) for i in order],
+        'revenue': [round(float(revenue[i]), 2) for i in order],
+        'hours': [round(float(hours[i]), 2) for i in order],
+        'share': [round(float(revenue[i] * 100.0 / total), 1) for i in order],
+    }
+
+
+def payment_method_mix(root: str, months: int = 12) -> Dict[str, Any]:
+    """Payments per method over the window (count, amount, share) and each method's monthly amounts"""
+    import numpy as np
+
+    payments = _columns(root, 'payments')
+    first, last = _window(months, payments['month'])
+    size = last - first + 1
+    paid = (payments['month'] >= first) & (payments['month'] <= last)
+    methods, codes = payments['payment_method']
+    codes, offset, amount = codes[paid], payments['month'][paid] - first, payments['amount'][paid]
+
+    count = np.bincount(codes, minlength=len(methods))
+    totals = np.bincount(codes, amount, len(methods))
+    monthly = np.bincount(codes * size + offset, amount, len(methods) * size).reshape(len(methods), size)
+    order = [i for i in np.argsort(-totals, kind='stable') if count[i]]
+    total = totals.sum()
+    return {
+        'method': [methods[i] for i in order],
+        'payments': [int(count[i]) for i in order],
+        'amount': [round(float(totals[i]), 2) for i in order],
+        'share': [round(float(totals[i] * 100.0 / total), 1) for i in order],
+        'month': [_month_label(first + n) for n in range(size)],
+        'monthly': {methods[i]: np.round(monthly[i], 2).tolist() for i in order},
+    }
+
+
+@lru_cache(maxsize=64)
+def _cached_report(root: str, generation: int, today: str, function: str, kwargs: tuple):
+    # Keyed on the snapshot generation (bumped by every sync) and the date the
+    # month windows are relative to, so a hit is always current
+    return globals()[function](root, **dict(kwargs))
+
+
+def run(root: str, name: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """Run the report behind /api/analytics/<name> with validated query parameters"""
+    if name not in REPORTS:
+        raise LookupError(f"No report named '{name}' (choose from {', '.join(REPORTS)})")
+    function, spec = REPORTS[name]
+    kwargs = aggregates.parse_params(spec, params)
+    require_pyarrow()
+    generation = load_state(root)['generation']
+    return _cached_report(os.path.abspath(root), generation, date.today().isoformat(),
+                          function, tuple(sorted(kwargs.items())))
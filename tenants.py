@@ -0,0 +1,305 @@
+"""
+Multi-tenant mode: one database per tutor
+TenantRouter maps a tenant id to its own database file and keeps an LRU of
+open TutoringPaymentManagers, migrating a tenant's schema the first time it
+is opened. Tenants never share a file, so their writes don't queue behind one
+lock; cross-tenant reports fan out over a process pool, one tenant per task.
+Run with: python tenants.py --dir tenants {list,create,report} ...
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+import aggregates
+import snapshots
+from instrumentation import Metrics
+from payment_manager import TutoringPaymentManager
+
+# Tenant ids name database files, so they are kept to a safe alphabet
+TENANT_ID = re.compile(r'[a-z0-9][a-z0-9_-]{0,62}')
+
+# Report sources for cross-tenant fan-out: {source: {name: (method, parameter spec)}}
+REPORT_SOURCES = {
+    'aggregates': aggregates.ENDPOINTS,
+    'analytics': {name: (name, spec) for name, (_, spec) in snapshots.REPORTS.items()},
+}
+
+# Reports whose per-tenant results can be added up: (label column or None for
+# a single row, the columns that are summed). Averages, shares and retention
+# rates are left per tenant.
+COMBINABLE = {
+    ('aggregates', 'totals'): (None, ('students', 'total_owed', 'total_paid', 'total_outstanding',
+                                      'students_owing')),
+    ('aggregates', 'revenue_by_subject'): ('subject', ('sessions', 'revenue', 'hours')),
+    ('aggregates', 'revenue_by_weekday'): ('weekday', ('sessions', 'revenue', 'hours')),
+    ('analytics', 'revenue_trend'): ('month', ('sessions_completed', 'revenue', 'hours',
+                                               'active_students', 'payments_received')),
+    ('analytics', 'revenue_by_subject'): ('subject', ('sessions', 'revenue', 'hours')),
+}
+
+
+class UnknownTenant(LookupError):
+    """Raised for a tenant with no database (create it first)"""
+
+
+def check_tenant_id(tenant: str) -> str:
+    if not isinstance(tenant, str) or not TENANT_ID.fullmatch(tenant):
+        raise ValueError(f"Invalid tenant id {tenant!r} (lowercase letters, digits, '-' and '_')")
+    return tenant
+
+
+class TenantRouter:
+    def __init__(self, root: str, max_open: int = 32, pool_size: int = 4,
+                 report_workers: int = None, slow_query_ms: float = 250.0, **manager_options):
+        """Route tenants to databases named <tenant>.db under root.
+
+        At most max_open managers stay open (least recently used ones are
+        closed once idle); each gets pool_size connections. Managers share
+        one Metrics registry, so /metrics covers every tenant.
+        manager_options are passed on to TutoringPaymentManager.
+        """
+        self.root = root
+        self.max_open = max_open
+        self.pool_size = pool_size
+        self.report_workers = report_workers or os.cpu_count() or 1
+        self.manager_options = manager_options
+        self.metrics = Metrics(slow_query_seconds=slow_query_ms / 1000)
+        os.makedirs(root, exist_ok=True)
+
+        # tenant -> [manager, leases], least recently used first
+        self._open: 'OrderedDict[str, list]' = OrderedDict()
+        self._opening: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reports = None
+        self._stats = {'hits': 0, 'opened': 0, 'evicted': 0}
+
+    def db_path(self, tenant: str) -> str:
+        return os.path.join(self.root, f"{check_tenant_id(tenant)}.db")
+
+    def tenants(self) -> List[str]:
+        """Every tenant with a database under root"""
+        return sorted(name[:-3] for name in os.listdir(self.root)
+                      if name.endswith('.db') and TENANT_ID.fullmatch(name[:-3]))
+
+    def create_tenant(self, tenant: str) -> str:
+        """Create (and migrate) a tenant's database; returns its path"""
+        with self.manager(tenant, create=True):
+            pass
+        return self.db_path(tenant)
+
+    @contextmanager
+    def manager(self, tenant: str, create: bool = False) -> Iterator[TutoringPaymentManager]:
+        """The tenant's manager, kept open for the duration of the block"""
+        pm = self.acquire(tenant, create)
+        try:
+            yield pm
+        finally:
+            self.release(tenant)
+
+    def acquire(self, tenant: str, create: bool = False) -> TutoringPaymentManager:
+        """Lease the tenant's manager, opening it (and migrating its schema) if needed.
+
+        Every acquire must be paired with release(); a leased manager is never
+        closed by eviction.
+        """
+        path = self.db_path(tenant)
+        with self._lock:
+            pm = self._lease(tenant)
+            if pm is not None:
+                return pm
+            opening = self._opening.setdefault(tenant, threading.Lock())
+
+        # Opening can mean running migrations, so only this tenant waits for it
+        with opening:
+            with self._lock:
+                pm = self._lease(tenant)
+                if pm is not None:
+                    return pm
+            try:
+                if not create and not os.path.exists(path):
+                    raise UnknownTenant(f"No tenant named '{tenant}'")
+                pm = TutoringPaymentManager(path, pool_size=self.pool_size, metrics=self.metrics,
+                                            **self.manager_options)
+            except Exception:
+                with self._lock:
+                    self._opening.pop(tenant, None)
+                raise
+            with self._lock:
+                self._open[tenant] = [pm, 1]
+                self._opening.pop(tenant, None)
+                self._stats['opened'] += 1
+                idle = self._evict()
+        for victim in idle:
+            victim.close()
+        return pm
+
+    def release(self, tenant: str):
+        """End a lease taken with acquire()"""
+        with self._lock:
+            entry = self._open.get(tenant)
+            if entry is not None:
+                entry[1] -= 1
+            idle = self._evict()
+        for victim in idle:
+            victim.close()
+
+    def _lease(self, tenant: str) -> Optional[TutoringPaymentManager]:
+        # Caller holds self._lock
+        entry = self._open.get(tenant)
+        if entry is None:
+            return None
+        entry[1] += 1
+        self._open.move_to_end(tenant)
+        self._stats['hits'] += 1
+        return entry[0]
+
+    def _evict(self) -> List[TutoringPaymentManager]:
+        """Unlink least recently used idle managers beyond max_open (caller
+        holds self._lock and closes them after letting go of it)"""
+        idle = []
+        for tenant in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            pm, leases = self._open[tenant]
+            if not leases:
+                del self._open[tenant]
+                idle.append(pm)
+        self._stats['evicted'] += len(idle)
+        return idle
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, open=len(self._open), max_open=self.max_open,
+                        leased=sum(1 for _, leases in self._open.values() if leases))
+
+    def report_all(self, source: str, name: str, params: Dict[str, Any] = None,
+                   tenants: List[str] = None) -> Dict[str, Any]:
+        """Run one report for every tenant (or the given ones) on the process pool.
+
+        source is 'aggregates' (the /api/aggregates reports, from each live
+        database) or 'analytics' (the /api/analytics reports, from each
+        snapshot). Returns {'tenants': {tenant: result}, 'errors': {tenant:
+        message}} plus 'combined' - the results added up - where they can be.
+        """
+        if source not in REPORT_SOURCES:
+            raise LookupError(f"No report source '{source}' (choose from {', '.join(REPORT_SOURCES)})")
+        if name not in REPORT_SOURCES[source]:
+            raise LookupError(f"No {source} report named '{name}' "
+                              f"(choose from {', '.join(REPORT_SOURCES[source])})")
+        # Validate once here rather than failing identically in every worker
+        kwargs = aggregates.parse_params(REPORT_SOURCES[source][name][1], params or {})
+        tenants = [check_tenant_id(t) for t in tenants] if tenants is not None else self.tenants()
+
+        with self._lock:
+            if self._reports is None:
+                # spawn, not fork: this process has writer threads and open SQLite connections
+                self._reports = ProcessPoolExecutor(self.report_workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            reports = self._reports
+        futures = {tenant: reports.submit(tenant_report, self.db_path(tenant), source, name, kwargs)
+                   for tenant in tenants}
+
+        results, errors = {}, {}
+        for tenant, future in futures.items():
+            try:
+                results[tenant] = future.result()
+            except Exception as e:
+                errors[tenant] = f"{type(e).__name__}: {e}"
+        report = {'tenants': results, 'errors': errors}
+        if (source, name) in COMBINABLE:
+            report['combined'] = combine(results.values(), *COMBINABLE[(source, name)])
+        return report
+
+    def close(self):
+        """Close every open manager and stop the report workers"""
+        with self._lock:
+            managers = [pm for pm, _ in self._open.values()]
+            self._open.clear()
+            reports, self._reports = self._reports, None
+        for pm in managers:
+            pm.close()
+        if reports is not None:
+            reports.shutdown()
+
+
+def combine(results, label: Optional[str], columns) -> Dict[str, Any]:
+    """Add up per-tenant results: single rows column by column, column
+    arrays row by row matched on the label column (first-seen label order)"""
+    if label is None:
+        return {column: round(sum(result[column] for result in results), 2) for column in columns}
+    totals: 'OrderedDict[Any, list]' = OrderedDict()
+    for result in results:
+        for row, key in enumerate(result[label]):
+            sums = totals.setdefault(key, [0] * len(columns))
+            for i, column in enumerate(columns):
+                sums[i] += result[column][row]
+    combined = {label: list(totals)}
+    for i, column in enumerate(columns):
+        combined[column] = [round(sums[i], 2) for sums in totals.values()]
+    return combined
+
+
+# Worker side: each report process keeps a few tenants' managers open between tasks
+_worker_managers: 'OrderedDict[str, TutoringPaymentManager]' = OrderedDict()
+WORKER_OPEN_TENANTS = 8
+
+
+def tenant_report(db_path: str, source: str, name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one tenant's report (in a report worker process)"""
+    pm = _worker_managers.pop(db_path, None)
+    if pm is None:
+        if not os.path.exists(db_path):
+            raise UnknownTenant(f"No database at {db_path}")
+        # No result cache: it would never hear about the web process's writes
+        pm = TutoringPaymentManager(db_path, pool_size=1, cache_size=0, instrument=False,
+                                    group_commit=False)
+    _worker_managers[db_path] = pm
+    while len(_worker_managers) > WORKER_OPEN_TENANTS:
+        _worker_managers.popitem(last=False)[1].close()
+
+    method = REPORT_SOURCES[source][name][0]
+    if source == 'analytics':
+        return pm.snapshot_report(method, **kwargs)
+    return getattr(pm, method)(**kwargs)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Manage per-tutor tenant databases")
+    parser.add_argument('--dir', default=os.environ.get('TUTORING_TENANTS_DIR', 'tenants'),
+                        help="folder holding one <tenant>.db per tutor")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list tenants")
+    create_parser = commands.add_parser('create', help="create and migrate a tenant's database")
+    create_parser.add_argument('tenant')
+    report_parser = commands.add_parser('report', help="run a report across every tenant")
+    report_parser.add_argument('source', choices=sorted(REPORT_SOURCES))
+    report_parser.add_argument('name')
+    report_parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                               help="report parameter, e.g. --param months=24")
+    report_parser.add_argument('--workers', type=int, help="report processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    router = TenantRouter(args.dir, report_workers=args.workers if args.command == 'report' else None)
+    try:
+        if args.command == 'list':
+            for tenant in router.tenants():
+                print(tenant)
+        elif args.command == 'create':
+            print(f"Tenant '{args.tenant}' ready at {router.create_tenant(args.tenant)}")
+        else:
+            params = dict(param.split('=', 1) for param in args.param)
+            print(json.dumps(router.report_all(args.source, args.name, params), indent=2, default=str))
+    finally:
+        router.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
 -- Tutoring Payment Tracking Database Schema
 -- SQLite database for tracking student payments and sessions
+-- Safe to re-run against an existing database: every statement is idempotent
+-- Applied as migration 1 (see migrate.py); later schema changes go in migrations/
 
 -- Students table to store basic student information
-CREATE TABLE students (
+CREATE TABLE IF NOT EXISTS students (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     email TEXT UNIQUE NOT NULL,
@@ -16,7 +18,7 @@ CREATE TABLE students (
 );
 
 -- Sessions table to track individual tutoring sessions
-CREATE TABLE sessions (
+CREATE TABLE IF NOT EXISTS sessions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     student_id INTEGER NOT NULL,
     session_date DATE NOT NULL,
@@ -32,7 +34,7 @@ CREATE TABLE sessions (
 );
 
 -- Payments table to track all payments received
-CREATE TABLE payments (
+CREATE TABLE IF NOT EXISTS payments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     student_id INTEGER NOT NULL,
     payment_date DATE NOT NULL,
@@ -45,7 +47,7 @@ CREATE TABLE payments (
 );
 
 -- Monthly packages table for tracking package-based billing
-CREATE TABLE monthly_packages (
+CREATE TABLE IF NOT EXISTS monthly_packages (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     student_id INTEGER NOT NULL,
     package_type TEXT CHECK(package_type IN ('Weekly', 'Intensive')) NOT NULL,
@@ -61,35 +63,275 @@ CREATE TABLE monthly_packages (
     UNIQUE(student_id, month_year)
 );
 
+-- Resume points for bulk imports (rows of the source file already processed)
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    updated_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, table_name)
+);
+
+-- Highest key written by the last incremental export of each table
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    table_name TEXT PRIMARY KEY,
+    last_key INTEGER NOT NULL,
+    exported_date DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
-CREATE INDEX idx_students_email ON students(email);
-CREATE INDEX idx_sessions_student_date ON sessions(student_id, session_date);
-CREATE INDEX idx_payments_student_date ON payments(student_id, payment_date);
-CREATE INDEX idx_monthly_packages_student_month ON monthly_packages(student_id, month_year);
+CREATE INDEX IF NOT EXISTS idx_students_email ON students(email);
+CREATE INDEX IF NOT EXISTS idx_sessions_student_date ON sessions(student_id, session_date);
+CREATE INDEX IF NOT EXISTS idx_payments_student_date ON payments(student_id, payment_date);
+CREATE INDEX IF NOT EXISTS idx_monthly_packages_student_month ON monthly_packages(student_id, month_year);
+-- Keyset pagination walks these newest-first (rowid id is the implicit tie-breaker)
+CREATE INDEX IF NOT EXISTS idx_sessions_date_time ON sessions(session_date, start_time);
+CREATE INDEX IF NOT EXISTS idx_payments_date ON payments(payment_date);
 
--- Insert some sample data for testing
-INSERT INTO students (name, email, parent_email, package_type, hourly_rate) VALUES
+-- Insert some sample data for testing (only into an empty database)
+INSERT INTO students (name, email, parent_email, package_type, hourly_rate)
+SELECT * FROM (VALUES
 ('Alex Johnson', 'alex.johnson@email.com', 'parent.johnson@email.com', 'Weekly', 50.00),
 ('Sarah Chen', 'sarah.chen@email.com', 'chen.family@email.com', 'Individual', 50.00),
-('Mike Rodriguez', 'mike.rodriguez@email.com', 'rodriguez.parents@email.com', 'Intensive', 50.00);
+('Mike Rodriguez', 'mike.rodriguez@email.com', 'rodriguez.parents@email.com', 'Intensive', 50.00))
+WHERE NOT EXISTS (SELECT 1 FROM students);
+
+-- Balance engine: running totals per student, kept current by triggers
+CREATE TABLE IF NOT EXISTS student_balances (
+    student_id INTEGER PRIMARY KEY,
+    total_owed DECIMAL(10,2) NOT NULL DEFAULT 0,
+    total_paid DECIMAL(10,2) NOT NULL DEFAULT 0,
+    updated_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (student_id) REFERENCES students(id)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_student_insert
+AFTER INSERT ON students
+BEGIN
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.id);
+END;
+
+-- Only completed sessions count towards what a student owes
+CREATE TRIGGER IF NOT EXISTS trg_balance_session_insert
+AFTER INSERT ON sessions
+WHEN NEW.status = 'Completed'
+BEGIN
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed + NEW.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_session_update
+AFTER UPDATE OF status, session_cost, student_id ON sessions
+WHEN OLD.status = 'Completed' OR NEW.status = 'Completed'
+BEGIN
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed - OLD.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id AND OLD.status = 'Completed';
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed + NEW.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id AND NEW.status = 'Completed';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_session_delete
+AFTER DELETE ON sessions
+WHEN OLD.status = 'Completed'
+BEGIN
+    UPDATE student_balances
+    SET total_owed = ROUND(total_owed - OLD.session_cost, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_payment_insert
+AFTER INSERT ON payments
+BEGIN
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_paid = ROUND(total_paid + NEW.amount, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_payment_update
+AFTER UPDATE OF amount, student_id ON payments
+BEGIN
+    UPDATE student_balances
+    SET total_paid = ROUND(total_paid - OLD.amount, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id;
+    INSERT OR IGNORE INTO student_balances (student_id) VALUES (NEW.student_id);
+    UPDATE student_balances
+    SET total_paid = ROUND(total_paid + NEW.amount, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = NEW.student_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_balance_payment_delete
+AFTER DELETE ON payments
+BEGIN
+    UPDATE student_balances
+    SET total_paid = ROUND(total_paid - OLD.amount, 2), updated_date = CURRENT_TIMESTAMP
+    WHERE student_id = OLD.student_id;
+END;
+
+-- Backfill balances for students that predate the balance engine
+INSERT OR IGNORE INTO student_balances (student_id, total_owed, total_paid)
+SELECT
+    s.id,
+    ROUND(COALESCE(o.total_owed, 0), 2),
+    ROUND(COALESCE(p.total_paid, 0), 2)
+FROM students s
+LEFT JOIN (
+    SELECT student_id, SUM(session_cost) as total_owed
+    FROM sessions WHERE status = 'Completed' GROUP BY student_id
+) o ON o.student_id = s.id
+LEFT JOIN (
+    SELECT student_id, SUM(amount) as total_paid
+    FROM payments GROUP BY student_id
+) p ON p.student_id = s.id;
+
+-- Monthly rollups: per-month totals keyed on a stored month column, kept current by triggers
+-- payment_method is stored as '' when missing so it can take part in the primary key
+CREATE TABLE IF NOT EXISTS monthly_revenue_rollup (
+    month TEXT PRIMARY KEY, -- Format: "2025-10"
+    sessions_completed INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(10,2) NOT NULL DEFAULT 0,
+    total_hours DECIMAL(10,2) NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS payment_method_rollup (
+    month TEXT NOT NULL, -- Format: "2025-10"
+    payment_method TEXT NOT NULL DEFAULT '',
+    payment_count INTEGER NOT NULL DEFAULT 0,
+    total_received DECIMAL(10,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, payment_method)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_session_insert
+AFTER INSERT ON sessions
+WHEN NEW.status = 'Completed'
+BEGIN
+    INSERT INTO monthly_revenue_rollup (month, sessions_completed, revenue, total_hours)
+    VALUES (strftime('%Y-%m', NEW.session_date), 1, NEW.session_cost, NEW.duration_hours)
+    ON CONFLICT(month) DO UPDATE SET
+        sessions_completed = sessions_completed + 1,
+        revenue = ROUND(revenue + excluded.revenue, 2),
+        total_hours = ROUND(total_hours + excluded.total_hours, 2);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_session_update
+AFTER UPDATE OF status, session_date, session_cost, duration_hours ON sessions
+WHEN OLD.status = 'Completed' OR NEW.status = 'Completed'
+BEGIN
+    UPDATE monthly_revenue_rollup
+    SET sessions_completed = sessions_completed - 1,
+        revenue = ROUND(revenue - OLD.session_cost, 2),
+        total_hours = ROUND(total_hours - OLD.duration_hours, 2)
+    WHERE month = strftime('%Y-%m', OLD.session_date) AND OLD.status = 'Completed';
+    INSERT INTO monthly_revenue_rollup (month, sessions_completed, revenue, total_hours)
+    SELECT strftime('%Y-%m', NEW.session_date), 1, NEW.session_cost, NEW.duration_hours
+    WHERE NEW.status = 'Completed'
+    ON CONFLICT(month) DO UPDATE SET
+        sessions_completed = sessions_completed + 1,
+        revenue = ROUND(revenue + excluded.revenue, 2),
+        total_hours = ROUND(total_hours + excluded.total_hours, 2);
+    DELETE FROM monthly_revenue_rollup
+    WHERE month = strftime('%Y-%m', OLD.session_date) AND sessions_completed <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_session_delete
+AFTER DELETE ON sessions
+WHEN OLD.status = 'Completed'
+BEGIN
+    UPDATE monthly_revenue_rollup
+    SET sessions_completed = sessions_completed - 1,
+        revenue = ROUND(revenue - OLD.session_cost, 2),
+        total_hours = ROUND(total_hours - OLD.duration_hours, 2)
+    WHERE month = strftime('%Y-%m', OLD.session_date);
+    DELETE FROM monthly_revenue_rollup
+    WHERE month = strftime('%Y-%m', OLD.session_date) AND sessions_completed <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_payment_insert
+AFTER INSERT ON payments
+BEGIN
+    INSERT INTO payment_method_rollup (month, payment_method, payment_count, total_received)
+    VALUES (strftime('%Y-%m', NEW.payment_date), COALESCE(NEW.payment_method, ''), 1, NEW.amount)
+    ON CONFLICT(month, payment_method) DO UPDATE SET
+        payment_count = payment_count + 1,
+        total_received = ROUND(total_received + excluded.total_received, 2);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_payment_update
+AFTER UPDATE OF payment_date, amount, payment_method ON payments
+BEGIN
+    UPDATE payment_method_rollup
+    SET payment_count = payment_count - 1,
+        total_received = ROUND(total_received - OLD.amount, 2)
+    WHERE month = strftime('%Y-%m', OLD.payment_date)
+      AND payment_method = COALESCE(OLD.payment_method, '');
+    INSERT INTO payment_method_rollup (month, payment_method, payment_count, total_received)
+    VALUES (strftime('%Y-%m', NEW.payment_date), COALESCE(NEW.payment_method, ''), 1, NEW.amount)
+    ON CONFLICT(month, payment_method) DO UPDATE SET
+        payment_count = payment_count + 1,
+        total_received = ROUND(total_received + excluded.total_received, 2);
+    DELETE FROM payment_method_rollup
+    WHERE month = strftime('%Y-%m', OLD.payment_date)
+      AND payment_method = COALESCE(OLD.payment_method, '')
+      AND payment_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_payment_delete
+AFTER DELETE ON payments
+BEGIN
+    UPDATE payment_method_rollup
+    SET payment_count = payment_count - 1,
+        total_received = ROUND(total_received - OLD.amount, 2)
+    WHERE month = strftime('%Y-%m', OLD.payment_date)
+      AND payment_method = COALESCE(OLD.payment_method, '');
+    DELETE FROM payment_method_rollup
+    WHERE month = strftime('%Y-%m', OLD.payment_date)
+      AND payment_method = COALESCE(OLD.payment_method, '')
+      AND payment_count <= 0;
+END;
+
+-- Backfill rollups for history that predates them
+INSERT OR IGNORE INTO monthly_revenue_rollup (month, sessions_completed, revenue, total_hours)
+SELECT strftime('%Y-%m', session_date), COUNT(*), ROUND(SUM(session_cost), 2), ROUND(SUM(duration_hours), 2)
+FROM sessions
+WHERE status = 'Completed'
+GROUP BY strftime('%Y-%m', session_date);
+
+INSERT OR IGNORE INTO payment_method_rollup (month, payment_method, payment_count, total_received)
+SELECT strftime('%Y-%m', payment_date), COALESCE(payment_method, ''), COUNT(*), ROUND(SUM(amount), 2)
+FROM payments
+GROUP BY strftime('%Y-%m', payment_date), COALESCE(payment_method, '');
 
 -- Views for common queries
 -- Outstanding balance view
+-- Sessions and payments are aggregated separately before joining, so a student's
+-- totals aren't multiplied by the number of rows on the other side
+DROP VIEW IF EXISTS student_balance;
 CREATE VIEW student_balance AS
 SELECT 
     s.id,
     s.name,
     s.email,
-    COALESCE(SUM(sess.session_cost), 0) as total_owed,
-    COALESCE(SUM(p.amount), 0) as total_paid,
-    (COALESCE(SUM(sess.session_cost), 0) - COALESCE(SUM(p.amount), 0)) as balance_due
+    COALESCE(o.total_owed, 0) as total_owed,
+    COALESCE(p.total_paid, 0) as total_paid,
+    (COALESCE(o.total_owed, 0) - COALESCE(p.total_paid, 0)) as balance_due
 FROM students s
-LEFT JOIN sessions sess ON s.id = sess.student_id AND sess.status = 'Completed'
-LEFT JOIN payments p ON s.id = p.student_id
-WHERE s.is_active = 1
-GROUP BY s.id, s.name, s.email;
+LEFT JOIN (
+    SELECT student_id, SUM(session_cost) as total_owed
+    FROM sessions WHERE status = 'Completed' GROUP BY student_id
+) o ON o.student_id = s.id
+LEFT JOIN (
+    SELECT student_id, SUM(amount) as total_paid
+    FROM payments GROUP BY student_id
+) p ON p.student_id = s.id
+WHERE s.is_active = 1;
 
--- Monthly revenue view
+-- Monthly revenue view (computed from the ledger; reports read monthly_revenue_rollup)
+DROP VIEW IF EXISTS monthly_revenue;
 CREATE VIEW monthly_revenue AS
 SELECT 
     strftime('%Y-%m', session_date) as month,
@@ -101,7 +343,8 @@ WHERE status = 'Completed'
 GROUP BY strftime('%Y-%m', session_date)
 ORDER BY month DESC;
 
--- Payment summary view
+-- Payment summary view (computed from the ledger; reports read payment_method_rollup)
+DROP VIEW IF EXISTS payment_summary;
 CREATE VIEW payment_summary AS
 SELECT 
     strftime('%Y-%m', payment_date) as month,
@@ -0,0 +1,135 @@
+"""
+Single-writer queue with group commit for the tutoring payment manager
+Write operations from any thread are handed to one writer thread, which runs
+whatever queued up while the previous batch was committing (up to max_batch,
+optionally lingering max_delay seconds for more) in a single transaction.
+Each caller's future resolves only after that transaction commits.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Any
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 100,
+                 max_delay: float = 0.0):
+        """Create a queue; connect() opens the writer's dedicated connection"""
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'operations': 0,
+            'failed': 0,
+            'batches': 0,
+            'largest_batch': 0,
+            'commit_time': 0.0,
+        }
+
+    def submit(self, op: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Queue op(conn) for the writer; the future holds its return value or exception.
+
+        op must not commit or roll back itself - it runs inside a savepoint, so
+        a failing op is undone without affecting the rest of its batch.
+        """
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+            self._queue.put((op, future))
+        return future
+
+    def execute(self, op: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Submit op and wait for it to be committed"""
+        return self.submit(op).result()
+
+    def close(self):
+        """Commit everything queued so far, then stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            if thread is not None and thread.is_alive():
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of writer counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._queue.qsize()
+        stats['mean_batch'] = stats['operations'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    try:
+                        remaining = deadline - time.monotonic()
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list):
+        """Run a batch in one transaction, isolating each op in a savepoint"""
+        outcomes = {}
+        started = time.perf_counter()
+        try:
+            # Take the write lock up front so the batch can't deadlock halfway
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    outcomes[future] = (op(conn), None)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    outcomes[future] = (None, e)
+                conn.execute("RELEASE write_op")
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT itself failed: nothing in the batch was written
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = {future: (None, e) for _, future in batch
+                        if future.running() or future.set_running_or_notify_cancel()}
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['operations'] += len(outcomes)
+            self._stats['failed'] += sum(1 for _, error in outcomes.values() if error is not None)
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+            self._stats['commit_time'] += time.perf_counter() - started
+
+        # Results are only released once the whole batch is durable
+        for future, (result, error) in outcomes.items():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)